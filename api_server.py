@@ -0,0 +1,262 @@
+# api_server.py
+# API HTTP/JSON local para que las máquinas conectadas registren el uso sin
+# pasar por la interfaz. Solo biblioteca estándar y sin Tkinter: se arranca
+# con "python cli.py serve". Todo el estado vive en memoria en un Fleet; las
+# escrituras las agrupa el PersistenceWorker.
+#
+#   GET  /machines                 listado de máquinas
+#   GET  /due?days=N&limit=M       tareas vencidas o próximas
+#   GET  /alerts                   tareas que han vencido desde que arrancó el servidor
+#   GET  /report?table=T           informe (monthly, liters u overdue) en JSON
+#   POST /usage                    {"machine_id" o "machine", "task_id", "liters"} o una lista de ellos
+#   POST /maintenance              {"machine_id" o "machine", "task_id"}
+import asyncio
+import json
+import math
+import signal
+import sys
+from urllib.parse import urlsplit, parse_qs
+
+from config import API_HOST, API_PORT, SYNC_INTERVAL_MS
+from due_alerts import DueAlertScheduler
+from reports import FleetReport, TABLES
+from persistence_worker import PersistenceWorker
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error"
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.alerts = None  # DueAlertScheduler, creado con el bucle de asyncio (ver _serve)
+        self.report = None  # FleetReport, creado en la primera consulta y mantenido al día desde entonces
+        self.routes = {
+            ("GET", "/machines"): self.list_machines,
+            ("GET", "/due"): self.due,
+            ("GET", "/alerts"): self.list_alerts,
+            ("GET", "/report"): self.report_table,
+            ("POST", "/usage"): self.register_usage,
+            ("POST", "/maintenance"): self.register_maintenance
+        }
+
+    # --- Endpoints ---
+
+    def list_machines(self, query, body):
+        rows = []
+        for key in self.fleet:
+            name, machine_type, start_date = self.fleet.summary(key)
+            rows.append({"id": key, "name": name, "machine_type": machine_type,
+                         "start_date": start_date, "site": self.fleet.site(key)})
+        return rows
+
+    def due(self, query, body):
+        return self.fleet.due_tasks(_int_param(query, "days"), _int_param(query, "limit"))
+
+    def list_alerts(self, query, body):
+        return self.alerts.alerts() if self.alerts is not None else []
+
+    def report_table(self, query, body):
+        table = query.get("table", ["monthly"])[0]
+        if table not in TABLES:
+            raise ApiError(400, f"Informe desconocido: {table}. Válidos: {', '.join(TABLES)}.")
+        if self.report is None:
+            self.report = FleetReport(self.fleet)
+        return self.report.table(table)
+
+    def register_usage(self, query, body):
+        items = body if isinstance(body, list) else [body]
+        # Se valida todo antes de aplicar nada: el lote entra completo o no entra.
+        resolved = []
+        for item in items:
+            key, task = self._task(item)
+            try:
+                liters = float(item.get("liters"))
+            except (TypeError, ValueError):
+                raise ApiError(400, "La cantidad debe ser un número.")
+            if not math.isfinite(liters) or liters < 0:
+                raise ApiError(400, "Cantidad no válida")
+            if not task.has_usage:
+                raise ApiError(400, "La tarea no usa contador")
+            resolved.append((key, task.task_id, liters))
+        self.fleet.bulk_register_usage(resolved)
+        results = [
+            {"machine_id": key, "task_id": task_id,
+             "usage_count": self.fleet[key].maintenance_tasks[task_id].usage_count}
+            for key, task_id, _ in resolved
+        ]
+        return results if isinstance(body, list) else results[0]
+
+    def register_maintenance(self, query, body):
+        key, task = self._task(body)
+        self.fleet.register_maintenance(key, task.task_id)
+        return {"machine_id": key, "task_id": task.task_id, "last_date": task.last_date}
+
+    # --- Resolución ---
+
+    def _task(self, item):
+        if not isinstance(item, dict):
+            raise ApiError(400, "Se esperaba un objeto JSON.")
+        key = self._machine(item)
+        task = self.fleet[key].maintenance_tasks.get(item.get("task_id"))
+        if task is None:
+            raise ApiError(404, "Tarea de mantenimiento no encontrada.")
+        return key, task
+
+    def _machine(self, item):
+        key = item.get("machine_id")
+        if key is None:
+            keys = self.fleet.keys_by_name(item.get("machine"))
+            if len(keys) > 1:
+                raise ApiError(409, f"Hay {len(keys)} máquinas con ese nombre: use machine_id.")
+            key = keys[0] if keys else None
+        if not isinstance(key, str) or key not in self.fleet:
+            raise ApiError(404, "Máquina no encontrada.")
+        return key
+
+    # --- HTTP ---
+
+    def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                raise ApiError(405, "Método no permitido.")
+            raise ApiError(404, "Ruta no encontrada.")
+        if method == "POST":
+            try:
+                body = json.loads(body)
+            except ValueError:
+                raise ApiError(400, "JSON no válido.")
+        return handler(parse_qs(url.query), body)
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 mínimo con keep-alive: un generador de carga reutiliza la
+        # conexión en lugar de abrir una por petición.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Petición no válida."}, True)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    if len(headers) >= MAX_HEADERS:
+                        raise ConnectionError
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                close = connection == "close" or (version == "HTTP/1.0" and connection != "keep-alive")
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "Petición demasiado grande."}, True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = 200, self.dispatch(method, target, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                await self._respond(writer, status, payload, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, close):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n")
+        if close:
+            head += "Connection: close\r\n"
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+
+    async def sync_loop(self):
+        # Cambios de otras estaciones y errores del hilo de escritura.
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL_MS / 1000)
+            try:
+                self.fleet.sync()
+            except OSError as e:
+                print(f"No se pudieron leer cambios de otras estaciones: {e}", file=sys.stderr)
+            for error in self.fleet.writer.pop_errors():
+                print(f"Error al guardar: {error}", file=sys.stderr)
+
+
+async def _serve(api, host, port):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C llega como KeyboardInterrupt.
+    # El temporizador de los avisos corre en el mismo bucle que las peticiones.
+    api.alerts = DueAlertScheduler(api.fleet, loop.call_later, lambda handle: handle.cancel(),
+                                   on_change=_print_alerts)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    print(f"API escuchando en http://{host}:{port}", file=sys.stderr)
+    sync_task = asyncio.create_task(api.sync_loop())
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        sync_task.cancel()
+        api.alerts.stop()
+
+
+def _print_alerts(new):
+    for alert in new:
+        print(f"Aviso: {alert['machine']} - {alert['task']} ({alert['status']})", file=sys.stderr)
+
+
+def serve(fleet, host=API_HOST, port=API_PORT):
+    fleet.writer = PersistenceWorker()
+    fleet.history.reserve_ids()
+    api = ApiServer(fleet)
+    try:
+        asyncio.run(_serve(api, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Antes de salir se escribe todo lo pendiente.
+        ok = fleet.writer.stop(timeout=30)
+        fleet.history.close()
+    return 0 if ok else 1
+
+
+def _int_param(query, name):
+    try:
+        return int(query.get(name, ["0"])[0])
+    except ValueError:
+        raise ApiError(400, f"El parámetro {name} debe ser un número entero.")
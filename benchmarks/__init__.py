@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# Medición del rendimiento con flotas sintéticas. Uso: python -m benchmarks.run --help
@@ -0,0 +1,53 @@
+# benchmarks/fleet_generator.py
+import random
+from datetime import date, timedelta
+from config import MACHINE_TYPES
+from machine import Machine
+from maintenance_task import MaintenanceTask
+
+CUSTOM_TASKS = [
+    ("gaskets", "Cambio de juntas", False, 180, None),
+    ("water_test", "Análisis del agua", False, 60, None),
+    ("pump", "Revisión de la bomba", True, 365, 2000),
+    ("burrs", "Cambio de muelas", True, 730, 1500)
+]
+
+
+def generate_records(count, seed=0, custom_ratio=0.2, today=None):
+    # Registros de máquinas en el formato del backend. La mayoría son de los
+    # tipos de MACHINE_TYPES con sus tareas por defecto; una parte
+    # (custom_ratio) son personalizadas o llevan tareas propias. Con la misma
+    # semilla se obtiene siempre la misma flota.
+    rng = random.Random(seed)
+    today = today or date.today()
+    types = list(MACHINE_TYPES)
+    records = []
+    for i in range(count):
+        start = today - timedelta(days=rng.randint(30, 1500))
+        if rng.random() < custom_ratio:
+            machine_type = "custom" if rng.random() < 0.5 else rng.choice(types)
+            tasks = rng.sample(CUSTOM_TASKS, rng.randint(1, len(CUSTOM_TASKS)))
+        else:
+            machine_type = rng.choice(types)
+            tasks = []
+        machine = Machine(f"Máquina {i:06d}", machine_type, start.isoformat(), machine_id=f"{rng.getrandbits(128):032x}")
+        for task_id, name, has_usage, threshold_days, threshold_usage in tasks:
+            machine.add_maintenance_task(MaintenanceTask(task_id, name, has_usage, threshold_days, threshold_usage))
+        for task in machine.maintenance_tasks.values():
+            if rng.random() < 0.8:
+                task.last_date = (start + timedelta(days=rng.randint(0, (today - start).days))).isoformat()
+            if task.has_usage:
+                task.usage_count = round(rng.uniform(0, (task.threshold_usage or 100) * 1.2), 1)
+        records.append(machine.to_dict())
+    return records
+
+
+def usage_items(records, seed=0):
+    # Un registro de uso por máquina con tarea de contador: (clave, task_id, litros).
+    rng = random.Random(seed)
+    items = []
+    for record in records:
+        usage_tasks = [task_id for task_id, task in record["maintenance_tasks"].items() if "usage_count" in task]
+        if usage_tasks:
+            items.append((record["id"], rng.choice(usage_tasks), round(rng.uniform(0.1, 5), 2)))
+    return items
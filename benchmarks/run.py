@@ -0,0 +1,301 @@
+# benchmarks/run.py
+# Uso:
+#   python -m benchmarks.run --sizes 100 1000 10000 100000 -o resultados.json
+#   python -m benchmarks.run --compare resultados.json
+# Con --compare el código de salida es 1 si alguna medida empeora más de --threshold.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from config import DUE_SOON_DAYS, MACHINE_TYPES
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from machine_search import MachineSearch, STATUS_OVERDUE
+from reports import FleetReport
+from sharded_backend import ShardedBackend
+from usage_history import UsageHistory
+from benchmarks.fleet_generator import generate_records, usage_items
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+# Máquinas cuyo detalle se abre en cada repetición de tk_show_machine_details.
+DETAIL_SAMPLES = 20
+# Búsquedas de search_keystrokes: lo que se va escribiendo en el buscador.
+SEARCH_KEYSTROKES = ["m", "ma", "maq", "maqu", "maqui", "maquin", "maquina", "maquina 0", "maquina 00",
+                     "maquina 001", "maquina 0012", "0012"]
+# Sedes entre las que se reparten las máquinas en las medidas del backend "sharded".
+SHARD_SITES = 4
+
+
+def measure(run, setup=None, repeat=3, calls=1):
+    # Tiempo de `run` (sin contar `setup`) en segundos, dividido entre `calls`.
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(arg)
+        times.append((time.perf_counter() - start) / calls)
+    return _summary(times)
+
+
+def _summary(times):
+    return {"min": min(times), "median": statistics.median(times), "repeat": len(times)}
+
+
+def data_benchmarks(records, backend, tmp, seed):
+    # (nombre, setup, run) de las medidas de la capa de datos y del modelo.
+    items = usage_items(records, seed)
+    history_path = os.path.join(tmp, "history.bin")
+    binary = JsonBackend(os.path.join(tmp, "data.bin"), os.path.join(tmp, "data.bin.journal"),
+                         snapshot_format="binary")
+    binary.save_data({"machines": records})
+
+    def new_fleet(_=None):
+        return Fleet(records, history=UsageHistory(history_path))
+
+    def built_search():
+        search = MachineSearch(new_fleet())
+        search.search("")
+        return search
+
+    def sharded(parallel):
+        return ShardedBackend(os.path.join(tmp, "sharded.manifest.json"), os.path.join(tmp, "sharded.json"),
+                              os.path.join(tmp, "sharded.journal"),
+                              parallel_min_bytes=0 if parallel else float("inf"))
+
+    site_records = [dict(record, site=f"Sede {i % SHARD_SITES}") for i, record in enumerate(records)]
+    sharded(False).save_data({"machines": site_records})
+    changed_site = site_records[:1]
+
+    def sharded_one_change():
+        # Un cambio en una sola sede: al compactar solo se reescribe esa.
+        backend = sharded(False)
+        data = backend.load_data()
+        backend.record_events([{"op": "remove_machine", "machine_id": changed_site[0]["id"]}])
+        backend.record_events([{"op": "add_machine", "machine": changed_site[0]}])
+        return backend, data
+
+    # Tarea con contador del primer tipo: su nuevo threshold se aplica a todo el tipo.
+    propagated_type, propagated_task, propagated_fields = next(
+        (machine_type, task_id, {"threshold_usage": task["threshold_usage"] * 2})
+        for machine_type, type_config in MACHINE_TYPES.items()
+        for task_id, task in type_config.get("maintenance", {}).items() if task.get("has_usage")
+    )
+
+    def fresh_fleet():
+        # Cada repetición parte del mismo snapshot y sin journal.
+        backend.save_data({"machines": records})
+        return new_fleet()
+
+    return [
+        ("load_data", None, lambda _: backend.load_data()),
+        ("save_data", None, lambda _: backend.save_data({"machines": records})),
+        ("load_data_binary", None, lambda _: binary.load_data()),
+        ("save_data_binary", None, lambda _: binary.save_data({"machines": records})),
+        ("load_data_sharded", None, lambda _: sharded(False).load_data()),
+        ("load_data_sharded_parallel", None, lambda _: sharded(True).load_data()),
+        ("compact_sharded_one_site", sharded_one_change, lambda args: args[0].compact(args[1], 0)),
+        ("machine_from_dict", None, lambda _: [Machine.from_dict(r) for r in records]),
+        ("machine_to_dict", lambda: [Machine.from_dict(r) for r in records],
+         lambda machines: [m.to_dict() for m in machines]),
+        ("fleet_build_due_index", None, new_fleet),
+        ("due_tasks", new_fleet, lambda fleet: fleet.due_tasks(DUE_SOON_DAYS)),
+        ("search_build", new_fleet, lambda fleet: MachineSearch(fleet).search("")),
+        ("search_keystrokes", built_search,
+         lambda search: [search.search(text) for text in SEARCH_KEYSTROKES]),
+        ("search_filters", built_search,
+         lambda search: search.search("1", "grinder", STATUS_OVERDUE)),
+        ("bulk_register_usage", fresh_fleet, lambda fleet: fleet.bulk_register_usage(items)),
+        ("bulk_register_maintenance", fresh_fleet,
+         lambda fleet: fleet.bulk_register_maintenance((key, task_id) for key, task_id, _ in items)),
+        ("propagate_task_definition", fresh_fleet,
+         lambda fleet: fleet.propagate_task_definition(propagated_type, propagated_task, propagated_fields)),
+        # Con el historial que han dejado las medidas anteriores.
+        ("report_build", new_fleet, FleetReport),
+        ("report_monthly", lambda: FleetReport(new_fleet()), lambda report: report.monthly()),
+    ]
+
+
+def tk_benchmarks(repeat):
+    # Medidas de la interfaz sobre los datos del backend actual. Devuelve None
+    # si no hay Tk utilizable (sin pantalla: ejecutar con xvfb-run).
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception:
+        return None
+    try:
+        from maintenance_app import MaintenanceApp
+    except ImportError:
+        root.destroy()
+        return None
+
+    def wait_loaded(app, window):
+        # La flota se carga en segundo plano: se atienden eventos hasta que termina.
+        while not app.loaded:
+            window.update()
+            time.sleep(0.005)
+
+    def startup():
+        # Segundos hasta que la ventana responde y hasta que el listado está completo.
+        window = tk.Tk()
+        started = None
+        try:
+            start = time.perf_counter()
+            started = MaintenanceApp(window)
+            window.update()
+            interactive = time.perf_counter() - start
+            wait_loaded(started, window)
+            started.finish_tree_fill()
+            window.update_idletasks()
+            return interactive, time.perf_counter() - start
+        finally:
+            if started is not None and started.loaded:
+                started.machines.writer.stop()
+            window.destroy()
+
+    results = {}
+    samples = [startup() for _ in range(repeat)]
+    results["tk_startup_interactive"] = _summary([interactive for interactive, _ in samples])
+    results["tk_startup_ready"] = _summary([ready for _, ready in samples])
+    app = MaintenanceApp(root)
+    try:
+        root.update()
+        wait_loaded(app, root)
+
+        def reset_tree():
+            app.tree_loaded = False
+
+        def refresh(_):
+            app.refresh_machine_list()
+            app.finish_tree_fill()
+            root.update_idletasks()
+
+        step = max(1, len(app.machines) // DETAIL_SAMPLES)
+        sample = app.machines.keys()[::step][:DETAIL_SAMPLES]
+
+        def show_details(_):
+            for key in sample:
+                app.show_machine_details(key)
+                root.update_idletasks()
+
+        results["tk_refresh_machine_list"] = measure(refresh, reset_tree, repeat)
+        if sample:
+            results["tk_show_machine_details"] = measure(show_details, None, repeat, calls=len(sample))
+    finally:
+        app.machines.writer.stop()
+        root.destroy()
+    return results
+
+
+def run_benchmarks(sizes, repeat=3, seed=0, with_tk=True, log=None):
+    results = {}
+    previous_backend = DataManager.backend
+    try:
+        for size in sizes:
+            records = generate_records(size, seed)
+            with tempfile.TemporaryDirectory() as tmp:
+                backend = JsonBackend(os.path.join(tmp, "data.json"), os.path.join(tmp, "data.journal"))
+                DataManager.backend = backend
+                backend.save_data({"machines": records})
+                for name, setup, run in data_benchmarks(records, backend, tmp, seed):
+                    results.setdefault(name, {})[str(size)] = measure(run, setup, repeat)
+                    if log:
+                        log(name, size, results[name][str(size)])
+                if with_tk:
+                    backend.save_data({"machines": records})
+                    tk_results = tk_benchmarks(repeat)
+                    if tk_results is None:
+                        with_tk = False
+                        if log:
+                            print("Tk no disponible: se omiten las medidas de la interfaz.", file=sys.stderr)
+                    else:
+                        for name, timing in tk_results.items():
+                            results.setdefault(name, {})[str(size)] = timing
+                            if log:
+                                log(name, size, timing)
+    finally:
+        DataManager.backend = previous_backend
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": _numpy_version(),
+            "sizes": sizes,
+            "repeat": repeat,
+            "seed": seed
+        },
+        "results": results
+    }
+
+
+def compare(current, baseline, threshold, min_delta=0.0):
+    # Lista de (medida, tamaño, tiempo base, tiempo actual, cociente, empeora).
+    # Diferencias por debajo de min_delta segundos se consideran ruido.
+    rows = []
+    for name, by_size in current["results"].items():
+        for size, timing in by_size.items():
+            base = baseline.get("results", {}).get(name, {}).get(size)
+            if base is None or base["min"] <= 0:
+                continue
+            ratio = timing["min"] / base["min"]
+            worse = ratio > threshold and timing["min"] - base["min"] > min_delta
+            rows.append((name, size, base["min"], timing["min"], ratio, worse))
+    return rows
+
+
+def _numpy_version():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy.__version__
+
+
+def _print_timing(name, size, timing):
+    print(f"{name:26} {size:>7}  min {timing['min'] * 1000:10.2f} ms  mediana {timing['median'] * 1000:10.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run",
+                                     description="Mide la aplicación con flotas sintéticas.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="número de máquinas")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tk", action="store_true", help="omitir las medidas de la interfaz")
+    parser.add_argument("-o", "--output", help="guardar los resultados en JSON")
+    parser.add_argument("--compare", help="resultados de referencia (JSON) con los que comparar")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="cociente actual/referencia a partir del cual se considera que empeora")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="diferencia mínima en ms para considerar que empeora (evita ruido)")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.sizes, args.repeat, args.seed, not args.no_tk, log=_print_timing)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=4)
+
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold, args.min_delta_ms / 1000)
+    print()
+    for name, size, base, value, ratio, worse in rows:
+        mark = "  <-- EMPEORA" if worse else ""
+        print(f"{name:26} {size:>7}  {base * 1000:10.2f} -> {value * 1000:10.2f} ms  x{ratio:5.2f}{mark}")
+    regressions = sum(1 for row in rows if row[5])
+    print(f"\n{regressions} medidas empeoran más de x{args.threshold}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# cli.py
+# Punto de entrada sin interfaz gráfica para scripts y tareas programadas.
+# No importa tkinter ni Pillow; los módulos de cada subcomando se cargan solo
+# cuando se usan. Uso: python cli.py --help
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import sys
+
+
+def find_machine(fleet, name):
+    keys = fleet.keys_by_name(name)
+    if not keys:
+        raise SystemExit(f"Error: máquina no encontrada: {name}")
+    if len(keys) > 1:
+        raise SystemExit(f"Error: hay {len(keys)} máquinas con el nombre {name}")
+    return keys[0]
+
+
+def cmd_due(fleet, args):
+    rows = fleet.due_tasks(args.days, args.limit)
+
+    if args.json:
+        import json
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for row in rows:
+            print(f"{row['due_date'] or '-':10}  {row['status']:13}  {row['machine']}  {row['task']}")
+    return 1 if rows and args.fail_if_due else 0
+
+
+def cmd_forecast(fleet, args):
+    from forecast import Forecaster
+
+    forecaster = Forecaster(fleet)
+    entries = forecaster.forecast(args.days)
+    if args.limit:
+        entries = entries[:args.limit]
+    rows = [
+        {
+            "machine": fleet.summary(machine_key)[0],
+            "task_id": task_id,
+            "task": fleet.task_name(machine_key, task_id),
+            "predicted_date": predicted.isoformat()
+        }
+        for predicted, machine_key, task_id in entries
+    ]
+
+    if args.json:
+        import json
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for row in rows:
+            print(f"{row['predicted_date']}  {row['machine']}  {row['task']}")
+    return 0
+
+
+def cmd_register_usage(fleet, args):
+    # Mismas comprobaciones que la API (ApiServer.register_usage).
+    import math
+    key = find_machine(fleet, args.machine)
+    task = fleet.task_record(key, args.task_id)
+    if task is None:
+        raise SystemExit("Error: Tarea de mantenimiento no encontrada.")
+    try:
+        liters = float(args.liters)
+    except ValueError:
+        raise SystemExit("Error: La cantidad debe ser un número.")
+    if not math.isfinite(liters) or liters < 0:
+        raise SystemExit("Error: Cantidad no válida")
+    if not task.get("has_usage"):
+        raise SystemExit("Error: La tarea no usa contador")
+    fleet.register_usage(key, args.task_id, liters)
+    print(f"Se han registrado {liters} litros en {args.machine} ({args.task_id}).")
+    return 0
+
+
+def cmd_register_maintenance(fleet, args):
+    key = find_machine(fleet, args.machine)
+    try:
+        fleet.register_maintenance(key, args.task_id)
+    except KeyError as e:
+        raise SystemExit(f"Error: {e.args[0]}")
+    print(f"Mantenimiento registrado en {args.machine} ({args.task_id}).")
+    return 0
+
+
+def cmd_import(fleet, args):
+    from usage_import import import_usage
+
+    report = import_usage(fleet, args.file)
+    print(report.summary())
+    if report.error is not None:
+        return 1
+    return 0 if report.rejected == 0 else 3
+
+
+def cmd_export(fleet, args):
+    import json
+    from data_manager import changes_since
+
+    since = None
+    if args.since:
+        # Se sigue desde donde llegó la exportación anterior.
+        try:
+            with open(args.since) as f:
+                since = json.load(f)["versions"]
+        except (OSError, ValueError, KeyError):
+            raise SystemExit(f"Error: {args.since} no es una exportación válida")
+    data = changes_since(fleet.to_data(), since)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4)
+    else:
+        json.dump(data, sys.stdout, ensure_ascii=False, indent=4)
+        print()
+    return 0
+
+
+def cmd_report(fleet, args):
+    from reports import FleetReport, TABLES, write_csv, write_json
+
+    rows = FleetReport(fleet).table(args.table)
+    f = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        if args.json:
+            write_json(rows, f)
+        else:
+            write_csv(rows, TABLES[args.table], f)
+    finally:
+        if args.output:
+            f.close()
+    return 0
+
+
+def cmd_serve(fleet, args):
+    from api_server import serve
+
+    return serve(fleet, args.host, args.port)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Gestión de mantenimientos sin interfaz gráfica.")
+    parser.add_argument("--timing", action="store_true", help="muestra en stderr el tiempo de arranque y total")
+    parser.add_argument("--stats", metavar="FICHERO",
+                        help="mide las operaciones de datos y guarda las estadísticas en FICHERO (JSON) al terminar")
+    parser.add_argument("--site", action="append", metavar="SEDE",
+                        help="abrir solo los datos de esta sede (repetible; requiere el backend 'sharded')")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("due", help="tareas vencidas o próximas a vencer")
+    p.add_argument("--days", type=int, default=0, help="incluir las que vencen en los próximos N días")
+    p.add_argument("--limit", type=int, default=0, help="máximo de filas (0 = todas)")
+    p.add_argument("--json", action="store_true", help="salida en JSON")
+    p.add_argument("--fail-if-due", action="store_true", help="código de salida 1 si hay tareas")
+    p.set_defaults(func=cmd_due)
+
+    p = sub.add_parser("forecast", help="fecha prevista de cada tarea según el ritmo de uso")
+    p.add_argument("--days", type=int, default=None, help="solo las previstas en los próximos N días")
+    p.add_argument("--limit", type=int, default=0, help="máximo de filas (0 = todas)")
+    p.add_argument("--json", action="store_true", help="salida en JSON")
+    p.set_defaults(func=cmd_forecast)
+
+    p = sub.add_parser("register-usage", help="registrar litros en una tarea")
+    p.add_argument("machine", help="nombre de la máquina")
+    p.add_argument("task_id")
+    p.add_argument("liters")
+    p.set_defaults(func=cmd_register_usage)
+
+    p = sub.add_parser("register-maintenance", help="registrar un mantenimiento")
+    p.add_argument("machine", help="nombre de la máquina")
+    p.add_argument("task_id")
+    p.set_defaults(func=cmd_register_maintenance)
+
+    p = sub.add_parser("import", help="importar uso desde CSV/JSONL")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="exportar todos los datos en JSON")
+    p.add_argument("-o", "--output", help="fichero de salida (por defecto, stdout)")
+    p.add_argument("--since", metavar="EXPORTACION",
+                   help="solo lo cambiado desde una exportación anterior (su fichero JSON)")
+    p.set_defaults(func=cmd_export)
+
+    from config import API_HOST, API_PORT
+    p = sub.add_parser("report", help="informes de uso, mantenimientos y vencidas en CSV o JSON")
+    p.add_argument("table", nargs="?", default="monthly", choices=["monthly", "liters", "overdue"],
+                   help="monthly: litros y mantenimientos por tipo, tarea y mes; liters: litros por tipo y mes; "
+                        "overdue: proporción de tareas vencidas por tipo y tarea")
+    p.add_argument("--json", action="store_true", help="salida en JSON (por defecto, CSV)")
+    p.add_argument("-o", "--output", help="fichero de salida (por defecto, stdout)")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("serve", help="API HTTP/JSON local para registrar uso desde las máquinas")
+    p.add_argument("--host", default=API_HOST)
+    p.add_argument("--port", type=int, default=API_PORT)
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.stats:
+        # Antes de importar los módulos instrumentados.
+        import instrumentation
+        instrumentation.enable(args.stats)
+
+    from data_manager import DataManager
+    from fleet import Fleet
+
+    if args.site:
+        try:
+            DataManager.open_sites(args.site)
+        except ValueError as e:
+            raise SystemExit(f"Error: {e.args[0]}")
+    fleet = Fleet.load()
+    loaded = time.perf_counter()
+    status = args.func(fleet, args)
+    if args.timing:
+        print(f"Arranque y carga: {(loaded - _START) * 1000:.1f} ms | "
+              f"total: {(time.perf_counter() - _START) * 1000:.1f} ms", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
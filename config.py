@@ -1,7 +1,76 @@
 # config.py
 
 DATA_FILE = 'machines_data.json'
+JOURNAL_FILE = 'machines_data.journal'
+SQLITE_FILE = 'machines_data.db'
+# Historial de uso y mantenimientos por tarea (binario, solo se añade al final).
+HISTORY_FILE = 'machines_history.bin'
 
+# Backend de almacenamiento: "json" (DATA_FILE + journal), "sqlite" (SQLITE_FILE)
+# o "sharded" (un par de ficheros como los de "json" por sede, ver sharded_backend.py).
+# Para pasar de JSON a SQLite: python sqlite_backend.py
+STORAGE_BACKEND = 'json'
+
+# Con el backend "sharded": índice de las sedes y sus ficheros. Las máquinas sin
+# sede siguen en DATA_FILE y JOURNAL_FILE, así que los datos existentes valen tal cual.
+SHARD_MANIFEST = 'machines_data.manifest.json'
+# Sedes que abre esta estación (None: todas). La primera es la de las máquinas
+# que se añadan desde aquí. También: python cli.py --site SEDE ...
+STATION_SITES = None
+# Con varias sedes y al menos estos bytes en total, se leen en paralelo en
+# SHARD_LOAD_WORKERS procesos (None: uno por CPU).
+SHARD_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+SHARD_LOAD_WORKERS = None
+
+# Modo journal: cada cambio se añade como un registro al JOURNAL_FILE en lugar
+# de reescribir DATA_FILE completo. El journal se compacta en un nuevo snapshot
+# cuando supera JOURNAL_MAX_BYTES.
+JOURNAL_ENABLED = True
+JOURNAL_MAX_BYTES = 1024 * 1024
+
+# Formato del snapshot de DATA_FILE con el backend JSON: "json" (legible) o
+# "binary" (compacto y más rápido de cargar en flotas grandes). Al cargar se
+# reconoce cualquiera de los dos; el cambio se aplica en la siguiente escritura.
+# Para obtener siempre JSON: python cli.py export
+SNAPSHOT_FORMAT = 'json'
+
+# Espera del hilo de escritura para agrupar ráfagas de cambios en una sola escritura.
+SAVE_COALESCE_SECONDS = 0.2
+
+# Varias estaciones pueden compartir los datos (p. ej. en una unidad de red):
+# cada escritura se hace con el fichero .lock de los datos bloqueado y antes se
+# incorporan los cambios que hayan añadido las demás. Requiere JOURNAL_ENABLED.
+LOCK_TIMEOUT_SECONDS = 10
+# Cada cuánto la aplicación busca cambios de otras estaciones.
+SYNC_INTERVAL_MS = 1000
+
+# API HTTP/JSON local para registrar uso desde máquinas conectadas (cli.py serve).
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+
+# Días de antelación con que una tarea aparece como próxima a vencer.
+DUE_SOON_DAYS = 7
+
+# A partir de este número de máquinas el listado se muestra por páginas.
+TREE_PAGE_SIZE = 1000
+# Filas que se insertan en el listado de una vez; entre tramo y tramo la
+# ventana atiende los eventos.
+TREE_CHUNK_SIZE = 200
+# Espera tras la última pulsación antes de filtrar el listado con la búsqueda.
+SEARCH_DEBOUNCE_MS = 200
+
+# Días de historial con los que se estima el ritmo de uso (litros/día).
+FORECAST_WINDOW_DAYS = 30
+
+# Medición de tiempos de la capa de datos y del modelo (ver instrumentation.py).
+# También se activa con la variable de entorno COFFEE_INSTRUMENT=1. Al salir,
+# las estadísticas se guardan en INSTRUMENTATION_FILE.
+INSTRUMENTATION_ENABLED = False
+INSTRUMENTATION_FILE = 'instrumentation.json'
+
+# Tareas predeterminadas de cada tipo. Sirven de plantilla: los datos guardados
+# solo llevan lo que cada máquina cambió, así que modificar aquí un valor lo
+# cambia en todas las máquinas del tipo que no lo hayan personalizado.
 MACHINE_TYPES = {
     "coffee_machine": {
         "display_name": "Cafetera",
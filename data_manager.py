@@ -1,18 +1,496 @@
 # data_manager.py
+import copy
 import json
 import os
-from config import DATA_FILE
+import threading
+import config
+from config import DATA_FILE, JOURNAL_FILE, JOURNAL_MAX_BYTES, JOURNAL_ENABLED, SNAPSHOT_FORMAT
+from file_lock import FileLock, file_stamp
+from instrumentation import timed, add_bytes
+from machine import new_machine_id
+from maintenance_task import compact_task, expand_task, task_field
+import snapshot_format
+
+class StorageBackend:
+    # Interfaz común de los backends de almacenamiento.
+    def load_data(self):
+        raise NotImplementedError
+
+    def save_data(self, data):
+        # Guarda el estado completo de la flota.
+        raise NotImplementedError
+
+    def record_event(self, event):
+        # Persiste un único cambio (ver apply_event para las operaciones).
+        raise NotImplementedError
+
+    def record_events(self, events):
+        # Persiste varios cambios como un único lote. Los backends que numeran
+        # los cambios dejan el número en event["seq"]: es la versión del
+        # registro que cambia (ver apply_event y changes_since).
+        for event in events:
+            self.record_event(event)
+
+    def needs_full_save(self):
+        # Indica si tras record_event hace falta reescribir el estado completo.
+        return False
+
+    def compact(self, data, synced):
+        # Reescribe el estado completo siempre que `data` incluya ya los `synced`
+        # cambios ajenos entregados por poll_changes. Devuelve si se escribió.
+        self.save_data(data)
+        return True
+
+    def poll_changes(self):
+        # Cambios escritos por otras estaciones desde la última llamada, como
+        # [(cambios propios ya escritos antes que ellos, "events" o "reload",
+        # lista de eventos o datos completos)], y el total de cambios propios
+        # escritos desde load_data (None si el backend no lo sabe).
+        return [], None
+
+    def default_site(self):
+        # Sede de las máquinas nuevas de esta estación (None: sin sede).
+        return None
+
+
+class JsonBackend(StorageBackend):
+    # Snapshot en DATA_FILE (JSON o binario, ver snapshot_format.py) más un
+    # journal de cambios en JSON en JOURNAL_FILE.
+    # Varias estaciones pueden compartirlos: toda escritura se hace con el
+    # fichero .lock bloqueado y, antes de añadir al journal, se leen los
+    # registros que hayan escrito las demás (se entregan con poll_changes).
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, journal_enabled=JOURNAL_ENABLED,
+                 snapshot_format=SNAPSHOT_FORMAT):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.journal_enabled = journal_enabled
+        self.snapshot_format = snapshot_format
+        # Número de secuencia del último registro escrito o aplicado del journal.
+        self.journal_seq = 0
+        self._file_lock = FileLock(data_file + '.lock')
+        # Lo usan el hilo de Tk (poll_changes) y el de escritura.
+        self._lock = threading.Lock()
+        self._journal_offset = 0  # bytes del journal ya leídos
+        self._snapshot_stamp = None  # firma de DATA_FILE al leerlo o escribirlo
+        self._appended = 0  # cambios propios escritos desde load_data
+        self._remote_count = 0  # cambios ajenos leídos desde load_data
+        self._incoming = []
+
+    def load_data(self):
+        with self._lock, self._file_lock:
+            # El estado real es el snapshot más los cambios pendientes del journal.
+            data = self._read_snapshot()
+            index = machine_index(data)
+            for event in self._read_journal():
+                apply_event(data, event, index)
+            self._appended = 0
+            self._remote_count = 0
+            self._incoming = []
+            if assign_machine_ids(data):
+                # Datos anteriores a los ids persistentes: se fijan una sola vez,
+                # con el bloqueo, para que todas las estaciones vean los mismos.
+                self._write_snapshot(data)
+        return data
+
+    def save_data(self, data):
+        with self._lock, self._file_lock:
+            self._write_snapshot(data)
+
+    def compact(self, data, synced):
+        with self._lock, self._file_lock:
+            self._catch_up()
+            if self._remote_count != synced:
+                # Otra estación escribió cambios que `data` aún no incluye.
+                return False
+            self._write_snapshot(data)
+            return True
+
+    def record_event(self, event):
+        self.record_events([event])
+
+    def record_events(self, events):
+        if self.journal_enabled:
+            with self._lock, self._file_lock:
+                self._catch_up()
+                self.append_events(events)
+
+    def needs_full_save(self):
+        if not self.journal_enabled:
+            return True
+        return os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > JOURNAL_MAX_BYTES
+
+    def poll_changes(self):
+        with self._lock:
+            # Sin cambios en disco no hace falta bloquear el fichero.
+            journal_size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+            if file_stamp(self.data_file) != self._snapshot_stamp or journal_size != self._journal_offset:
+                with self._file_lock:
+                    self._catch_up()
+            incoming, self._incoming = self._incoming, []
+            return incoming, self._appended
+
+    def take_incoming(self):
+        # Cambios ajenos ya leídos (p. ej. al escribir) sin volver a mirar el disco.
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+            return incoming
+
+    def remote_count(self):
+        return self._remote_count
+
+    def read_state(self):
+        # Hasta dónde se leyeron los ficheros en load_data, para continuar en
+        # otro objeto (ver sharded_backend.py, que carga en otros procesos).
+        return self.journal_seq, self._journal_offset, self._snapshot_stamp
+
+    def restore_read_state(self, state):
+        self.journal_seq, self._journal_offset, self._snapshot_stamp = state
+        self._appended = 0
+        self._remote_count = 0
+        self._incoming = []
+
+    def append_events(self, events):
+        # Añade los registros al journal con una sola escritura: el coste no
+        # depende del tamaño de la flota. Se llama con el bloqueo adquirido.
+        lines = []
+        for event in events:
+            self.journal_seq += 1
+            event["seq"] = self.journal_seq
+            lines.append(json.dumps(event, separators=(',', ':')) + '\n')
+        chunk = ''.join(lines).encode('utf-8')
+        with open(self.journal_file, 'ab') as f:
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        add_bytes(written=len(chunk))
+        self._journal_offset += len(chunk)
+        self._appended += len(events)
+
+    def replay_journal(self, data):
+        self._journal_offset = 0
+        index = machine_index(data)
+        for event in self._read_journal():
+            apply_event(data, event, index)
+
+    def _catch_up(self):
+        # Lee lo que otras estaciones hayan escrito desde la última vez. Se llama
+        # con el bloqueo adquirido, así que nadie está escribiendo a la vez.
+        events = None
+        if file_stamp(self.data_file) == self._snapshot_stamp:
+            events = self._read_journal(check_gap=True)
+        if events is None:
+            # Otra estación compactó el journal en un snapshot nuevo: se recarga entero.
+            data = self._read_snapshot()
+            self.replay_journal(data)
+            self._incoming.append((self._appended, "reload", data))
+            self._remote_count += 1
+        elif events:
+            self._incoming.append((self._appended, "events", events))
+            self._remote_count += len(events)
+
+    def _read_snapshot(self):
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'rb') as f:
+                raw = f.read()
+            add_bytes(read=len(raw))
+            data = snapshot_format.loads(raw)
+        else:
+            data = {"machines": []}
+        self._snapshot_stamp = file_stamp(self.data_file)
+        self.journal_seq = data.pop("journal_seq", 0)
+        self._journal_offset = 0
+        return data
+
+    def _read_journal(self, check_gap=False):
+        # Registros nuevos desde _journal_offset. Con check_gap devuelve None si
+        # el journal no continúa donde se dejó (lo compactó otra estación).
+        if not os.path.exists(self.journal_file):
+            return None if check_gap and self._journal_offset else []
+        events = []
+        with open(self.journal_file, 'r+b') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self._journal_offset:
+                return None if check_gap else []
+            f.seek(self._journal_offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Línea incompleta por un corte durante la escritura: se descarta.
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                self._journal_offset += len(line)
+                add_bytes(read=len(line))
+                seq = record["seq"]
+                if seq <= self.journal_seq:
+                    continue  # Ya incluido en el snapshot.
+                if check_gap and seq != self.journal_seq + 1:
+                    return None
+                events.append(record)
+                self.journal_seq = seq
+            if self._journal_offset < size:
+                # Con el bloqueo adquirido, un final incompleto solo puede ser de una
+                # escritura que se cortó: se elimina antes de añadir nada detrás.
+                f.truncate(self._journal_offset)
+        return events
+
+    def _write_snapshot(self, data):
+        # Se escribe en un temporal y se renombra: un fallo a mitad de escritura
+        # nunca deja el fichero de datos corrupto.
+        raw = snapshot_format.dumps(dict(data, journal_seq=self.journal_seq), self.snapshot_format)
+        tmp_file = self.data_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        add_bytes(written=len(raw))
+        os.replace(tmp_file, self.data_file)
+        self._snapshot_stamp = file_stamp(self.data_file)
+        # El snapshot ya contiene todos los cambios del journal. Si se corta justo
+        # aquí, los registros con seq <= journal_seq se ignoran al reproducirlo.
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._journal_offset = 0
+
+
+def assign_machine_ids(data):
+    # Da id a las máquinas guardadas antes de que existieran. Devuelve si cambió algo.
+    changed = False
+    for machine in data.get("machines", []):
+        if not machine.get("id"):
+            machine["id"] = new_machine_id()
+            changed = True
+    return changed
+
+
+def machine_index(data):
+    # id -> registro, para aplicar muchos eventos sin recorrer la lista cada vez.
+    return {machine["id"]: machine for machine in data.get("machines", []) if machine.get("id")}
+
+
+def apply_event(data, event, index=None):
+    # Aplica un cambio del journal sobre los datos en formato diccionario. Los
+    # eventos se refieren a la máquina por su id (machine_id); los journals
+    # antiguos, por su posición (machine_idx). Un cambio sobre una máquina o
+    # tarea que ya no existe (la eliminó otra estación) se ignora.
+    machines = data.setdefault("machines", [])
+    if index is None:
+        index = machine_index(data)
+    op = event["op"]
+    # Número del cambio en el journal, si ya está escrito: pasa a ser la
+    # versión de la máquina, o de su marca de borrado si se elimina.
+    version = event.get("seq")
+    if op == "add_machine":
+        machine = copy.deepcopy(event["machine"])
+        if version is not None:
+            machine["version"] = version
+        machines.append(machine)
+        if machine.get("id"):
+            index[machine["id"]] = machine
+        return
+    if "machine_idx" in event:
+        position = event["machine_idx"]
+        machine = machines[position]
+    else:
+        machine = index.get(event["machine_id"])
+        if machine is None:
+            return
+        position = None
+    if op == "remove_machine":
+        if position is None:
+            position = next(i for i, m in enumerate(machines) if m is machine)
+        del machines[position]
+        index.pop(machine.get("id"), None)
+        if version is not None and machine.get("id"):
+            data.setdefault("removed", []).append(tombstone(machine["id"], version, machine.get("site")))
+        return
+    if version is not None:
+        # Cuenta como cambio aunque la tarea ya no exista.
+        machine["version"] = version
+    if op == "update_machine":
+        updated = copy.deepcopy(event["machine"])
+        # Es un cambio de definición: el uso y la fecha del último mantenimiento
+        # de las tareas que siguen igual se conservan (pueden haber cambiado
+        # desde otra estación).
+        old_tasks = machine.get("maintenance_tasks", {})
+        old_type, new_type = machine.get("machine_type"), updated.get("machine_type")
+        for task_id, task in updated.get("maintenance_tasks", {}).items():
+            old = old_tasks.get(task_id)
+            if old is None:
+                continue
+            old_usage = task_field(old_type, task_id, old, "has_usage")
+            if bool(old_usage) == bool(task_field(new_type, task_id, task, "has_usage")):
+                for field in ("last_date", "usage_count", "history_id"):
+                    if field in old:
+                        task[field] = old[field]
+        if version is not None:
+            updated["version"] = version
+        machine.clear()
+        machine.update(updated)
+    elif op == "usage":
+        task = machine.get("maintenance_tasks", {}).get(event["task_id"])
+        if task is None:
+            return
+        if event.get("history_id") is not None:
+            task["history_id"] = event["history_id"]
+        if task_field(machine.get("machine_type"), event["task_id"], task, "has_usage"):
+            task["usage_count"] = (task.get("usage_count") or 0) + event["quantity"]
+    elif op == "maintenance":
+        task = machine.get("maintenance_tasks", {}).get(event["task_id"])
+        if task is None:
+            return
+        if event.get("history_id") is not None:
+            task["history_id"] = event["history_id"]
+        task["last_date"] = event["date"]
+        if task_field(machine.get("machine_type"), event["task_id"], task, "has_usage"):
+            task["usage_count"] = 0
+    elif op == "task_definition":
+        # Nueva definición (campos de TaskTemplate) de una tarea; el estado se
+        # conserva salvo el uso, que deja de contarse si la tarea ya no lo tiene.
+        tasks = machine.get("maintenance_tasks", {})
+        task = tasks.get(event["task_id"])
+        if task is None:
+            return
+        machine_type = machine.get("machine_type")
+        task = dict(expand_task(machine_type, event["task_id"], task))
+        task.update(event["fields"])
+        if not task.get("has_usage"):
+            task["threshold_usage"] = None
+            task.pop("usage_count", None)
+        elif task.get("usage_count") is None:
+            task["usage_count"] = 0
+        tasks[event["task_id"]] = compact_task(machine_type, event["task_id"], task)
+    else:
+        raise ValueError(f"Operación de journal desconocida: {op}")
+
+
+def tombstone(key, version, site=None):
+    # Marca de una máquina eliminada en data["removed"], para que las
+    # exportaciones de cambios (changes_since) informen del borrado.
+    entry = {"id": key, "version": version}
+    if site is not None:
+        entry["site"] = site
+    return entry
+
+
+def with_versions(data, events, sites):
+    # `data` ya incluye el efecto de `events`, pero se construyó antes de
+    # escribirlos y le faltan las versiones que les dio el backend
+    # (event["seq"]). Devuelve una copia con ellas sin tocar los registros,
+    # que pueden estar compartidos con la flota. sites: sede de las máquinas
+    # afectadas, para las marcas de borrado.
+    if not events:
+        return data
+    machines = list(data.get("machines", []))
+    position = {record["id"]: i for i, record in enumerate(machines)}
+    removed = list(data.get("removed", []))
+    gone = {entry["id"] for entry in removed}
+    for event in events:
+        version = event.get("seq")
+        if version is None:
+            continue
+        key = event["machine"]["id"] if event["op"] == "add_machine" else event["machine_id"]
+        if event["op"] == "remove_machine":
+            # Si ya tiene marca, la eliminó antes otro cambio.
+            if key not in gone and key not in position:
+                removed.append(tombstone(key, version, sites.get(key)))
+                gone.add(key)
+        elif key in position and machines[position[key]].get("version", 0) < version:
+            machines[position[key]] = dict(machines[position[key]], version=version)
+    return dict(data, machines=machines, removed=removed)
+
+
+def changes_since(data, since=None):
+    # Exportación de cambios: las máquinas con versión posterior a la de
+    # `since` y los ids de las eliminadas desde entonces, más las versiones
+    # hasta las que llega, que se pasan como `since` en la siguiente. Sin
+    # since, todas las máquinas. Las versiones se llevan por sede, porque con
+    # el backend "sharded" cada sede numera sus cambios por separado:
+    #   [{"site": None, "version": 1200}, {"site": "Madrid", "version": 85}]
+    previous = {entry["site"]: entry["version"] for entry in since or ()}
+    latest = dict(previous)
+    machines = []
+    for record in data.get("machines", []):
+        site, version = record.get("site"), record.get("version", 0)
+        if version > latest.get(site, 0):
+            latest[site] = version
+        if since is None or version > previous.get(site, 0):
+            machines.append(record)
+    removed = []
+    for entry in data.get("removed", []):
+        site, version = entry.get("site"), entry["version"]
+        if version > latest.get(site, 0):
+            latest[site] = version
+        if since is not None and version > previous.get(site, 0):
+            removed.append(entry["id"])
+    changes = {
+        "machines": machines,
+        "versions": [{"site": site, "version": version} for site, version in latest.items()]
+    }
+    if since is not None:
+        changes["removed"] = removed
+    return changes
+
 
 class DataManager:
+    backend = None
+
     @staticmethod
+    def get_backend():
+        if DataManager.backend is None:
+            if config.STORAGE_BACKEND == "sqlite":
+                from sqlite_backend import SQLiteBackend
+                DataManager.backend = SQLiteBackend()
+            elif config.STORAGE_BACKEND == "sharded":
+                from sharded_backend import ShardedBackend
+                DataManager.backend = ShardedBackend()
+            else:
+                DataManager.backend = JsonBackend()
+        return DataManager.backend
+
+    @staticmethod
+    def open_sites(sites):
+        # Abre solo los ficheros de esas sedes (None: todos). Debe llamarse
+        # antes de cargar los datos y requiere el backend "sharded".
+        if config.STORAGE_BACKEND != "sharded":
+            raise ValueError("Las sedes solo se pueden elegir con STORAGE_BACKEND = 'sharded'.")
+        from sharded_backend import ShardedBackend
+        DataManager.backend = ShardedBackend(sites=sites)
+
+    @staticmethod
+    def default_site():
+        return DataManager.get_backend().default_site()
+
+    @staticmethod
+    @timed("DataManager.load_data")
     def load_data():
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                return json.load(f)
-        else:
-            return {"machines": []}
+        return DataManager.get_backend().load_data()
 
     @staticmethod
+    @timed("DataManager.save_data")
     def save_data(data):
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
+        DataManager.get_backend().save_data(data)
+
+    @staticmethod
+    def record_event(event):
+        DataManager.get_backend().record_event(event)
+
+    @staticmethod
+    @timed("DataManager.record_events")
+    def record_events(events):
+        DataManager.get_backend().record_events(events)
+
+    @staticmethod
+    def needs_full_save():
+        return DataManager.get_backend().needs_full_save()
+
+    @staticmethod
+    @timed("DataManager.compact")
+    def compact(data, synced):
+        return DataManager.get_backend().compact(data, synced)
+
+    @staticmethod
+    @timed("DataManager.poll_changes")
+    def poll_changes():
+        return DataManager.get_backend().poll_changes()
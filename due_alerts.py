@@ -0,0 +1,162 @@
+# due_alerts.py
+from datetime import date, datetime, time
+from due_index import is_due
+
+# Espera máxima de cada temporizador: con plazos lejanos se vuelve a mirar de
+# vez en cuando, por si cambió la hora del sistema o el equipo estuvo suspendido.
+MAX_WAIT_SECONDS = 3600
+# Motivo del aviso, con los mismos valores que "status" en Fleet.due_tasks.
+STATUS_OVERDUE = "vencida"
+STATUS_USAGE = "uso_alcanzado"
+
+
+class DueAlertScheduler:
+    # Avisa cuando una tarea pasa a estar vencida, por fecha o por uso, sin
+    # recorrer la flota. El índice de vencimientos ya tiene las tareas
+    # ordenadas por fecha límite, así que basta un solo temporizador armado
+    # para la más próxima: al saltar se toman del índice las que vencen ese día
+    # y se arma el siguiente. Los registros de uso y mantenimiento llegan por
+    # los avisos de la flota y solo se revisan las tareas afectadas.
+    #
+    # call_later(segundos, función) arma el temporizador y devuelve lo que se
+    # pasa a cancel: root.after en la interfaz, loop.call_later en la API. La
+    # función se ejecuta en el mismo hilo que modifica la flota.
+    def __init__(self, fleet, call_later, cancel, on_change=None):
+        self.fleet = fleet
+        self._call_later = call_later
+        self._cancel = cancel
+        # on_change(nuevos) tras añadir o quitar avisos; nuevos: los añadidos.
+        self.on_change = on_change
+        self._alerts = {}  # (clave, task_id) -> aviso, en orden de llegada
+        self._due = {}  # clave -> task_ids que ya están vencidas
+        self._day = date.today()  # último día revisado
+        self._timer = None
+        self._timer_deadline = None  # ordinal para el que está armado
+        # Lo que ya está vencido al empezar no avisa: para eso está la lista de vencimientos.
+        self._rebuild(alert=False)
+        fleet.add_listener(self.on_fleet_change)
+        self._arm()
+
+    def alerts(self):
+        # Avisos pendientes, del más antiguo al más reciente.
+        return list(self._alerts.values())
+
+    def dismiss(self, key, task_id):
+        # La tarea no vuelve a avisar hasta que se atienda y venza de nuevo.
+        if self._alerts.pop((key, task_id), None) is not None:
+            self._changed([])
+
+    def clear(self):
+        if self._alerts:
+            self._alerts.clear()
+            self._changed([])
+
+    def stop(self):
+        if self._timer is not None:
+            self._cancel(self._timer)
+            self._timer = None
+
+    def on_fleet_change(self, op, key, machine=None, task_id=None):
+        new = []
+        removed = False
+        if op == "reset":
+            removed = self._rebuild(alert=True, new=new)
+        elif op == "remove":
+            for task_id in self._due.pop(key, ()):
+                removed = self._alerts.pop((key, task_id), None) is not None or removed
+        else:
+            task_ids = [task_id] if op == "task" else set(machine.maintenance_tasks) | self._due.get(key, set())
+            self._catch_up(new)
+            for task_id in task_ids:
+                removed = self._check(key, task_id, new) or removed
+        if new or removed:
+            self._changed(new)
+
+    # --- Temporizador ---
+
+    def _arm(self):
+        self.stop()
+        deadline = self.fleet.due_index.next_deadline(self._day)
+        self._timer_deadline = deadline
+        if deadline is None:
+            return
+        # Vence al empezar el día de la fecha límite.
+        wait = (datetime.combine(date.fromordinal(deadline), time()) - datetime.now()).total_seconds()
+        self._timer = self._call_later(min(max(wait, 0), MAX_WAIT_SECONDS), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        new = []
+        self._catch_up(new)
+        self._arm()
+        if new:
+            self._changed(new)
+
+    def _catch_up(self, new):
+        # Tareas cuyo plazo venció desde el último día revisado.
+        today = date.today()
+        if today <= self._day:
+            return
+        for usage_pending, deadline, key, task_id in self.fleet.due_index.reached_between(self._day, today):
+            self._mark_due(key, task_id, (usage_pending, deadline), new)
+        self._day = today
+
+    # --- Estado de cada tarea ---
+
+    def _check(self, key, task_id, new):
+        # Revisa una tarea que acaba de cambiar. Devuelve True si se quitó su aviso.
+        entry = self.fleet.due_index.entry(key, task_id)
+        if entry is not None and is_due(entry, self._day):
+            self._mark_due(key, task_id, entry, new)
+            return False
+        if entry is not None and (self._timer_deadline is None or entry[1] < self._timer_deadline):
+            self._arm()
+        tasks = self._due.get(key)
+        if tasks is None or task_id not in tasks:
+            return False
+        tasks.discard(task_id)
+        if not tasks:
+            del self._due[key]
+        return self._alerts.pop((key, task_id), None) is not None
+
+    def _mark_due(self, key, task_id, entry, new):
+        tasks = self._due.setdefault(key, set())
+        if task_id in tasks:
+            return
+        tasks.add(task_id)
+        alert = self._alert(key, task_id, entry)
+        self._alerts[(key, task_id)] = alert
+        new.append(alert)
+
+    def _rebuild(self, alert, new=None):
+        # Tras recargar la flota: avisa de las tareas que han pasado a estar
+        # vencidas y quita los avisos de las que ya no lo están. Devuelve True
+        # si se quitó alguno.
+        self._day = date.today()
+        previous = self._due
+        self._due = {}
+        for usage_pending, deadline, key, task_id in self.fleet.due_index.due_within(0, self._day):
+            self._due.setdefault(key, set()).add(task_id)
+            if alert and task_id not in previous.get(key, ()):
+                self._alerts[(key, task_id)] = self._alert(key, task_id, (usage_pending, deadline))
+                new.append(self._alerts[(key, task_id)])
+        stale = [pair for pair in self._alerts if pair[1] not in self._due.get(pair[0], ())]
+        for pair in stale:
+            del self._alerts[pair]
+        if alert:
+            self._arm()
+        return bool(stale)
+
+    def _alert(self, key, task_id, entry):
+        return {
+            "machine_id": key,
+            "machine": self.fleet.summary(key)[0],
+            "task_id": task_id,
+            "task": self.fleet.task_name(key, task_id),
+            "status": STATUS_USAGE if entry[0] == 0 else STATUS_OVERDUE,
+            "time": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def _changed(self, new):
+        if self.on_change is not None:
+            self.on_change(new)
@@ -0,0 +1,90 @@
+# due_index.py
+import bisect
+from datetime import date
+from maintenance_task import NO_DEADLINE
+
+def is_due(entry, today=None):
+    # Si la tarea de una entrada del índice ya está vencida, por uso o por fecha.
+    today = today or date.today()
+    return entry[0] == 0 or entry[1] <= today.toordinal()
+
+
+class DueIndex:
+    # Índice ordenado de tareas por próximo vencimiento.
+    # Cada entrada es (uso_pendiente, ordinal_fecha_límite, machine_key, task_id),
+    # de modo que las tareas más vencidas quedan al principio de la lista.
+    def __init__(self):
+        self._entries = []
+        self._by_task = {}
+        self._tasks_by_machine = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bulk_load(self, items):
+        # Carga inicial: una sola ordenación en lugar de una inserción por tarea.
+        for machine_key, task_id, due_point in items:
+            entry = (due_point[0], due_point[1], machine_key, task_id)
+            self._entries.append(entry)
+            self._by_task[(machine_key, task_id)] = entry
+            self._tasks_by_machine.setdefault(machine_key, set()).add(task_id)
+        self._entries.sort()
+
+    def update(self, machine_key, task_id, due_point):
+        entry = (due_point[0], due_point[1], machine_key, task_id)
+        old = self._by_task.get((machine_key, task_id))
+        if old == entry:
+            return
+        if old is not None:
+            self._discard(old)
+        bisect.insort(self._entries, entry)
+        self._by_task[(machine_key, task_id)] = entry
+        self._tasks_by_machine.setdefault(machine_key, set()).add(task_id)
+
+    def remove(self, machine_key, task_id):
+        entry = self._by_task.pop((machine_key, task_id), None)
+        if entry is not None:
+            self._discard(entry)
+            self._tasks_by_machine[machine_key].discard(task_id)
+
+    def remove_machine(self, machine_key):
+        for task_id in self._tasks_by_machine.pop(machine_key, ()):
+            self._discard(self._by_task.pop((machine_key, task_id)))
+
+    def entry(self, machine_key, task_id):
+        # Entrada actual de la tarea, o None si no está en el índice.
+        return self._by_task.get((machine_key, task_id))
+
+    def next_deadline(self, today=None):
+        # Primera fecha límite posterior a hoy (ordinal) de las tareas que no
+        # han alcanzado el uso, o None si ninguna tiene plazo.
+        today = today or date.today()
+        idx = bisect.bisect_left(self._entries, (1, today.toordinal() + 1))
+        if idx == len(self._entries) or self._entries[idx][1] == NO_DEADLINE:
+            return None
+        return self._entries[idx][1]
+
+    def reached_between(self, start, end):
+        # Tareas cuya fecha límite cae después de `start` y como tarde `end`
+        # (fechas), sin contar las que ya habían alcanzado el uso.
+        lo = bisect.bisect_left(self._entries, (1, start.toordinal() + 1))
+        hi = bisect.bisect_left(self._entries, (1, end.toordinal() + 1))
+        return self._entries[lo:hi]
+
+    def most_overdue(self, n, today=None):
+        # Las n tareas más vencidas (solo las que ya vencieron).
+        end = self._due_end(today)
+        return self._entries[:min(n, end)]
+
+    def due_within(self, days, today=None):
+        # Todas las tareas vencidas o que vencen en los próximos `days` días.
+        today = today or date.today()
+        return self._entries[:self._due_end(today, days)]
+
+    def _due_end(self, today=None, days=0):
+        today = today or date.today()
+        return bisect.bisect_left(self._entries, (1, today.toordinal() + days + 1))
+
+    def _discard(self, entry):
+        idx = bisect.bisect_left(self._entries, entry)
+        del self._entries[idx]
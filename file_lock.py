@@ -0,0 +1,71 @@
+# file_lock.py
+import os
+import threading
+import time
+from config import LOCK_TIMEOUT_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    # Bloqueo exclusivo entre procesos sobre un fichero auxiliar. El fichero se
+    # abre una vez y se reutiliza; entre hilos del mismo proceso excluye el
+    # lock interno, porque el bloqueo del sistema es por descriptor.
+    def __init__(self, path, timeout=LOCK_TIMEOUT_SECONDS):
+        self.path = path
+        self.timeout = timeout
+        self._file = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No se pudo bloquear {self.path}.")
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a+b')
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"No se pudo bloquear {self.path}: otra estación lo tiene ocupado.")
+                    time.sleep(0.01)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def file_stamp(path):
+    # Firma barata para detectar que otro proceso reescribió el fichero.
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
@@ -0,0 +1,606 @@
+# fleet.py
+import copy
+import math
+from collections import deque
+from datetime import date
+from data_manager import DataManager, apply_event, tombstone, with_versions
+from due_index import DueIndex
+from instrumentation import timed
+from machine import Machine, new_machine_id
+from maintenance_task import TaskTemplate, compute_due_point, NO_DEADLINE, expand_task, task_field
+from registry import MachineRegistry
+from usage_history import UsageHistory, KIND_USAGE, KIND_MAINTENANCE, history_rows
+
+class Fleet:
+    # Colección de máquinas que guarda los registros tal como vienen del backend
+    # y solo construye el objeto Machine cuando se necesita. Todos los cambios
+    # pasan por aquí para persistirlos y mantener el índice de vencimientos.
+    # Las máquinas se identifican por su id persistente (la clave), nunca por
+    # su posición, que cambia al borrar.
+    def __init__(self, records=None, history=None, removed=None):
+        self._registry = MachineRegistry(_with_ids(records or []))
+        # Marcas de las máquinas eliminadas (id -> {"id", "version", "site"}),
+        # que se guardan con los datos para las exportaciones de cambios.
+        self._removed = {entry["id"]: entry for entry in removed or ()}
+        # Cambios pendientes de aplicar en las vistas: (op, clave) con op en
+        # "insert", "update", "delete" o "reset" (clave None: todo cambió).
+        self._changes = []
+        self.history = history if history is not None else UsageHistory()
+        # Estructuras derivadas (previsiones, alertas...) que siguen los cambios:
+        # listener(op, key, machine, task_id) con op "machine", "task", "remove"
+        # o "reset" (se recargó toda la flota).
+        self._listeners = []
+        # Escritor en segundo plano (PersistenceWorker); sin él se escribe en el acto.
+        self.writer = None
+        # Para incorporar cambios de otras estaciones (ver sync): cambios propios
+        # que el backend aún no ha confirmado como escritos, en orden, y el estado
+        # de cada máquina afectada antes de ellos (None si aún no existía).
+        self._submitted = 0
+        self._unconfirmed = deque()  # (número de cambio, evento)
+        self._pending_by_key = {}
+        self._bases = {}
+        self._remote_applied = 0
+        self.due_index = DueIndex()
+        self.due_index.bulk_load(
+            item for key in self._registry for item in self._record_due_points(key, self._registry.record(key))
+        )
+
+    @classmethod
+    def load(cls):
+        data = DataManager.load_data()
+        return cls(data.get("machines", []), removed=data.get("removed"))
+
+    def __len__(self):
+        return len(self._registry)
+
+    def __contains__(self, key):
+        return key in self._registry
+
+    def __iter__(self):
+        # Claves de todas las máquinas, en orden de alta.
+        return iter(self._registry)
+
+    def __getitem__(self, key):
+        machine = self._registry.machine(key)
+        if machine is None:
+            machine = Machine.from_dict(self._registry.record(key))
+            self._registry.set_machine(key, machine)
+        return machine
+
+    def is_loaded(self, key):
+        return self._registry.machine(key) is not None
+
+    def keys(self, start=0, stop=None):
+        return self._registry.keys(start, stop)
+
+    def position(self, key):
+        return self._registry.position(key)
+
+    def keys_by_name(self, name):
+        return self._registry.by_name(name)
+
+    def keys_by_type(self, machine_type):
+        return self._registry.by_type(machine_type)
+
+    def machine_types(self):
+        # Tipos con al menos una máquina.
+        return self._registry.types()
+
+    def names(self):
+        return self._registry.names()
+
+    def site(self, key):
+        return self._registry.site(key)
+
+    def keys_by_site(self, site):
+        return self._registry.by_site(site)
+
+    def default_site(self):
+        # Sede de las máquinas que se añadan desde esta estación.
+        return DataManager.default_site()
+
+    def summary(self, key):
+        # Datos para el listado sin hidratar la máquina: (nombre, tipo, inicio).
+        return self._registry.summary(key)
+
+    def task_record(self, key, task_id):
+        # Datos completos de la tarea en formato diccionario, sin hidratar la máquina.
+        machine = self._registry.machine(key)
+        if machine is not None:
+            task = machine.maintenance_tasks.get(task_id)
+            return task.to_dict(full=True) if task is not None else None
+        record = self._registry.record(key)
+        task = record.get("maintenance_tasks", {}).get(task_id)
+        return expand_task(record.get("machine_type"), task_id, task) if task is not None else None
+
+    def task_ids(self, key):
+        machine = self._registry.machine(key)
+        if machine is not None:
+            return list(machine.maintenance_tasks)
+        return list(self._registry.record(key).get("maintenance_tasks", {}))
+
+    def task_name(self, key, task_id):
+        machine = self._registry.machine(key)
+        if machine is not None:
+            return machine.maintenance_tasks[task_id].name
+        record = self._registry.record(key)
+        return task_field(record.get("machine_type"), task_id, record["maintenance_tasks"][task_id], "name")
+
+    def record_of(self, key):
+        # Copia del estado de la máquina en formato diccionario.
+        machine = self._registry.machine(key)
+        if machine is not None:
+            return machine.to_dict()
+        return copy.deepcopy(self._registry.record(key))
+
+    def due_tasks(self, days=0, limit=0):
+        # Tareas vencidas o que vencen en `days` días, como diccionarios listos
+        # para mostrar o devolver en JSON.
+        today = date.today()
+        entries = self.due_index.due_within(days, today)
+        if limit:
+            entries = entries[:limit]
+        rows = []
+        for usage_pending, deadline, machine_key, task_id in entries:
+            if usage_pending == 0:
+                status = "uso_alcanzado"
+            elif deadline <= today.toordinal():
+                status = "vencida"
+            else:
+                status = "proxima"
+            rows.append({
+                "machine_id": machine_key,
+                "machine": self.summary(machine_key)[0],
+                "task_id": task_id,
+                "task": self.task_name(machine_key, task_id),
+                "due_date": date.fromordinal(deadline).isoformat() if deadline != NO_DEADLINE else None,
+                "status": status
+            })
+        return rows
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def iter_task_records(self):
+        # (clave, start_date, task_id, datos completos de la tarea) de toda la flota, sin hidratar.
+        for key in self._registry:
+            machine = self._registry.machine(key)
+            if machine is not None:
+                for task_id, task in machine.maintenance_tasks.items():
+                    yield key, machine.start_date, task_id, task.to_dict(full=True)
+            else:
+                record = self._registry.record(key)
+                machine_type = record.get("machine_type")
+                for task_id, task in record.get("maintenance_tasks", {}).items():
+                    yield key, record.get("start_date"), task_id, expand_task(machine_type, task_id, task)
+
+    def pop_changes(self):
+        changes, self._changes = self._changes, []
+        return changes
+
+    def to_records(self):
+        # Las máquinas no hidratadas se devuelven tal cual, sin pasar por Machine.
+        registry = self._registry
+        return [
+            registry.record(key) or registry.machine(key).to_dict()
+            for key in registry
+        ]
+
+    def to_data(self):
+        # Estado completo tal como se guarda: máquinas y marcas de borrado.
+        return {"machines": self.to_records(), "removed": list(self._removed.values())}
+
+    # --- Cambios ---
+
+    def add_machine(self, machine):
+        key = machine.machine_id
+        if machine.site is None:
+            machine.site = DataManager.default_site()
+        self._registry.add(key, machine=machine)
+        self._bases.setdefault(key, None)
+        self._index_machine(key, machine)
+        self._changes.append(("insert", key))
+        self._notify("machine", key, machine)
+        self.record_change({"op": "add_machine", "machine": machine.to_dict()})
+
+    def remove_machine(self, key):
+        self.remove_machines([key])
+
+    def remove_machines(self, keys):
+        # Se persisten en un único lote.
+        events = []
+        for key in keys:
+            self._capture_base(key)
+            self._drop(key)
+            events.append({"op": "remove_machine", "machine_id": key})
+        self.record_changes(events)
+
+    def update_machine(self, key):
+        # Tras añadir, editar o eliminar tareas de la máquina.
+        # El diálogo ya modificó el objeto, pero el evento reemplaza la definición
+        # entera, así que el estado previo solo importa por sus contadores, que
+        # no se tocan al editar.
+        self._capture_base(key)
+        machine = self[key]
+        self._registry.reindex(key)
+        self._index_machine(key, machine)
+        self._changes.append(("update", key))
+        self._notify("machine", key, machine)
+        self.record_change({"op": "update_machine", "machine_id": key, "machine": machine.to_dict()})
+
+    @timed("Fleet.register_usage")
+    def register_usage(self, key, task_id, quantity):
+        self.bulk_register_usage([(key, task_id, quantity)])
+
+    @timed("Fleet.register_maintenance")
+    def register_maintenance(self, key, task_id):
+        self.bulk_register_maintenance([(key, task_id)])
+
+    @timed("Fleet.bulk_register_usage")
+    def bulk_register_usage(self, items, history=None):
+        # items: (clave, task_id, cantidad). Se comprueban todas antes de tocar
+        # ninguna y se persisten en un único lote. history: filas del historial
+        # que da el llamador (history_rows), p. ej. una importación con la fecha
+        # de cada evento; sin ellas se anota cada uso con la hora actual.
+        items = [(key, task_id, _usage_quantity(self[key], task_id, quantity)) for key, task_id, quantity in items]
+        events = []
+        history_records = []
+        for key, task_id, quantity in items:
+            self._capture_base(key)
+            machine = self[key]
+            machine.register_usage(task_id, quantity)
+            task = machine.maintenance_tasks[task_id]
+            if history is None:
+                history_records.append((self.history_id_for(key, task_id), KIND_USAGE, quantity, None))
+            self._index_task(key, machine, task_id)
+            self._notify("task", key, machine, task_id)
+            events.append({
+                "op": "usage",
+                "machine_id": key,
+                "task_id": task_id,
+                "quantity": quantity,
+                "history_id": task.history_id
+            })
+        self.record_changes(events, history_rows(history_records) if history is None else history)
+
+    @timed("Fleet.bulk_register_maintenance")
+    def bulk_register_maintenance(self, items):
+        # items: (clave, task_id). Se comprueban todas antes de tocar ninguna y
+        # se persisten en un único lote.
+        items = list(items)
+        for key, task_id in items:
+            if task_id not in self[key].maintenance_tasks:
+                raise KeyError("Tarea de mantenimiento no encontrada.")
+        events = []
+        history_records = []
+        for key, task_id in items:
+            self._capture_base(key)
+            machine = self[key]
+            machine.register_maintenance(task_id)
+            task = machine.maintenance_tasks[task_id]
+            history_records.append((self.history_id_for(key, task_id), KIND_MAINTENANCE, 0.0, None))
+            self._index_task(key, machine, task_id)
+            self._notify("task", key, machine, task_id)
+            events.append({
+                "op": "maintenance",
+                "machine_id": key,
+                "task_id": task_id,
+                "date": task.last_date,
+                "history_id": task.history_id
+            })
+        self.record_changes(events, history_rows(history_records))
+
+    @timed("Fleet.propagate_task_definition")
+    def propagate_task_definition(self, machine_type, task_id, fields):
+        # Aplica la definición de una tarea (campos de TaskTemplate) a todas las
+        # máquinas del tipo que la tienen, en un único lote. El uso acumulado y
+        # la fecha del último mantenimiento se conservan. Devuelve cuántas cambiaron.
+        fields = {field: fields[field] for field in TaskTemplate._fields if field in fields}
+        if "has_usage" in fields and not fields["has_usage"]:
+            fields["threshold_usage"] = None
+        events = []
+        for key in self._registry.by_type(machine_type):
+            current = self.task_record(key, task_id)
+            if current is None or all(current.get(field) == value for field, value in fields.items()):
+                continue
+            self._capture_base(key)
+            machine = self[key]
+            task = machine.maintenance_tasks[task_id]
+            if "has_usage" in fields:
+                task.has_usage = fields["has_usage"]
+            for field in ("name", "threshold_days", "threshold_usage"):
+                if field in fields and (field != "threshold_usage" or task.has_usage):
+                    setattr(task, field, fields[field])
+            self._index_task(key, machine, task_id)
+            self._notify("task", key, machine, task_id)
+            events.append({"op": "task_definition", "machine_id": key, "task_id": task_id, "fields": fields})
+        self.record_changes(events)
+        return len(events)
+
+    def history_id_for(self, key, task_id):
+        # Serie de la tarea en el historial; se asigna la primera vez que se usa
+        # y se persiste con el siguiente evento de la tarea.
+        task = self[key].maintenance_tasks[task_id]
+        if task.history_id is None:
+            task.history_id = self.history.new_history_id()
+        return task.history_id
+
+    def task_series(self, key, task_id):
+        task = self[key].maintenance_tasks[task_id]
+        if task.history_id is None:
+            return None
+        return self.history.series(task.history_id)
+
+    def record_change(self, event):
+        self.record_changes([event])
+
+    def record_changes(self, events, history=None):
+        # El backend persiste solo los cambios; el estado completo se reescribe
+        # únicamente cuando el backend lo pide (p. ej. al compactar el journal).
+        # history: filas del historial de uso de estos cambios (history_rows),
+        # que se escriben después de ellos.
+        if not events:
+            return
+        for event in events:
+            key = _event_key(event)
+            self._unconfirmed.append((self._submitted, event))
+            self._submitted += 1
+            self._pending_by_key[key] = self._pending_by_key.get(key, 0) + 1
+        if self.writer is not None:
+            self.writer.submit_events(events, self.history, history)
+            if not self.writer.snapshot_pending() and DataManager.needs_full_save():
+                self.save()
+            return
+        DataManager.record_events(events)
+        if history:
+            self.history.write(history)
+        # Al escribir se leyeron los cambios que otras estaciones hubieran hecho.
+        self.sync()
+        if DataManager.needs_full_save():
+            self.save()
+
+    def save(self):
+        # Compacta el estado completo. Si entretanto otra estación escribió algo
+        # que aún no se ha incorporado, el backend lo descarta y se reintentará.
+        # Los cambios propios sin confirmar se escriben antes que el snapshot,
+        # pero sus versiones aún no están en la flota: se ponen al compactar.
+        data = self.to_data()
+        unconfirmed = ([event for _, event in self._unconfirmed], self._pending_sites())
+        if self.writer is not None:
+            self.writer.submit_snapshot(data, self._remote_applied, unconfirmed)
+        else:
+            DataManager.compact(with_versions(data, *unconfirmed), self._remote_applied)
+
+    # --- Cambios de otras estaciones ---
+
+    def sync(self):
+        # Incorpora los cambios que otras estaciones escribieron en el
+        # almacenamiento compartido y devuelve las claves de las máquinas
+        # afectadas. Es una fusión a tres bandas por máquina: los cambios ajenos
+        # se aplican sobre el estado previo a los propios sin confirmar y estos
+        # se vuelven a aplicar encima, igual que quedan en el journal. Así se
+        # suman los litros de ambas estaciones y gana el último mantenimiento.
+        # Lo que el hilo de escritura haya añadido al historial de uso.
+        self.history.poll()
+        changes, appended = DataManager.poll_changes()
+        touched = set()
+        for local_before, kind, payload in changes:
+            self._confirm(local_before)
+            if kind == "reload":
+                touched.update(self._registry)
+                self._reload(payload)
+                touched.update(self._registry)
+                self._remote_applied += 1
+            else:
+                for event in payload:
+                    touched.add(self._apply_remote(event))
+                self._remote_applied += len(payload)
+        self._confirm(self._submitted if appended is None else appended)
+        return touched
+
+    def _capture_base(self, key):
+        # Se llama antes de modificar la máquina: guarda su estado si no tiene
+        # ya cambios propios sin confirmar.
+        if key not in self._bases:
+            self._bases[key] = self.record_of(key)
+
+    def _confirm(self, count):
+        # Los cambios propios con número < count ya están escritos, por delante
+        # de cualquier cambio ajeno que llegue después: pasan a formar parte del
+        # estado previo de su máquina.
+        while self._unconfirmed and self._unconfirmed[0][0] < count:
+            event = self._unconfirmed.popleft()[1]
+            key = _event_key(event)
+            self._stamp(key, event)
+            self._pending_by_key[key] -= 1
+            if self._pending_by_key[key] == 0:
+                del self._pending_by_key[key]
+                self._bases.pop(key, None)
+            else:
+                self._bases[key] = _apply_to_record(self._bases.get(key), event)
+
+    def _apply_remote(self, event):
+        key = _event_key(event)
+        if event["op"] == "remove_machine" and "seq" in event:
+            self._stamp(key, event)
+        if key in self._bases:
+            base = self._bases[key] = _apply_to_record(self._bases[key], event)
+            state = copy.deepcopy(base)
+            for _, pending in self._unconfirmed:
+                if _event_key(pending) == key:
+                    state = _apply_to_record(state, pending)
+        else:
+            state = _apply_to_record(self.record_of(key) if key in self._registry else None, event)
+        self._set_record(key, state)
+        return key
+
+    def _stamp(self, key, event):
+        # El backend numeró el cambio al escribirlo (event["seq"]): esa es la
+        # nueva versión de la máquina o, si se eliminó, de su marca de borrado.
+        version = event.get("seq")
+        if version is None:
+            return
+        if event["op"] == "remove_machine":
+            # Solo si la eliminó este cambio, no otro anterior de otra estación:
+            # lo decide el estado confirmado, sin los cambios propios pendientes.
+            if key in self._bases:
+                existing = self._bases[key]
+            else:
+                existing = self.record_of(key) if key in self._registry else None
+            if existing is not None:
+                self._removed[key] = tombstone(key, version, existing.get("site"))
+        elif key in self._registry:
+            machine = self._registry.machine(key)
+            if machine is not None:
+                machine.version = max(machine.version, version)
+            elif self._registry.record(key).get("version", 0) < version:
+                self._registry.set_record(key, dict(self._registry.record(key), version=version))
+
+    def _set_record(self, key, record):
+        if record is None:
+            if key in self._registry:
+                self._drop(key)
+            return
+        if key in self._registry:
+            self._registry.set_record(key, record)
+            self._changes.append(("update", key))
+        else:
+            self._registry.add(key, record=record)
+            self._changes.append(("insert", key))
+        self.due_index.remove_machine(key)
+        for item in self._record_due_points(key, record):
+            self.due_index.update(*item)
+        if self._listeners:
+            self._notify("machine", key, self[key])
+
+    def _reload(self, data):
+        # Otra estación compactó los datos: se parte de su snapshot y encima se
+        # vuelven a aplicar los cambios propios sin confirmar. Si el snapshot es
+        # solo el de una sede (clave "site", ver sharded_backend.py), el resto
+        # de la flota se conserva.
+        records = data.get("machines", [])
+        by_key = {record["id"]: record for record in records}
+        if "site" in data:
+            site = data["site"]
+            sites = self._pending_sites()
+            pending = [key for key in self._pending_by_key if sites.get(key) == site]
+            unconfirmed = [event for _, event in self._unconfirmed if _event_site(event, sites) == site]
+        else:
+            pending = list(self._pending_by_key)
+            unconfirmed = [event for _, event in self._unconfirmed]
+        for key in pending:
+            self._bases[key] = copy.deepcopy(by_key.get(key))
+        index = dict(by_key)
+        for event in unconfirmed:
+            apply_event(data, event, index)
+        if "site" in data:
+            self._removed = {key: entry for key, entry in self._removed.items() if entry.get("site") != site}
+            self._removed.update((entry["id"], entry) for entry in data.get("removed", []))
+            stale = set(self._registry.by_site(site))
+            stale.update(record["id"] for record in records if record["id"] in self._registry)
+            for key in stale:
+                self.due_index.remove_machine(key)
+                self._registry.remove(key)
+            for record in records:
+                self._registry.add(record["id"], record=record)
+                for item in self._record_due_points(record["id"], record):
+                    self.due_index.update(*item)
+        else:
+            self._removed = {entry["id"]: entry for entry in data.get("removed", [])}
+            self._registry = MachineRegistry(records)
+            self.due_index = DueIndex()
+            self.due_index.bulk_load(
+                item for key in self._registry for item in self._record_due_points(key, self._registry.record(key))
+            )
+        self._changes.append(("reset", None))
+        self._notify("reset", None)
+
+    def _pending_sites(self):
+        # Sede de cada máquina con cambios propios sin confirmar.
+        sites = {}
+        for _, event in self._unconfirmed:
+            if event["op"] == "add_machine":
+                sites[event["machine"]["id"]] = event["machine"].get("site")
+        for key in self._pending_by_key:
+            if key in self._registry:
+                sites[key] = self._registry.site(key)
+            elif self._bases.get(key) is not None:
+                sites[key] = self._bases[key].get("site")
+        return sites
+
+    def _drop(self, key):
+        self.due_index.remove_machine(key)
+        self._changes.append(("delete", key))
+        self._notify("remove", key)
+        self._registry.remove(key)
+
+    def _notify(self, op, key, machine=None, task_id=None):
+        for listener in self._listeners:
+            listener(op, key, machine, task_id)
+
+    # --- Índice de vencimientos ---
+
+    def _record_due_points(self, key, record):
+        start_date = record.get("start_date")
+        machine_type = record.get("machine_type")
+        for task_id, task in record.get("maintenance_tasks", {}).items():
+            task = expand_task(machine_type, task_id, task)
+            yield key, task_id, compute_due_point(
+                start_date, task.get("last_date"), task.get("has_usage", False), task.get("threshold_days"),
+                task.get("threshold_usage"), task.get("usage_count", 0)
+            )
+
+    def _index_machine(self, key, machine):
+        self.due_index.remove_machine(key)
+        for task_id in machine.maintenance_tasks:
+            self._index_task(key, machine, task_id)
+
+    def _index_task(self, key, machine, task_id):
+        task = machine.maintenance_tasks[task_id]
+        self.due_index.update(key, task_id, task.due_point(machine.start_date))
+
+
+def _usage_quantity(machine, task_id, quantity):
+    # Litros válidos para registrar en la tarea, o excepción sin haber tocado nada.
+    task = machine.maintenance_tasks.get(task_id)
+    if task is None:
+        raise KeyError("Tarea de mantenimiento no encontrada.")
+    if not task.has_usage:
+        raise ValueError("La tarea no usa contador")
+    try:
+        quantity = float(quantity)
+    except (TypeError, ValueError):
+        raise ValueError("La cantidad debe ser un número.")
+    if not math.isfinite(quantity) or quantity < 0:
+        raise ValueError("Cantidad no válida")
+    return quantity
+
+
+def _with_ids(records):
+    # Toda máquina necesita un id único; los datos antiguos (o copiados a mano)
+    # pueden no tenerlo o repetirlo.
+    seen = set()
+    for record in records:
+        if not record.get("id") or record["id"] in seen:
+            record["id"] = new_machine_id()
+        seen.add(record["id"])
+    return records
+
+
+def _event_key(event):
+    if event["op"] == "add_machine":
+        return event["machine"]["id"]
+    return event["machine_id"]
+
+
+def _event_site(event, sites):
+    if event["op"] == "add_machine":
+        return event["machine"].get("site")
+    return sites.get(event["machine_id"])
+
+
+def _apply_to_record(record, event):
+    # Aplica un evento a una sola máquina (None si no existe) y devuelve el resultado.
+    data = {"machines": [record] if record is not None else []}
+    apply_event(data, event)
+    return data["machines"][0] if data["machines"] else None
@@ -0,0 +1,183 @@
+# forecast.py
+import math
+import time
+from array import array
+from bisect import bisect_right
+from datetime import date
+
+from config import FORECAST_WINDOW_DAYS
+from maintenance_task import compute_due_point, NO_DEADLINE
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se calcula fila a fila.
+    np = None
+
+INF = float('inf')
+
+
+def _predict(today, deadline, remaining, rate):
+    if remaining <= 0:
+        usage_day = today
+    elif rate > 0 and remaining != INF:
+        usage_day = today + math.ceil(remaining / rate)
+    else:
+        usage_day = INF
+    return min(deadline, usage_day)
+
+
+class Forecaster:
+    # Fecha prevista de cada tarea: la primera entre su fecha límite por tiempo
+    # y el día en que, al ritmo reciente de litros/día de la máquina, el uso
+    # alcanzará threshold_usage. Las entradas se guardan en columnas (una fila
+    # por tarea) para calcular toda la flota de una vez; solo se recalculan las
+    # filas cuyas tareas cambiaron, salvo al cambiar de día.
+    def __init__(self, fleet, window_days=FORECAST_WINDOW_DAYS):
+        self.fleet = fleet
+        self.window_days = window_days
+        self._build()
+        fleet.add_listener(self.on_fleet_change)
+
+    def _build(self):
+        self._deadline = array('d')  # ordinal de la fecha límite por tiempo
+        self._remaining = array('d')  # litros hasta threshold_usage (inf sin contador)
+        self._rate = array('d')  # litros/día recientes
+        self._usage = []  # fila -> (usage_count, ordinal del último mantenimiento o inicio)
+        self._history_ids = []
+        self._row_keys = []  # fila -> (clave, task_id), o None si la fila está libre
+        self._rows = {}
+        self._rows_by_machine = {}
+        self._free = []
+        self._stale = set()
+        self._result = None
+        self._result_day = None
+        self._sorted = None  # (entradas de forecast, sus fechas) ordenadas, hasta que cambie _result
+        for key, start_date, task_id, task in self.fleet.iter_task_records():
+            self._set_row(key, start_date, task_id, task)
+
+    def on_fleet_change(self, op, key, machine=None, task_id=None):
+        if op == "task":
+            task = machine.maintenance_tasks[task_id]
+            self._set_row(key, machine.start_date, task_id, task.to_dict(full=True))
+        elif op == "machine":
+            self._remove_machine(key)
+            for t_id, task in machine.maintenance_tasks.items():
+                self._set_row(key, machine.start_date, t_id, task.to_dict(full=True))
+        elif op == "remove":
+            self._remove_machine(key)
+        elif op == "reset":
+            self._build()
+
+    def predicted_due(self, key, task_id):
+        row = self._rows.get((key, task_id))
+        if row is None:
+            return None
+        day = self._predictions()[row]
+        return None if day == INF else date.fromordinal(int(day))
+
+    def forecast(self, days=None):
+        # (fecha prevista, clave, task_id) ordenado por fecha; con `days`, solo
+        # las tareas previstas hasta dentro de ese número de días. El orden se
+        # guarda hasta que cambie alguna previsión: luego basta cortarlo.
+        entries, days_due = self._sorted_entries()
+        if days is None:
+            return list(entries)
+        return entries[:bisect_right(days_due, date.today().toordinal() + days)]
+
+    def _sorted_entries(self):
+        result = self._predictions()
+        if self._sorted is None:
+            if np is not None and len(result):
+                rows = np.argsort(np.asarray(result), kind='stable').tolist()
+            else:
+                rows = sorted(range(len(result)), key=result.__getitem__)
+            rows = [row for row in rows if self._row_keys[row] is not None and result[row] != INF]
+            self._sorted = (
+                [(date.fromordinal(int(result[row])), *self._row_keys[row]) for row in rows],
+                array('d', (result[row] for row in rows))
+            )
+        return self._sorted
+
+    def _predictions(self):
+        today = date.today().toordinal()
+        if self._result_day != today:
+            # Con el día cambia la ventana del ritmo de uso: se recalcula todo.
+            self._stale = set(range(len(self._row_keys)))
+        now = time.time()
+        for row in self._stale:
+            self._rate[row] = self._row_rate(row, today, now)
+
+        if self._result is None or self._result_day != today or len(self._result) != len(self._row_keys):
+            self._result = self._compute_all(today)
+            self._result_day = today
+            self._sorted = None
+        elif self._stale:
+            for row in self._stale:
+                self._result[row] = _predict(today, self._deadline[row], self._remaining[row], self._rate[row])
+            self._sorted = None
+        self._stale = set()
+        return self._result
+
+    def _compute_all(self, today):
+        if np is None or not self._row_keys:
+            return array('d', map(_predict, [today] * len(self._deadline), self._deadline, self._remaining, self._rate))
+        deadline = np.frombuffer(self._deadline, dtype=np.float64)
+        remaining = np.frombuffer(self._remaining, dtype=np.float64)
+        rate = np.frombuffer(self._rate, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            usage_days = np.where(rate > 0, np.ceil(remaining / rate), INF)
+        usage_days[remaining <= 0] = 0
+        return np.minimum(deadline, today + usage_days)
+
+    def _row_rate(self, row, today, now):
+        if self._row_keys[row] is None:
+            return 0.0
+        history_id = self._history_ids[row]
+        if history_id is not None:
+            total = self.fleet.history.series(history_id).usage_since(now - self.window_days * 86400)
+            if total > 0:
+                return total / self.window_days
+        # Sin historial reciente: uso acumulado desde el último mantenimiento.
+        usage_count, base = self._usage[row]
+        if not usage_count or base is None:
+            return 0.0
+        return usage_count / max(1, today - base)
+
+    def _set_row(self, key, start_date, task_id, task):
+        row = self._rows.get((key, task_id))
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._row_keys[row] = (key, task_id)
+            else:
+                row = len(self._row_keys)
+                self._row_keys.append((key, task_id))
+                self._deadline.append(INF)
+                self._remaining.append(INF)
+                self._rate.append(0.0)
+                self._usage.append((0, None))
+                self._history_ids.append(None)
+            self._rows[(key, task_id)] = row
+            self._rows_by_machine.setdefault(key, set()).add(task_id)
+
+        deadline = compute_due_point(start_date, task.get("last_date"), False, task.get("threshold_days"), None, None)[1]
+        self._deadline[row] = INF if deadline == NO_DEADLINE else deadline
+        usage_count = task.get("usage_count") or 0
+        if task.get("has_usage") and task.get("threshold_usage") is not None:
+            self._remaining[row] = task["threshold_usage"] - usage_count
+        else:
+            self._remaining[row] = INF
+        base = task.get("last_date") or start_date
+        self._usage[row] = (usage_count, date.fromisoformat(base).toordinal() if base else None)
+        self._history_ids[row] = task.get("history_id")
+        self._stale.add(row)
+
+    def _remove_machine(self, key):
+        for task_id in self._rows_by_machine.pop(key, ()):
+            row = self._rows.pop((key, task_id))
+            self._row_keys[row] = None
+            self._deadline[row] = INF
+            self._remaining[row] = INF
+            self._history_ids[row] = None
+            self._free.append(row)
+            self._stale.add(row)
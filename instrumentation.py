@@ -0,0 +1,176 @@
+# instrumentation.py
+# Contadores de llamadas, latencias y bytes leídos/escritos de las operaciones
+# de datos y del modelo. Desactivada, @timed devuelve la función sin envolver
+# y span() un contexto vacío, así que no cuesta nada. Se activa en config, con
+# COFFEE_INSTRUMENT=1 o llamando a enable() antes de importar los módulos
+# instrumentados.
+import atexit
+import functools
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from config import INSTRUMENTATION_ENABLED, INSTRUMENTATION_FILE
+
+ENABLED = INSTRUMENTATION_ENABLED or os.environ.get("COFFEE_INSTRUMENT") == "1"
+# Latencias que se guardan por operación para los percentiles (muestreo uniforme).
+SAMPLE_SIZE = 1024
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+_rng = random.Random(0)
+_dump_file = None
+
+
+class _Stat:
+    __slots__ = ("count", "total", "max", "samples", "bytes_read", "bytes_written")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class _Span:
+    __slots__ = ("name", "start", "read", "written")
+
+    def __init__(self, name):
+        self.name = name
+        self.read = 0
+        self.written = 0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _local.stack.pop()
+        _record(self.name, elapsed, self.read, self.written)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(dump_file=INSTRUMENTATION_FILE):
+    global ENABLED
+    ENABLED = True
+    _register_dump(dump_file)
+
+
+def timed(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def span(name):
+    return _Span(name) if ENABLED else _NULL_SPAN
+
+
+def add_bytes(read=0, written=0):
+    # Se atribuyen a la operación medida más interna en curso en este hilo.
+    if not ENABLED:
+        return
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1].read += read
+        stack[-1].written += written
+
+
+def stats():
+    # {operación: {count, total_ms, mean_ms, p50_ms, p90_ms, p99_ms, max_ms,
+    # bytes_read, bytes_written}}, de la que más tiempo acumula a la que menos.
+    with _lock:
+        snapshot = [(name, stat.count, stat.total, stat.max, sorted(stat.samples), stat.bytes_read,
+                     stat.bytes_written) for name, stat in _stats.items()]
+    result = {}
+    for name, count, total, max_time, samples, read, written in sorted(snapshot, key=lambda s: -s[2]):
+        result[name] = {
+            "count": count,
+            "total_ms": total * 1000,
+            "mean_ms": total / count * 1000,
+            "p50_ms": _percentile(samples, 50) * 1000,
+            "p90_ms": _percentile(samples, 90) * 1000,
+            "p99_ms": _percentile(samples, 99) * 1000,
+            "max_ms": max_time * 1000,
+            "bytes_read": read,
+            "bytes_written": written
+        }
+    return result
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def dump(path=INSTRUMENTATION_FILE):
+    with open(path, 'w') as f:
+        json.dump({"date": datetime.now().isoformat(timespec="seconds"), "stats": stats()}, f, indent=4)
+
+
+def _record(name, elapsed, read, written):
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = _Stat()
+        stat.count += 1
+        stat.total += elapsed
+        if elapsed > stat.max:
+            stat.max = elapsed
+        stat.bytes_read += read
+        stat.bytes_written += written
+        if len(stat.samples) < SAMPLE_SIZE:
+            stat.samples.append(elapsed)
+        else:
+            j = _rng.randrange(stat.count)
+            if j < SAMPLE_SIZE:
+                stat.samples[j] = elapsed
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _register_dump(dump_file):
+    global _dump_file
+    if _dump_file is None:
+        atexit.register(_dump_at_exit)
+    _dump_file = dump_file
+
+
+def _dump_at_exit():
+    if _dump_file and _stats:
+        dump(_dump_file)
+
+
+if ENABLED:
+    _register_dump(INSTRUMENTATION_FILE)
@@ -1,40 +1,53 @@
 # machine.py
+import uuid
 from datetime import datetime
-from maintenance_task import MaintenanceTask
+from maintenance_task import MaintenanceTask, task_template
 from config import MACHINE_TYPES
+from instrumentation import timed
+
+def new_machine_id():
+    # Identificador persistente; aleatorio para que dos estaciones nunca choquen.
+    return uuid.uuid4().hex
 
 class Machine:
-    def __init__(self, name, machine_type, start_date=None, maintenance_tasks=None):
+    __slots__ = ("machine_id", "name", "machine_type", "start_date", "maintenance_tasks", "site", "version")
+
+    def __init__(self, name, machine_type, start_date=None, maintenance_tasks=None, machine_id=None, site=None,
+                 version=0):
+        self.machine_id = machine_id or new_machine_id()
         self.name = name
+        # Número del último cambio de la máquina ya escrito en el almacenamiento
+        # (0: ninguno desde que se llevan versiones). Lo asigna el backend al
+        # escribir, no el modelo: ver Fleet._stamp y changes_since.
+        self.version = version
+        # Sede a la que pertenece (None: sin sede). Con datos repartidos por
+        # sede decide en qué fichero se guarda y no cambia.
+        self.site = site
         self.machine_type = machine_type  # Ejemplo: "coffee_machine", "grinder" o personalizado
         self.start_date = start_date if start_date else datetime.now().strftime("%Y-%m-%d")
         # maintenance_tasks es un diccionario: clave = task_id, valor = objeto MaintenanceTask.
         if maintenance_tasks:
             self.maintenance_tasks = maintenance_tasks
         else:
-            # Si el tipo de máquina existe en MACHINE_TYPES, se crean las tareas por defecto.
+            # Si el tipo de máquina existe en MACHINE_TYPES, se crean las tareas por
+            # defecto, que comparten la plantilla de su tipo.
             if machine_type in MACHINE_TYPES:
                 default_tasks = MACHINE_TYPES[machine_type].get("maintenance", {})
                 self.maintenance_tasks = {}
-                for task_id, config in default_tasks.items():
-                    self.maintenance_tasks[task_id] = MaintenanceTask(
-                        task_id=task_id,
-                        name=config["name"],
-                        has_usage=config.get("has_usage", False),
-                        threshold_days=config.get("threshold_days"),
-                        threshold_usage=config.get("threshold_usage") if config.get("has_usage", False) else None,
-                        last_date=None,
-                        usage_count=0
-                    )
+                for task_id in default_tasks:
+                    self.maintenance_tasks[task_id] = MaintenanceTask.from_template(
+                        task_id, task_template(machine_type, task_id))
             else:
                 self.maintenance_tasks = {}
 
+    @timed("Machine.register_usage")
     def register_usage(self, task_id, quantity):
         if task_id in self.maintenance_tasks:
             self.maintenance_tasks[task_id].register_usage(quantity)
         else:
             raise KeyError("Tarea de mantenimiento no encontrada.")
 
+    @timed("Machine.register_maintenance")
     def register_maintenance(self, task_id):
         if task_id in self.maintenance_tasks:
             self.maintenance_tasks[task_id].register_maintenance()
@@ -44,11 +57,13 @@ class Machine:
     def add_maintenance_task(self, task):
         if task.task_id in self.maintenance_tasks:
             raise ValueError("Ya existe una tarea con ese ID.")
+        task.use_template(task_template(self.machine_type, task.task_id))
         self.maintenance_tasks[task.task_id] = task
 
     def edit_maintenance_task(self, task):
         if task.task_id not in self.maintenance_tasks:
             raise KeyError("La tarea no existe.")
+        task.use_template(task_template(self.machine_type, task.task_id))
         self.maintenance_tasks[task.task_id] = task
 
     def remove_maintenance_task(self, task_id):
@@ -57,15 +72,23 @@ class Machine:
         else:
             raise KeyError("La tarea no existe.")
 
+    @timed("Machine.to_dict")
     def to_dict(self):
-        return {
+        data = {
+            "id": self.machine_id,
             "name": self.name,
             "machine_type": self.machine_type,
             "start_date": self.start_date,
             "maintenance_tasks": {task_id: task.to_dict() for task_id, task in self.maintenance_tasks.items()}
         }
+        if self.site is not None:
+            data["site"] = self.site
+        if self.version:
+            data["version"] = self.version
+        return data
 
     @classmethod
+    @timed("Machine.from_dict")
     def from_dict(cls, data):
         name = data.get("name")
         machine_type = data.get("machine_type")
@@ -74,5 +97,7 @@ class Machine:
         maintenance_tasks = {}
         # Cargar cada tarea almacenada.
         for task_id, task_dict in tasks_data.items():
-            maintenance_tasks[task_id] = MaintenanceTask.from_dict(task_id, task_dict)
-        return cls(name, machine_type, start_date, maintenance_tasks)
+            template = task_template(machine_type, task_id)
+            maintenance_tasks[task_id] = MaintenanceTask.from_dict(task_id, task_dict, template)
+        return cls(name, machine_type, start_date, maintenance_tasks, data.get("id"), data.get("site"),
+                   data.get("version", 0))
@@ -0,0 +1,176 @@
+# machine_search.py
+import bisect
+import gc
+import re
+import unicodedata
+from itertools import accumulate
+from datetime import date
+from config import DUE_SOON_DAYS
+
+# Estado de vencimiento de una máquina: el de su tarea más urgente.
+STATUS_OK = "ok"
+STATUS_SOON = "proxima"
+STATUS_OVERDUE = "vencida"
+
+# Separador de los nombres en el texto de búsqueda; no puede aparecer en una
+# búsqueda, así que ninguna coincidencia abarca dos nombres.
+_SEPARATOR = "\x00"
+# Por encima de esta fracción de la flota sale más barato recorrer todos los
+# nombres que localizar las coincidencias una a una.
+_SCAN_FRACTION = 8
+# Tildes y demás marcas que quedan separadas de la letra al descomponerla.
+_COMBINING = re.compile("[\u0300-\u036f]+")
+
+
+def normalize(text):
+    # Sin mayúsculas ni tildes, para que "maquina" encuentre "Máquina".
+    text = (text or "").casefold()
+    if text.isascii():
+        return text
+    return _COMBINING.sub("", unicodedata.normalize("NFKD", text))
+
+
+class MachineSearch:
+    # Búsqueda en el listado de máquinas por nombre, tipo y estado de
+    # vencimiento. Mantiene los nombres normalizados en una lista ordenada y,
+    # unidos en un solo texto en ese orden, para buscar subcadenas con las
+    # funciones de cadena de Python en lugar de nombre a nombre. La lista se actualiza con los cambios de la flota y el
+    # texto se rehace en la siguiente búsqueda; el tipo sale de los índices del
+    # registro y el estado, del índice de vencimientos. Todo se construye en la
+    # primera búsqueda.
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self._built = False
+        self._text = None  # nombres de _sorted unidos por _SEPARATOR
+        self._offsets = None  # posición de cada nombre en _text
+        self._due = None  # (vencidas, próximas): claves de las que no están al día
+        self._due_day = None
+        fleet.add_listener(self.on_fleet_change)
+
+    def on_fleet_change(self, op, key, machine=None, task_id=None):
+        # Cualquier cambio puede alterar el estado de vencimiento.
+        self._due = None
+        if not self._built or op == "task":
+            return
+        if op == "reset":
+            self._built = False
+        elif op == "remove":
+            self._remove(key)
+        elif op == "machine":
+            name = normalize(machine.name)
+            if self._names.get(key) != name:
+                self._remove(key)
+                self._names[key] = name
+                bisect.insort(self._sorted, (name, key))
+                self._text = None
+
+    def search(self, text="", machine_type=None, status=None):
+        # Claves de las máquinas que cumplen todos los filtros, por orden de
+        # nombre. text: parte del nombre, sin distinguir mayúsculas ni tildes.
+        if not self._built:
+            self._build()
+        text = normalize(text.strip())
+        include = []  # conjuntos a los que debe pertenecer el resultado
+        exclude = ()
+        if machine_type is not None:
+            include.append(set(self.fleet.keys_by_type(machine_type)))
+        if status == STATUS_OK:
+            overdue, soon = self.due_sets()
+            exclude = overdue | soon
+        elif status is not None:
+            include.append(self.due_sets()[status == STATUS_SOON])
+
+        keys = None
+        if include:
+            include.sort(key=len)
+            keys = include[0].intersection(*include[1:])
+        if keys is not None and len(keys) * _SCAN_FRACTION < len(self._sorted):
+            # Pocos candidatos: se comprueban y ordenan solo ellos.
+            names = self._names
+            rows = sorted((names[key], key) for key in keys if text in names[key])
+        elif text:
+            rows = self._matching(text)
+        else:
+            rows = self._sorted
+        if keys is not None:
+            result = [key for _, key in rows if key in keys]
+        else:
+            result = [key for _, key in rows]
+        if exclude:
+            result = [key for key in result if key not in exclude]
+        return result
+
+    def due_sets(self):
+        # (claves con alguna tarea vencida, claves con alguna próxima a vencer
+        # y ninguna vencida). Las que no están en ninguno están al día.
+        today = date.today()
+        if self._due is None or self._due_day != today:
+            overdue = set()
+            soon = set()
+            # Las entradas vienen de más a menos urgente: la primera de cada
+            # máquina decide su estado.
+            for usage_pending, deadline, key, _ in self.fleet.due_index.due_within(DUE_SOON_DAYS, today):
+                if usage_pending == 0 or deadline <= today.toordinal():
+                    overdue.add(key)
+                elif key not in overdue:
+                    soon.add(key)
+            self._due = (overdue, soon)
+            self._due_day = today
+        return self._due
+
+    def status_of(self, key):
+        overdue, soon = self.due_sets()
+        if key in overdue:
+            return STATUS_OVERDUE
+        return STATUS_SOON if key in soon else STATUS_OK
+
+    # --- Índices ---
+
+    def _build(self):
+        # Como al cargar los datos (ver snapshot_format.loads), el recolector de
+        # basura solo añadiría pasadas inútiles mientras se crean las filas.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            keys, names = zip(*self.fleet.names()) if len(self.fleet) else ((), ())
+            # Se normalizan todos de una vez: nombre a nombre es varias veces más lento.
+            names = [name or "" for name in names]
+            folded = normalize(_SEPARATOR.join(names)).split(_SEPARATOR)
+            if len(folded) != len(keys):  # algún nombre contenía el separador
+                folded = [normalize(name) for name in names]
+            self._names = dict(zip(keys, folded))  # clave -> nombre normalizado
+            self._sorted = sorted(zip(folded, keys))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self._text = None
+        self._built = True
+
+    def _remove(self, key):
+        name = self._names.pop(key, None)
+        if name is not None:
+            del self._sorted[bisect.bisect_left(self._sorted, (name, key))]
+            self._text = None
+
+    def _matching(self, text):
+        # Filas (nombre, clave) cuyo nombre contiene `text`, en orden.
+        if _SEPARATOR in text:
+            return []
+        if self._text is None:
+            self._text = _SEPARATOR.join(name for name, _ in self._sorted)
+            self._offsets = list(accumulate((len(name) + 1 for name, _ in self._sorted[:-1]), initial=0))
+        count = self._text.count(text)
+        if count * _SCAN_FRACTION > len(self._sorted):
+            return [row for row in self._sorted if text in row[0]]
+        rows = []
+        last = -1
+        find = self._text.find
+        offsets = self._offsets
+        pos = find(text)
+        while pos >= 0:
+            row = bisect.bisect_right(offsets, pos) - 1
+            if row != last:
+                rows.append(self._sorted[row])
+                last = row
+            pos = find(text, pos + 1)
+        return rows
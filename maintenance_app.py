@@ -1,14 +1,54 @@
 # maintenance_app.py
 
+import os
+import threading
 import tkinter as tk
-from tkinter import messagebox, simpledialog
+from tkinter import messagebox, simpledialog, filedialog
 from tkinter import ttk
-from datetime import datetime
-from PIL import Image, ImageTk  # Para cargar y mostrar el logo
+from datetime import datetime, date
 
-from data_manager import DataManager
 from machine import Machine
-from config import MACHINE_TYPES
+from machine_search import MachineSearch, STATUS_OK, STATUS_SOON, STATUS_OVERDUE
+from due_alerts import DueAlertScheduler, STATUS_USAGE
+from maintenance_task import NO_DEADLINE, TaskTemplate
+from fleet import Fleet
+from persistence_worker import PersistenceWorker
+import instrumentation
+from usage_import import import_usage
+from config import (MACHINE_TYPES, DUE_SOON_DAYS, TREE_PAGE_SIZE, TREE_CHUNK_SIZE, SYNC_INTERVAL_MS,
+                    INSTRUMENTATION_FILE, SEARCH_DEBOUNCE_MS)
+
+# Nombre a mostrar de cada tipo, resuelto una sola vez.
+TYPE_DISPLAY_NAMES = {k: v['display_name'] for k, v in MACHINE_TYPES.items()}
+ALL_TYPES = "Todos los tipos"
+STATUS_FILTERS = {
+    "Todos los estados": None,
+    "Al día": STATUS_OK,
+    "Próximas a vencer": STATUS_SOON,
+    "Vencidas": STATUS_OVERDUE
+}
+# Logo de la cabecera y su miniatura ya redimensionada, que Tk carga sin Pillow.
+LOGO_FILE = "logo.png"
+LOGO_SIZE = 64
+LOGO_THUMBNAIL = f"logo_{LOGO_SIZE}.png"
+# Cada cuánto se comprueba si ha terminado la carga en segundo plano.
+LOAD_POLL_MS = 50
+
+
+def load_logo(master):
+    # Pillow solo hace falta para rehacer la miniatura cuando no existe o el
+    # logo es más reciente; si no se puede guardar, se usa sin guardar.
+    if not os.path.exists(LOGO_THUMBNAIL) or os.path.getmtime(LOGO_THUMBNAIL) < os.path.getmtime(LOGO_FILE):
+        from PIL import Image, ImageTk
+        with Image.open(LOGO_FILE) as image:
+            thumbnail = image.resize((LOGO_SIZE, LOGO_SIZE), Image.Resampling.LANCZOS)
+        try:
+            thumbnail.save(LOGO_THUMBNAIL + ".tmp", format="PNG")
+            os.replace(LOGO_THUMBNAIL + ".tmp", LOGO_THUMBNAIL)
+        except OSError:
+            return ImageTk.PhotoImage(thumbnail, master=master)
+    return tk.PhotoImage(master=master, file=LOGO_THUMBNAIL)
+
 
 class MaintenanceApp:
     def __init__(self, root):
@@ -19,9 +59,17 @@ class MaintenanceApp:
         self.create_menubar()
         self.create_header()
         
-        # Cargar datos de máquinas
-        self.data = DataManager.load_data()
-        self.machines = [Machine.from_dict(m) for m in self.data.get("machines", [])]
+        # La flota se carga en segundo plano (ver start_loading): hasta entonces
+        # la ventana responde pero las acciones sobre los datos están desactivadas.
+        self.machines = None
+        self.search = None
+        self.alerts = None
+        self.alerts_dialog = None
+        self.loaded = False
+        self.load_result = None
+        self.filter_job = None
+        self.filtered = None  # claves que pasan los filtros; None sin filtros
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         
         # Ventana dividida en dos paneles
         self.paned = ttk.Panedwindow(self.root, orient=tk.HORIZONTAL)
@@ -37,7 +85,76 @@ class MaintenanceApp:
         self.paned.add(self.right_frame, weight=3)
         self.create_right_panel()
         
+        self.tree_loaded = False
+        self.tree_paged = False
+        self.page = 0
+        # Relleno del listado por tramos: claves pendientes y siguiente tramo.
+        self.fill_keys = None
+        self.fill_pos = 0
+        self.fill_job = None
+        self.start_loading()
+    
+    def start_loading(self):
+        # La lectura de los datos y la construcción de la flota (índice de
+        # vencimientos incluido) se hacen en otro hilo, sin tocar Tk: la ventana
+        # aparece en seguida sea cual sea el tamaño de la flota.
+        self.set_loading(True)
+        threading.Thread(target=self.load_fleet, name="carga", daemon=True).start()
+        self.root.after(LOAD_POLL_MS, self.check_loading)
+    
+    def load_fleet(self):
+        try:
+            fleet = Fleet.load()
+            # Ids del historial reservados ya, para no esperar al fichero desde Tk.
+            fleet.history.reserve_ids()
+            self.load_result = (fleet, None)
+        except Exception as e:
+            self.load_result = (None, e)
+    
+    def check_loading(self):
+        if self.load_result is None:
+            self.root.after(LOAD_POLL_MS, self.check_loading)
+            return
+        fleet, error = self.load_result
+        self.load_result = None
+        if error is not None:
+            messagebox.showerror("Error", f"No se pudieron cargar los datos:\n{error}", parent=self.root)
+            self.root.destroy()
+            return
+        self.machines = fleet
+        # Índices de búsqueda del listado (se construyen en la primera búsqueda)
+        self.search = MachineSearch(fleet)
+        # Las escrituras a disco se hacen en un hilo aparte
+        fleet.writer = PersistenceWorker()
+        # Avisos de tareas que pasan a estar vencidas, con un solo temporizador de Tk.
+        self.alerts = DueAlertScheduler(
+            fleet,
+            lambda seconds, callback: self.root.after(int(seconds * 1000), callback),
+            self.root.after_cancel,
+            on_change=self.on_alerts_change
+        )
+        self.loaded = True
+        self.poll_persistence_errors()
+        self.set_loading(False)
         self.refresh_machine_list()
+        self.root.after(SYNC_INTERVAL_MS, self.poll_remote_changes)
+    
+    def set_loading(self, loading):
+        state = "disabled" if loading else "normal"
+        for widget in (self.search_entry, self.add_btn, self.remove_btn):
+            widget.config(state=state)
+        for widget in (self.type_filter, self.status_filter):
+            widget.config(state="disabled" if loading else "readonly")
+        for menu, index in self.data_menu_items:
+            menu.entryconfig(index, state=state)
+        if loading:
+            self.progress_label.config(text="Cargando datos...")
+            self.progress.config(mode="indeterminate")
+            self.progress.start(15)
+            self.progress_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        else:
+            self.progress.stop()
+            self.progress_frame.pack_forget()
     
     def setup_styles(self):
         self.style = ttk.Style(self.root)
@@ -52,11 +169,21 @@ class MaintenanceApp:
         menubar = tk.Menu(self.root)
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Nuevo", command=self.add_machine)
+        file_menu.add_command(label="Importar uso...", command=self.import_usage_file)
+        # Entradas que necesitan los datos cargados: (menú, posición).
+        self.data_menu_items = [(file_menu, 0), (file_menu, 1)]
         file_menu.add_separator()
-        file_menu.add_command(label="Salir", command=self.root.quit)
+        file_menu.add_command(label="Salir", command=self.quit)
         menubar.add_cascade(label="Archivo", menu=file_menu)
         
+        view_menu = tk.Menu(menubar, tearoff=0)
+        view_menu.add_command(label="Vencimientos", command=self.show_due_tasks)
+        view_menu.add_command(label="Avisos", command=self.show_alerts)
+        self.data_menu_items.extend([(view_menu, 0), (view_menu, 1)])
+        menubar.add_cascade(label="Ver", menu=view_menu)
+        
         help_menu = tk.Menu(menubar, tearoff=0)
+        help_menu.add_command(label="Diagnóstico", command=self.show_diagnostics)
         help_menu.add_command(label="Acerca de", command=self.show_about)
         menubar.add_cascade(label="Ayuda", menu=help_menu)
         self.root.config(menu=menubar)
@@ -65,10 +192,7 @@ class MaintenanceApp:
         self.header_frame = ttk.Frame(self.root, padding=10)
         self.header_frame.pack(fill=tk.X)
         try:
-            # Cargar y redimensionar el logo (ajusta la ruta y el tamaño a tu gusto)
-            logo_image = Image.open("logo.png")
-            logo_image = logo_image.resize((64, 64), Image.Resampling.LANCZOS)
-            self.logo_photo = ImageTk.PhotoImage(logo_image)
+            self.logo_photo = load_logo(self.root)
             
             # Mostrar el logo en el header
             logo_label = ttk.Label(self.header_frame, image=self.logo_photo)
@@ -83,6 +207,70 @@ class MaintenanceApp:
         
         title = ttk.Label(self.header_frame, text="Gestión de Máquinas y Mantenimientos", style="Header.TLabel")
         title.pack(side=tk.LEFT, padx=10)
+        
+        # Solo visible mientras hay avisos pendientes (ver on_alerts_change).
+        self.alerts_btn = ttk.Button(self.header_frame, command=self.show_alerts)
+    
+    def poll_persistence_errors(self):
+        # Los fallos del hilo de escritura se muestran desde el hilo de Tk.
+        errors = self.machines.writer.pop_errors()
+        if errors:
+            messagebox.showerror(
+                "Error al guardar",
+                f"No se pudieron guardar los cambios:\n{errors[-1]}\n\nSe reintentará con el próximo cambio.",
+                parent=self.root
+            )
+        self.root.after(500, self.poll_persistence_errors)
+    
+    def poll_remote_changes(self):
+        # Cambios hechos desde otras estaciones sobre los mismos datos. No se
+        # aplican mientras haya un diálogo modal abierto sobre una máquina.
+        if self.root.grab_current() is None:
+            try:
+                touched = self.machines.sync()
+            except OSError:
+                touched = None  # Datos ocupados o inaccesibles: se reintenta luego.
+            if touched:
+                selected = self.tree.selection()
+                self.refresh_machine_list()
+                if len(selected) > 1:
+                    # Selección múltiple: se conservan las máquinas que siguen en el listado.
+                    keys = [key for key in selected if key in self.machines and self.tree.exists(key)]
+                    self.tree.selection_set(keys)
+                    self.show_selection(keys)
+                elif selected:
+                    # La máquina pudo cambiar o borrarse: se vuelve a enlazar el panel.
+                    key = selected[0]
+                    if key not in self.machines:
+                        self.hide_machine_details()
+                    else:
+                        if not self.tree.selection():
+                            self.select_machine(key)
+                        self.show_machine_details(key)
+        self.root.after(SYNC_INTERVAL_MS, self.poll_remote_changes)
+    
+    def quit(self):
+        if not self.loaded:
+            # Aún no se ha podido cambiar nada: el hilo de carga se abandona.
+            self.root.destroy()
+            return
+        # Antes de cerrar se espera a que se escriba todo lo pendiente.
+        if not self.machines.writer.flush(timeout=30):
+            errors = self.machines.writer.pop_errors()
+            detail = f"\n{errors[-1]}" if errors else ""
+            if not messagebox.askyesno(
+                "Error al guardar",
+                f"No se pudieron guardar todos los cambios.{detail}\n\n¿Salir de todos modos?",
+                parent=self.root
+            ):
+                return
+        self.alerts.stop()
+        self.machines.writer.stop(timeout=5)
+        self.machines.history.close()
+        self.root.destroy()
+    
+    def show_diagnostics(self):
+        DiagnosticsDialog(self.root)
     
     def show_about(self):
         messagebox.showinfo(
@@ -92,7 +280,29 @@ class MaintenanceApp:
         )
     
     def create_left_panel(self):
-        tree_frame = ttk.Frame(self.left_frame)
+        # Búsqueda por nombre y filtros por tipo y estado
+        filter_frame = ttk.Frame(self.left_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Buscar:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(filter_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.search_entry.bind("<Escape>", lambda e: self.clear_filters())
+        self.search_var.trace_add("write", lambda *args: self.schedule_filter())
+        
+        self.type_filter = ttk.Combobox(filter_frame, state="readonly", width=14, postcommand=self.update_type_filter)
+        self.type_filter.pack(side=tk.LEFT, padx=2)
+        self.type_filter.bind("<<ComboboxSelected>>", lambda e: self.schedule_filter())
+        self.type_filters = {ALL_TYPES: None}
+        self.type_filter["values"] = [ALL_TYPES]
+        self.type_filter.current(0)
+        
+        self.status_filter = ttk.Combobox(filter_frame, state="readonly", width=16, values=list(STATUS_FILTERS))
+        self.status_filter.pack(side=tk.LEFT, padx=2)
+        self.status_filter.bind("<<ComboboxSelected>>", lambda e: self.schedule_filter())
+        self.status_filter.current(0)
+        
+        self.tree_frame = tree_frame = ttk.Frame(self.left_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True)
         
         # Definimos 3 columnas: "Name", "Type", "Start"
@@ -100,7 +310,7 @@ class MaintenanceApp:
             tree_frame,
             columns=("Name", "Type", "Start"),
             show="headings",
-            selectmode="browse"
+            selectmode="extended"
         )
         
         # Configuramos los encabezados
@@ -121,123 +331,439 @@ class MaintenanceApp:
         
         self.tree.bind("<<TreeviewSelect>>", self.on_machine_select)
         
-        add_btn = ttk.Button(self.left_frame, text="Añadir Máquina", command=self.add_machine)
-        add_btn.pack(pady=10)
+        # Navegación por páginas, visible solo con flotas grandes
+        self.page_frame = ttk.Frame(self.left_frame)
+        prev_btn = ttk.Button(self.page_frame, text="◀", width=3, command=lambda: self.change_page(-1))
+        prev_btn.pack(side=tk.LEFT)
+        self.page_label = ttk.Label(self.page_frame)
+        self.page_label.pack(side=tk.LEFT, padx=10)
+        next_btn = ttk.Button(self.page_frame, text="▶", width=3, command=lambda: self.change_page(1))
+        next_btn.pack(side=tk.LEFT)
+        
+        self.add_btn = ttk.Button(self.left_frame, text="Añadir Máquina", command=self.add_machine)
+        self.add_btn.pack(pady=10)
+        
+        self.remove_btn = ttk.Button(self.left_frame, text="Eliminar Máquina", command=self.remove_machine)
+        self.remove_btn.pack(pady=5)
         
-        remove_btn = ttk.Button(self.left_frame, text="Eliminar Máquina", command=self.remove_machine)
-        remove_btn.pack(pady=5)
+        # Progreso de la carga y del relleno del listado
+        self.progress_frame = ttk.Frame(self.left_frame)
+        self.progress_label = ttk.Label(self.progress_frame)
+        self.progress_label.pack(side=tk.LEFT)
+        self.progress = ttk.Progressbar(self.progress_frame, length=120)
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
     
     def create_right_panel(self):
         self.details_frame = ttk.Frame(self.right_frame)
         self.details_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Widgets del detalle: se empaquetan al seleccionar una máquina
+        self.details_header = ttk.Label(self.details_frame, style="Header.TLabel")
+        
+        # Botón para gestionar tareas personalizadas
+        self.manage_tasks_btn = ttk.Button(self.details_frame, text="Gestionar Tareas")
+        
+        self.notebook = ttk.Notebook(self.details_frame)
+        self.no_tasks_label = ttk.Label(
+            self.details_frame,
+            text="No hay tareas definidas. Utiliza 'Gestionar Tareas' para agregarlas.",
+            font=('Segoe UI', 10, 'italic')
+        )
+        
+        # Pestañas visibles por task_id y pestañas libres según su disposición
+        # (con o sin contador de uso).
+        self.task_tabs = {}
+        self.tab_pool = {True: [], False: []}
+        
+        # Acciones sobre varias máquinas seleccionadas a la vez (ver show_bulk_panel)
+        self.bulk_frame = ttk.Frame(self.details_frame)
+        self.bulk_header = ttk.Label(self.bulk_frame, style="Header.TLabel")
+        self.bulk_header.pack(anchor="w", pady=5)
+        
+        bulk_task_frame = ttk.Frame(self.bulk_frame)
+        bulk_task_frame.pack(anchor="w", pady=5)
+        ttk.Label(bulk_task_frame, text="Tarea:").pack(side=tk.LEFT, padx=5)
+        self.bulk_task = ttk.Combobox(bulk_task_frame, state="readonly", width=40)
+        self.bulk_task.pack(side=tk.LEFT, padx=5)
+        self.bulk_tasks = {}  # texto del desplegable -> task_id
+        
+        bulk_qty_frame = ttk.Frame(self.bulk_frame)
+        bulk_qty_frame.pack(anchor="w", pady=5)
+        ttk.Label(bulk_qty_frame, text="Cantidad (litros):").pack(side=tk.LEFT, padx=5)
+        self.bulk_qty_entry = ttk.Entry(bulk_qty_frame, width=10)
+        self.bulk_qty_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Button(bulk_qty_frame, text="Registrar Uso", command=self.bulk_register_usage).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(self.bulk_frame, text="Registrar Mantenimiento",
+                   command=self.bulk_register_maintenance).pack(anchor="w", padx=5, pady=5)
     
     def refresh_machine_list(self):
-        # Limpiamos la Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Insertamos las máquinas en la Treeview con sus 3 columnas
-        for idx, machine in enumerate(self.machines):
-            if machine.machine_type in MACHINE_TYPES:
-                mtype = MACHINE_TYPES[machine.machine_type]['display_name']
-            else:
-                mtype = "Personalizada"
-            
-            self.tree.insert(
-                "", "end",
-                iid=idx,
-                values=(machine.name, mtype, machine.start_date)
-            )
+        # Solo se aplican a la Treeview las filas que cambiaron en el modelo.
+        # La iid de cada fila es la clave estable de la máquina, no su posición.
+        changes = self.machines.pop_changes()
+        paged = len(self.machines) > TREE_PAGE_SIZE
+        if (not self.tree_loaded or paged or self.tree_paged or self.filtered is not None
+                or self.fill_job is not None):
+            # En modo paginado, con filtros o a medio rellenar basta con volver
+            # a pintar lo visible.
+            self.populate_tree()
+            return
+        
+        if any(op == "reset" for op, _ in changes):
+            self.populate_tree()
+            return
+        
+        for op, key in changes:
+            if op == "insert":
+                self.insert_tree_row(key)
+            elif op == "update":
+                if self.tree.exists(key):
+                    self.tree.item(key, values=self.tree_row_values(key))
+            elif op == "delete":
+                if self.tree.exists(key):
+                    self.tree.delete(key)
     
-    def on_machine_select(self, event):
+    def populate_tree(self):
+        # Materializa como items de Tk solo las filas visibles: toda la flota
+        # o, si es muy grande, la página actual. Las filas se insertan por
+        # tramos (ver fill_tree_chunk).
+        if self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_job = None
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        
+        self.filtered = self.filtered_keys()
+        total = len(self.machines) if self.filtered is None else len(self.filtered)
+        self.tree_paged = total > TREE_PAGE_SIZE
+        if self.tree_paged:
+            pages = (total + TREE_PAGE_SIZE - 1) // TREE_PAGE_SIZE
+            self.page = max(0, min(self.page, pages - 1))
+            start = self.page * TREE_PAGE_SIZE
+            end = min(start + TREE_PAGE_SIZE, total)
+            self.page_label.config(text=f"Página {self.page + 1} de {pages}")
+            self.page_frame.pack(after=self.tree_frame, pady=5)
+        else:
+            start, end = 0, total
+            self.page_frame.pack_forget()
+        
+        self.fill_keys = self.machines.keys(start, end) if self.filtered is None else self.filtered[start:end]
+        self.fill_pos = 0
+        self.tree_loaded = True
+        self.fill_tree_chunk()
+    
+    def fill_tree_chunk(self):
+        # Inserta TREE_CHUNK_SIZE filas y programa el siguiente tramo, para que
+        # la ventana siga respondiendo mientras se rellena el listado.
+        self.fill_job = None
+        keys = self.fill_keys
+        end = min(self.fill_pos + TREE_CHUNK_SIZE, len(keys))
+        for key in keys[self.fill_pos:end]:
+            if key in self.machines:  # pudo borrarse entre dos tramos
+                self.insert_tree_row(key)
+        self.fill_pos = end
+        if end < len(keys):
+            if not self.progress_frame.winfo_ismapped():
+                self.progress_label.config(text="Cargando listado...")
+                self.progress.config(mode="determinate", maximum=len(keys))
+                self.progress_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+            self.progress.config(value=end)
+            self.fill_job = self.root.after(1, self.fill_tree_chunk)
+        else:
+            self.fill_keys = None
+            self.progress_frame.pack_forget()
+    
+    def finish_tree_fill(self):
+        # Completa en el acto el relleno pendiente, p. ej. antes de seleccionar una fila.
+        while self.fill_job is not None:
+            self.root.after_cancel(self.fill_job)
+            self.fill_tree_chunk()
+    
+    def filtered_keys(self):
+        text = self.search_var.get()
+        machine_type = self.type_filters.get(self.type_filter.get())
+        status = STATUS_FILTERS.get(self.status_filter.get())
+        if not text.strip() and machine_type is None and status is None:
+            return None
+        return self.search.search(text, machine_type, status)
+    
+    def schedule_filter(self):
+        # Se filtra cuando se deja de escribir: cada pulsación solo reprograma
+        # el filtrado, así que escribir nunca bloquea la interfaz.
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(SEARCH_DEBOUNCE_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        self.filter_job = None
+        self.page = 0
+        self.populate_tree()
+    
+    def clear_filters(self):
+        self.reset_filters()
+        self.apply_filter()
+    
+    def reset_filters(self):
+        # Vacía los filtros sin volver a pintar el listado.
+        self.search_var.set("")
+        self.type_filter.current(0)
+        self.status_filter.current(0)
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+        self.filtered = None
+    
+    def update_type_filter(self):
+        # Los tipos del desplegable son los que tienen alguna máquina.
+        types = sorted(self.machines.machine_types(), key=lambda t: TYPE_DISPLAY_NAMES.get(t, t or ""))
+        self.type_filters = {ALL_TYPES: None}
+        for machine_type in types:
+            self.type_filters[TYPE_DISPLAY_NAMES.get(machine_type, machine_type or "Personalizada")] = machine_type
+        self.type_filter["values"] = list(self.type_filters)
+    
+    def change_page(self, step):
+        self.page += step
+        self.populate_tree()
+    
+    def tree_row_values(self, key):
+        name, machine_type, start_date = self.machines.summary(key)
+        return (name, TYPE_DISPLAY_NAMES.get(machine_type, "Personalizada"), start_date)
+    
+    def insert_tree_row(self, key):
+        self.tree.insert("", "end", iid=key, values=self.tree_row_values(key))
+    
+    def selected_keys(self):
+        # La iid de la fila es la clave de la máquina.
+        return list(self.tree.selection())
+    
+    def selected_key(self):
+        # Clave de la máquina seleccionada; None si no hay ninguna o hay varias.
         selected = self.tree.selection()
-        if selected:
-            idx = int(selected[0])
-            self.show_machine_details(idx)
+        if len(selected) != 1:
+            return None
+        return selected[0]
     
-    def show_machine_details(self, idx):
-        for widget in self.details_frame.winfo_children():
-            widget.destroy()
-        machine = self.machines[idx]
+    def on_machine_select(self, event):
+        keys = self.selected_keys()
+        if keys:
+            self.show_selection(keys)
+    
+    def show_selection(self, keys):
+        if len(keys) == 1:
+            self.show_machine_details(keys[0])
+        elif keys:
+            self.show_bulk_panel(keys)
+        else:
+            self.hide_machine_details()
+    
+    def show_machine_details(self, key):
+        # Los widgets del panel se crean una vez y se reutilizan: aquí solo se
+        # actualizan textos y comandos, y las pestañas salen de un pool por tipo.
+        machine = self.machines[key]
         
         # Determinamos el tipo para mostrar en la etiqueta
-        if machine.machine_type in MACHINE_TYPES:
-            type_display = MACHINE_TYPES[machine.machine_type]['display_name']
-        else:
-            type_display = machine.machine_type
+        type_display = TYPE_DISPLAY_NAMES.get(machine.machine_type, machine.machine_type)
         
-        header_text = f"{machine.name} | Tipo: {type_display} | Inicio: {machine.start_date}"
-        header_label = ttk.Label(self.details_frame, text=header_text, style="Header.TLabel")
-        header_label.pack(anchor="w", pady=5)
+        header = f"{machine.name} | Tipo: {type_display} | Inicio: {machine.start_date}"
+        if machine.site is not None:
+            header += f" | Sede: {machine.site}"
+        self.details_header.config(text=header)
+        self.manage_tasks_btn.config(command=lambda: self.open_manage_tasks(key))
+        self.bulk_frame.pack_forget()
+        self.details_header.pack(anchor="w", pady=5)
+        self.manage_tasks_btn.pack(anchor="e", pady=5)
         
-        # Botón para gestionar tareas personalizadas
-        manage_tasks_btn = ttk.Button(
-            self.details_frame,
-            text="Gestionar Tareas",
-            command=lambda: self.open_manage_tasks(idx)
-        )
-        manage_tasks_btn.pack(anchor="e", pady=5)
+        # Se devuelven al pool las pestañas de la máquina anterior
+        for tab in self.task_tabs.values():
+            self.notebook.forget(tab)
+            self.tab_pool[tab.has_usage].append(tab)
+        self.task_tabs = {}
         
         # Si existen tareas, se muestran en un Notebook; si no, se muestra un aviso.
         if machine.maintenance_tasks:
-            notebook = ttk.Notebook(self.details_frame)
-            notebook.pack(fill=tk.BOTH, expand=True, pady=10)
-            
+            self.no_tasks_label.pack_forget()
             for task_id, task in machine.maintenance_tasks.items():
-                tab = ttk.Frame(notebook, padding=10)
-                notebook.add(tab, text=task.name)
-                
-                info = "Último mantenimiento: "
-                if task.last_date:
-                    dt_last = datetime.strptime(task.last_date, "%Y-%m-%d")
-                    days_elapsed = (datetime.now() - dt_last).days
-                    info += f"{task.last_date} ({days_elapsed} días atrás)"
-                else:
-                    info += "N/A"
-                
-                if task.has_usage:
-                    info += f"\nUso acumulado: {task.usage_count} litros\nThreshold uso: {task.threshold_usage} litros"
-                
-                info += f"\nThreshold tiempo: {task.threshold_days} días"
-                
-                info_label = ttk.Label(tab, text=info, font=('Segoe UI', 10))
-                info_label.pack(anchor="w", pady=5)
-                
-                if task.has_usage:
-                    qty_frame = ttk.Frame(tab)
-                    qty_frame.pack(anchor="w", pady=5)
-                    qty_label = ttk.Label(qty_frame, text="Cantidad (litros):")
-                    qty_label.pack(side=tk.LEFT, padx=5)
-                    qty_entry = ttk.Entry(qty_frame, width=10)
-                    qty_entry.pack(side=tk.LEFT, padx=5)
-                    
-                    reg_usage_btn = ttk.Button(
-                        qty_frame,
-                        text="Registrar Uso",
-                        command=lambda t_id=task_id, entry=qty_entry, m_idx=idx: self.register_usage(m_idx, t_id, entry)
-                    )
-                    reg_usage_btn.pack(side=tk.LEFT, padx=5)
-                
-                reg_maint_btn = ttk.Button(
-                    tab,
-                    text="Registrar Mantenimiento",
-                    command=lambda t_id=task_id, m_idx=idx: self.register_maintenance(m_idx, t_id)
+                pool = self.tab_pool[task.has_usage]
+                tab = pool.pop() if pool else TaskTab(self.notebook, task.has_usage)
+                self.notebook.add(tab, text=task.name)
+                tab.bind_task(
+                    task,
+                    machine.start_date,
+                    on_usage=lambda entry, t_id=task_id: self.register_usage(key, t_id, entry),
+                    on_maintenance=lambda t_id=task_id: self.register_maintenance(key, t_id)
                 )
-                reg_maint_btn.pack(pady=5)
+                self.task_tabs[task_id] = tab
+            self.notebook.select(0)
+            self.notebook.pack(fill=tk.BOTH, expand=True, pady=10)
         else:
-            no_tasks_label = ttk.Label(
-                self.details_frame,
-                text="No hay tareas definidas. Utiliza 'Gestionar Tareas' para agregarlas.",
-                font=('Segoe UI', 10, 'italic')
-            )
-            no_tasks_label.pack(pady=20)
+            self.notebook.pack_forget()
+            self.no_tasks_label.pack(pady=20)
+    
+    def refresh_task_tab(self, key, task_id):
+        # Tras registrar uso o mantenimiento solo cambia la pestaña de esa tarea.
+        machine = self.machines[key]
+        self.task_tabs[task_id].update_info(machine.maintenance_tasks[task_id], machine.start_date)
+    
+    def hide_machine_details(self):
+        for tab in self.task_tabs.values():
+            self.notebook.forget(tab)
+            self.tab_pool[tab.has_usage].append(tab)
+        self.task_tabs = {}
+        for widget in (self.details_header, self.manage_tasks_btn, self.notebook, self.no_tasks_label,
+                       self.bulk_frame):
+            widget.pack_forget()
+    
+    def show_bulk_panel(self, keys):
+        # Varias máquinas seleccionadas: en lugar del detalle se ofrecen las
+        # tareas que tienen (con cuántas máquinas la tiene cada una) y las
+        # acciones se aplican a todas las que tienen la tarea elegida.
+        selected_task = self.bulk_tasks.get(self.bulk_task.get())
+        self.hide_machine_details()
+        counts = {}  # task_id -> [nombre, máquinas]
+        for key in keys:
+            for task_id in self.machines.task_ids(key):
+                if task_id not in counts:
+                    counts[task_id] = [self.machines.task_name(key, task_id), 0]
+                counts[task_id][1] += 1
+        self.bulk_tasks = {}
+        for task_id, (name, count) in counts.items():
+            label = f"{name} ({count} máquinas)"
+            if label in self.bulk_tasks:
+                label = f"{name} [{task_id}] ({count} máquinas)"
+            self.bulk_tasks[label] = task_id
+        labels = list(self.bulk_tasks)
+        self.bulk_task["values"] = labels
+        if selected_task in counts:
+            self.bulk_task.current(list(counts).index(selected_task))
+        elif labels:
+            self.bulk_task.current(0)
+        else:
+            self.bulk_task.set("")
+        self.bulk_header.config(text=f"{len(keys)} máquinas seleccionadas")
+        self.bulk_frame.pack(fill=tk.X, anchor="w")
+    
+    def bulk_selection(self):
+        # (task_id elegido en el panel, claves seleccionadas que tienen esa tarea)
+        task_id = self.bulk_tasks.get(self.bulk_task.get())
+        if task_id is None:
+            messagebox.showwarning("Aviso", "Seleccione una tarea.", parent=self.root)
+            return None, []
+        return task_id, [key for key in self.selected_keys() if task_id in self.machines.task_ids(key)]
+    
+    def bulk_register_usage(self):
+        task_id, keys = self.bulk_selection()
+        if task_id is None:
+            return
+        quantity = self.bulk_qty_entry.get()
+        if not quantity:
+            messagebox.showwarning("Aviso", "Debes ingresar una cantidad.", parent=self.root)
+            return
+        # El uso solo cuenta en las máquinas donde la tarea lleva contador.
+        keys = [key for key in keys if self.machines.task_record(key, task_id)["has_usage"]]
+        if not keys:
+            messagebox.showwarning("Aviso", "La tarea no usa contador en las máquinas seleccionadas.",
+                                   parent=self.root)
+            return
+        try:
+            self.machines.bulk_register_usage([(key, task_id, quantity) for key in keys])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=self.root)
+            return
+        self.bulk_qty_entry.delete(0, tk.END)
+        
+        messagebox.showinfo(
+            "Uso Registrado",
+            f"Se han registrado {quantity} litros para la tarea en {len(keys)} máquinas.",
+            parent=self.root
+        )
+    
+    def bulk_register_maintenance(self):
+        task_id, keys = self.bulk_selection()
+        if task_id is None:
+            return
+        self.machines.bulk_register_maintenance([(key, task_id) for key in keys])
+        
+        messagebox.showinfo(
+            "Mantenimiento Registrado",
+            f"Mantenimiento registrado para la tarea en {len(keys)} máquinas.",
+            parent=self.root
+        )
+    
+    def show_due_tasks(self):
+        DueTasksDialog(self.root, self.machines, on_select=self.select_machine)
+    
+    def show_alerts(self):
+        if self.alerts_dialog is not None and self.alerts_dialog.winfo_exists():
+            self.alerts_dialog.lift()
+            return
+        self.alerts_dialog = AlertsDialog(self.root, self.machines, self.alerts, on_select=self.select_machine)
+    
+    def on_alerts_change(self, new):
+        # Sin ventanas modales: el aviso es un botón en la cabecera y un pitido.
+        count = len(self.alerts.alerts())
+        if count:
+            self.alerts_btn.config(text=f"⚠ {count} avisos" if count > 1 else "⚠ 1 aviso")
+            self.alerts_btn.pack(side=tk.RIGHT)
+        else:
+            self.alerts_btn.pack_forget()
+        if new:
+            self.root.bell()
+        if self.alerts_dialog is not None and self.alerts_dialog.winfo_exists():
+            self.alerts_dialog.refresh()
     
-    def open_manage_tasks(self, machine_idx):
-        ManageTasksDialog(self.root, self.machines[machine_idx], callback=lambda: self.after_manage_tasks(machine_idx))
+    def select_machine(self, key):
+        self.finish_tree_fill()
+        if not self.tree.exists(key):
+            # Se quitan los filtros que la ocultan y se va a su página.
+            if self.filtered is not None and key not in self.filtered:
+                self.reset_filters()
+            if self.filtered is None:
+                self.page = self.machines.position(key) // TREE_PAGE_SIZE
+            else:
+                self.page = self.filtered.index(key) // TREE_PAGE_SIZE
+            self.populate_tree()
+            self.finish_tree_fill()
+        self.tree.selection_set(key)
+        self.tree.see(key)
+    
+    def open_manage_tasks(self, key):
+        ManageTasksDialog(self.root, self.machines[key], callback=lambda: self.after_manage_tasks(key),
+                          on_propagate=lambda dialog, task_id: self.propagate_task(dialog, key, task_id))
+    
+    def propagate_task(self, dialog, key, task_id):
+        # Copia la definición de la tarea a las demás máquinas del mismo tipo
+        # que la tienen, sin pasar por ellas una a una.
+        machine = self.machines[key]
+        task = machine.maintenance_tasks[task_id]
+        others = [
+            other for other in self.machines.keys_by_type(machine.machine_type)
+            if other != key and task_id in self.machines.task_ids(other)
+        ]
+        if not others:
+            messagebox.showinfo("Aviso", "Ninguna otra máquina de este tipo tiene esta tarea.", parent=dialog)
+            return
+        type_display = TYPE_DISPLAY_NAMES.get(machine.machine_type, machine.machine_type)
+        if not messagebox.askyesno(
+            "Confirmar",
+            f"¿Aplicar la definición de '{task.name}' a las {len(others)} máquinas de tipo {type_display} "
+            f"que tienen esta tarea?\nSe conservan el uso acumulado y el último mantenimiento de cada una.",
+            parent=dialog
+        ):
+            return
+        # Primero se guarda la definición editada en esta máquina.
+        self.machines.update_machine(key)
+        fields = {field: getattr(task, field) for field in TaskTemplate._fields}
+        changed = self.machines.propagate_task_definition(machine.machine_type, task_id, fields)
+        messagebox.showinfo(
+            "Tarea Aplicada",
+            f"Definición aplicada a {changed} máquinas ({len(others) - changed} ya la tenían).",
+            parent=dialog
+        )
     
-    def after_manage_tasks(self, machine_idx):
-        self.save_all_data()
-        self.show_machine_details(machine_idx)
+    def after_manage_tasks(self, key):
+        self.machines.update_machine(key)
+        self.show_machine_details(key)
     
     def add_machine(self):
         name = simpledialog.askstring("Nueva Máquina", "Introduce el nombre de la máquina:", parent=self.root)
@@ -282,8 +808,7 @@ class MaintenanceApp:
                 start_date = datetime.now().strftime("%Y-%m-%d")
         
         new_machine = Machine(name, machine_type, start_date)
-        self.machines.append(new_machine)
-        self.save_all_data()
+        self.machines.add_machine(new_machine)
         self.refresh_machine_list()
         
         messagebox.showinfo(
@@ -293,75 +818,162 @@ class MaintenanceApp:
         )
     
     def remove_machine(self):
-        selected = self.tree.selection()
-        if not selected:
+        keys = self.selected_keys()
+        if not keys:
             messagebox.showwarning("Aviso", "Seleccione una máquina para eliminar.", parent=self.root)
             return
         
-        idx = int(selected[0])
-        machine = self.machines[idx]
+        if len(keys) == 1:
+            question = f"¿Está seguro de eliminar la máquina '{self.machines.summary(keys[0])[0]}'?"
+        else:
+            question = f"¿Está seguro de eliminar las {len(keys)} máquinas seleccionadas?"
         
-        if messagebox.askyesno("Confirmar", f"¿Está seguro de eliminar la máquina '{machine.name}'?", parent=self.root):
-            del self.machines[idx]
-            self.save_all_data()
+        if messagebox.askyesno("Confirmar", question, parent=self.root):
+            self.machines.remove_machines(keys)
             self.refresh_machine_list()
             
             # Limpia el panel de detalles si la máquina eliminada estaba seleccionada
-            for widget in self.details_frame.winfo_children():
-                widget.destroy()
+            self.hide_machine_details()
             
-            messagebox.showinfo("Eliminada", "Máquina eliminada.", parent=self.root)
+            message = "Máquina eliminada." if len(keys) == 1 else f"{len(keys)} máquinas eliminadas."
+            messagebox.showinfo("Eliminada", message, parent=self.root)
     
-    def register_usage(self, machine_idx, task_id, entry):
+    def import_usage_file(self):
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Importar uso",
+            filetypes=[("CSV o JSONL", "*.csv *.jsonl *.ndjson"), ("Todos los archivos", "*.*")]
+        )
+        if not path:
+            return
+        
+        try:
+            report = import_usage(self.machines, path)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo leer el archivo:\n{e}", parent=self.root)
+            return
+        
+        key = self.selected_key()
+        if key is not None:
+            self.show_machine_details(key)
+        if report.error is not None:
+            messagebox.showerror("Importación incompleta", report.summary(), parent=self.root)
+            return
+        messagebox.showinfo("Uso Importado", report.summary(), parent=self.root)
+    
+    def register_usage(self, key, task_id, entry):
         quantity = entry.get()
         if not quantity:
             messagebox.showwarning("Aviso", "Debes ingresar una cantidad.", parent=self.root)
             return
         
         try:
-            self.machines[machine_idx].register_usage(task_id, quantity)
+            self.machines.register_usage(key, task_id, quantity)
         except ValueError as e:
             messagebox.showerror("Error", str(e), parent=self.root)
             return
         
-        self.save_all_data()
-        self.show_machine_details(machine_idx)
+        entry.delete(0, tk.END)
+        self.refresh_task_tab(key, task_id)
         
         messagebox.showinfo(
             "Uso Registrado",
-            f"Se han registrado {quantity} litros para la tarea en {self.machines[machine_idx].name}.",
+            f"Se han registrado {quantity} litros para la tarea en {self.machines[key].name}.",
             parent=self.root
         )
     
-    def register_maintenance(self, machine_idx, task_id):
-        self.machines[machine_idx].register_maintenance(task_id)
-        self.save_all_data()
-        self.show_machine_details(machine_idx)
+    def register_maintenance(self, key, task_id):
+        self.machines.register_maintenance(key, task_id)
+        self.refresh_task_tab(key, task_id)
         
         messagebox.showinfo(
             "Mantenimiento Registrado",
-            f"Mantenimiento registrado para la tarea en {self.machines[machine_idx].name}.",
+            f"Mantenimiento registrado para la tarea en {self.machines[key].name}.",
             parent=self.root
         )
+
+
+# --- Pestaña de tarea del panel de detalles ---
+
+class TaskTab(ttk.Frame):
+    # Pestaña reutilizable: los widgets dependen solo de si la tarea usa
+    # contador; al cambiar de tarea se actualizan texto y comandos.
+    def __init__(self, parent, has_usage):
+        super().__init__(parent, padding=10)
+        self.has_usage = has_usage
+        self.on_usage = None
+        self.on_maintenance = None
+        
+        self.info_label = ttk.Label(self, font=('Segoe UI', 10))
+        self.info_label.pack(anchor="w", pady=5)
+        
+        if has_usage:
+            qty_frame = ttk.Frame(self)
+            qty_frame.pack(anchor="w", pady=5)
+            qty_label = ttk.Label(qty_frame, text="Cantidad (litros):")
+            qty_label.pack(side=tk.LEFT, padx=5)
+            self.qty_entry = ttk.Entry(qty_frame, width=10)
+            self.qty_entry.pack(side=tk.LEFT, padx=5)
+            
+            reg_usage_btn = ttk.Button(
+                qty_frame,
+                text="Registrar Uso",
+                command=lambda: self.on_usage(self.qty_entry)
+            )
+            reg_usage_btn.pack(side=tk.LEFT, padx=5)
+        
+        reg_maint_btn = ttk.Button(
+            self,
+            text="Registrar Mantenimiento",
+            command=lambda: self.on_maintenance()
+        )
+        reg_maint_btn.pack(pady=5)
     
-    def save_all_data(self):
-        data_to_save = {"machines": [machine.to_dict() for machine in self.machines]}
-        DataManager.save_data(data_to_save)
+    def bind_task(self, task, start_date, on_usage, on_maintenance):
+        self.on_usage = on_usage
+        self.on_maintenance = on_maintenance
+        if self.has_usage:
+            self.qty_entry.delete(0, tk.END)
+        self.update_info(task, start_date)
+    
+    def update_info(self, task, start_date):
+        info = "Último mantenimiento: "
+        if task.last_date:
+            dt_last = datetime.strptime(task.last_date, "%Y-%m-%d")
+            days_elapsed = (datetime.now() - dt_last).days
+            info += f"{task.last_date} ({days_elapsed} días atrás)"
+        else:
+            info += "N/A"
+        
+        if task.has_usage:
+            info += f"\nUso acumulado: {task.usage_count} litros\nThreshold uso: {task.threshold_usage} litros"
+        
+        info += f"\nThreshold tiempo: {task.threshold_days} días"
+        
+        due = task.due_date(start_date)
+        if due:
+            info += f"\nPróximo vencimiento: {due.isoformat()}"
+        
+        self.info_label.config(text=info)
 
 
 # --- Diálogos para gestionar tareas personalizadas ---
 
 class ManageTasksDialog(tk.Toplevel):
-    def __init__(self, parent, machine: Machine, callback=None):
+    def __init__(self, parent, machine: Machine, callback=None, on_propagate=None):
         super().__init__(parent)
         self.title("Gestionar Tareas")
         self.machine = machine
         self.callback = callback
+        # on_propagate(diálogo, task_id): aplica la tarea a las demás máquinas del tipo
+        self.on_propagate = on_propagate
         self.geometry("600x400")
         self.transient(parent)
         self.grab_set()
         self.lift(parent)
         self.focus_force()
+        # Cerrar con la X de la ventana también guarda los cambios de las tareas.
+        self.protocol("WM_DELETE_WINDOW", self.close)
         self.create_widgets()
         self.refresh_task_list()
     
@@ -396,6 +1008,10 @@ class ManageTasksDialog(tk.Toplevel):
         del_btn = ttk.Button(btn_frame, text="Eliminar Tarea", command=self.delete_task)
         del_btn.pack(side=tk.LEFT, padx=5)
         
+        if self.on_propagate is not None:
+            propagate_btn = ttk.Button(btn_frame, text="Aplicar a todas del tipo", command=self.propagate_task)
+            propagate_btn.pack(side=tk.LEFT, padx=5)
+        
         close_btn = ttk.Button(btn_frame, text="Cerrar", command=self.close)
         close_btn.pack(side=tk.LEFT, padx=5)
     
@@ -412,8 +1028,8 @@ class ManageTasksDialog(tk.Toplevel):
         dialog = TaskDialog(self, title="Agregar Tarea")
         self.wait_window(dialog)
         if dialog.result:
-            task_id = f"{dialog.result['name']}_{int(datetime.now().timestamp())}"
-            from maintenance_task import MaintenanceTask
+            from maintenance_task import MaintenanceTask, new_task_id
+            task_id = new_task_id(dialog.result["name"], self.machine.maintenance_tasks)
             
             new_task = MaintenanceTask(
                 task_id=task_id,
@@ -460,12 +1076,238 @@ class ManageTasksDialog(tk.Toplevel):
             self.machine.remove_maintenance_task(task_id)
             self.refresh_task_list()
     
+    def propagate_task(self):
+        selected = self.tasks_tree.selection()
+        if not selected:
+            messagebox.showwarning("Aviso", "Seleccione una tarea para aplicar.", parent=self)
+            return
+        self.on_propagate(self, selected[0])
+    
     def close(self):
         if self.callback:
             self.callback()
         self.destroy()
 
 
+class DueTasksDialog(tk.Toplevel):
+    # Tareas vencidas o que vencen en los próximos DUE_SOON_DAYS días, de la más
+    # vencida a la menos, leídas directamente del índice de vencimientos.
+    MAX_ROWS = 500
+    
+    def __init__(self, parent, fleet, on_select=None):
+        super().__init__(parent)
+        self.title("Vencimientos")
+        self.fleet = fleet
+        self.on_select = on_select
+        self.geometry("600x400")
+        self.transient(parent)
+        self.create_widgets()
+        self.refresh()
+    
+    def create_widgets(self):
+        self.due_tree = ttk.Treeview(
+            self,
+            columns=("Machine", "Task", "Due", "Status"),
+            show="headings",
+            selectmode="browse"
+        )
+        self.due_tree.heading("Machine", text="Máquina")
+        self.due_tree.heading("Task", text="Tarea")
+        self.due_tree.heading("Due", text="Vence")
+        self.due_tree.heading("Status", text="Estado")
+        
+        self.due_tree.column("Machine", width=150)
+        self.due_tree.column("Task", width=180)
+        self.due_tree.column("Due", width=100, anchor="center")
+        self.due_tree.column("Status", width=120, anchor="center")
+        
+        self.due_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.due_tree.bind("<Double-1>", self.on_double_click)
+        
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(pady=5)
+        ttk.Button(btn_frame, text="Actualizar", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=self.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def refresh(self):
+        for item in self.due_tree.get_children():
+            self.due_tree.delete(item)
+        
+        today = datetime.now().date()
+        entries = self.fleet.due_index.due_within(DUE_SOON_DAYS, today)[:self.MAX_ROWS]
+        for row, (usage_pending, deadline, machine_key, task_id) in enumerate(entries):
+            due = date.fromordinal(deadline).isoformat() if deadline != NO_DEADLINE else "-"
+            if usage_pending == 0:
+                status = "Uso alcanzado"
+            elif deadline <= today.toordinal():
+                status = "Vencida"
+            else:
+                status = "Próxima"
+            self.due_tree.insert(
+                "", "end",
+                iid=row,
+                values=(self.fleet.summary(machine_key)[0], self.fleet.task_name(machine_key, task_id), due, status),
+                tags=(machine_key,)
+            )
+    
+    def on_double_click(self, event):
+        selected = self.due_tree.selection()
+        if selected and self.on_select:
+            # La máquina puede haberse borrado desde que se abrió el diálogo.
+            key = str(self.due_tree.item(selected[0], "tags")[0])
+            if key in self.fleet:
+                self.on_select(key)
+
+
+class AlertsDialog(tk.Toplevel):
+    # Tareas que han pasado a estar vencidas mientras la aplicación estaba
+    # abierta (ver due_alerts.py). No es modal: se actualiza sola con cada aviso.
+    def __init__(self, parent, fleet, alerts, on_select=None):
+        super().__init__(parent)
+        self.title("Avisos")
+        self.fleet = fleet
+        self.alerts = alerts
+        self.on_select = on_select
+        self.geometry("600x300")
+        self.transient(parent)
+        self.create_widgets()
+        self.refresh()
+    
+    def create_widgets(self):
+        self.alert_tree = ttk.Treeview(
+            self,
+            columns=("Machine", "Task", "Status", "Time"),
+            show="headings",
+            selectmode="extended"
+        )
+        self.alert_tree.heading("Machine", text="Máquina")
+        self.alert_tree.heading("Task", text="Tarea")
+        self.alert_tree.heading("Status", text="Estado")
+        self.alert_tree.heading("Time", text="Desde")
+        
+        self.alert_tree.column("Machine", width=150)
+        self.alert_tree.column("Task", width=180)
+        self.alert_tree.column("Status", width=120, anchor="center")
+        self.alert_tree.column("Time", width=130, anchor="center")
+        
+        self.alert_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.alert_tree.bind("<Double-1>", self.on_double_click)
+        
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(pady=5)
+        ttk.Button(btn_frame, text="Descartar", command=self.dismiss).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Descartar todos", command=self.alerts.clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=self.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def refresh(self):
+        for item in self.alert_tree.get_children():
+            self.alert_tree.delete(item)
+        # (clave, task_id) de cada fila, por su posición.
+        self.rows = []
+        for row, alert in enumerate(self.alerts.alerts()):
+            status = "Uso alcanzado" if alert["status"] == STATUS_USAGE else "Vencida"
+            self.alert_tree.insert(
+                "", "end",
+                iid=row,
+                values=(alert["machine"], alert["task"], status, alert["time"].replace("T", " "))
+            )
+            self.rows.append((alert["machine_id"], alert["task_id"]))
+    
+    def dismiss(self):
+        # Cada descarte vuelve a rellenar la lista: primero se toman todas.
+        for key, task_id in [self.rows[int(item)] for item in self.alert_tree.selection()]:
+            self.alerts.dismiss(key, task_id)
+    
+    def on_double_click(self, event):
+        selected = self.alert_tree.selection()
+        if selected and self.on_select:
+            # La máquina puede haberse borrado desde que llegó el aviso.
+            key = self.rows[int(selected[0])][0]
+            if key in self.fleet:
+                self.on_select(key)
+
+
+class DiagnosticsDialog(tk.Toplevel):
+    # Estadísticas de instrumentation.py: llamadas, tiempos y bytes por operación.
+    COLUMNS = (
+        ("count", "Llamadas", 70),
+        ("total_ms", "Total ms", 80),
+        ("mean_ms", "Media ms", 75),
+        ("p50_ms", "p50 ms", 70),
+        ("p90_ms", "p90 ms", 70),
+        ("p99_ms", "p99 ms", 70),
+        ("max_ms", "Máx ms", 70),
+        ("bytes_read", "Leídos", 90),
+        ("bytes_written", "Escritos", 90)
+    )
+    
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Diagnóstico")
+        self.geometry("980x400")
+        self.transient(parent)
+        self.create_widgets()
+        self.refresh()
+    
+    def create_widgets(self):
+        if not instrumentation.ENABLED:
+            ttk.Label(
+                self,
+                text="La medición está desactivada. Para activarla, arranque con COFFEE_INSTRUMENT=1 "
+                     "o ponga INSTRUMENTATION_ENABLED = True en config.py.",
+                wraplength=900
+            ).pack(padx=10, pady=(10, 0), anchor="w")
+        
+        self.stats_tree = ttk.Treeview(
+            self,
+            columns=tuple(key for key, _, _ in self.COLUMNS),
+            show="tree headings",
+            selectmode="browse"
+        )
+        self.stats_tree.heading("#0", text="Operación")
+        self.stats_tree.column("#0", width=220)
+        for key, text, width in self.COLUMNS:
+            self.stats_tree.heading(key, text=text)
+            self.stats_tree.column(key, width=width, anchor="e")
+        self.stats_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        btn_frame = ttk.Frame(self)
+        btn_frame.pack(pady=5)
+        ttk.Button(btn_frame, text="Actualizar", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Reiniciar", command=self.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Guardar JSON...", command=self.save).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cerrar", command=self.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def refresh(self):
+        for item in self.stats_tree.get_children():
+            self.stats_tree.delete(item)
+        for name, stat in instrumentation.stats().items():
+            values = [
+                stat[key] if key in ("count", "bytes_read", "bytes_written") else f"{stat[key]:.2f}"
+                for key, _, _ in self.COLUMNS
+            ]
+            self.stats_tree.insert("", "end", text=name, values=values)
+    
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
+    
+    def save(self):
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            title="Guardar estadísticas",
+            defaultextension=".json",
+            initialfile=INSTRUMENTATION_FILE,
+            filetypes=[("JSON", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            instrumentation.dump(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo guardar: {e}", parent=self)
+
+
 class TaskDialog(tk.Toplevel):
     def __init__(self, parent, title="Nueva Tarea", task=None):
         super().__init__(parent)
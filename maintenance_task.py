@@ -1,15 +1,161 @@
 # maintenance_task.py
-from datetime import datetime
+import re
+import unicodedata
+import uuid
+from collections import namedtuple
+from datetime import datetime, date
+from config import MACHINE_TYPES
+
+# Ordinal usado como fecha límite de las tareas sin threshold de tiempo.
+NO_DEADLINE = date.max.toordinal()
+
+def compute_due_point(start_date, last_date, has_usage, threshold_days, threshold_usage, usage_count):
+    # Próximo vencimiento como tupla ordenable (uso_pendiente, ordinal_fecha_límite).
+    # La fecha límite es last_date (o el inicio de la máquina) + threshold_days; las
+    # tareas que ya alcanzaron threshold_usage llevan 0 y quedan por delante del resto.
+    base = last_date or start_date
+    if base and threshold_days is not None:
+        deadline = date.fromisoformat(base).toordinal() + int(threshold_days)
+    else:
+        deadline = NO_DEADLINE
+    usage_reached = has_usage and threshold_usage is not None and (usage_count or 0) >= threshold_usage
+    return (0 if usage_reached else 1, deadline)
+
+# Definición compartida de una tarea predeterminada de MACHINE_TYPES. Las
+# tareas que la usan solo guardan lo que difiere de ella, tanto en memoria como
+# en los datos guardados: en los registros se omiten los campos iguales a la
+# plantilla del tipo de máquina (ver expand_task).
+TaskTemplate = namedtuple("TaskTemplate", ["name", "has_usage", "threshold_days", "threshold_usage"])
+
+def _build_templates():
+    templates = {}
+    for machine_type, type_config in MACHINE_TYPES.items():
+        for task_id, config in type_config.get("maintenance", {}).items():
+            has_usage = config.get("has_usage", False)
+            templates[(machine_type, task_id)] = TaskTemplate(
+                config["name"], has_usage, config.get("threshold_days"),
+                config.get("threshold_usage") if has_usage else None
+            )
+    return templates
+
+_TEMPLATES = _build_templates()
+_TEMPLATE_DICTS = {key: template._asdict() for key, template in _TEMPLATES.items()}
+# Campos de estado, que nunca vienen de la plantilla.
+_STATE_FIELDS = frozenset(("last_date", "usage_count", "history_id"))
+
+def new_task_id(name, existing=()):
+    # Id de una tarea nueva: el nombre normalizado más un sufijo aleatorio, para
+    # que no choque con otra tarea de la máquina aunque se creen varias con el
+    # mismo nombre en el mismo segundo.
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    slug = re.sub(r"[^a-z0-9]+", "_", ascii_name.lower()).strip("_") or "tarea"
+    while True:
+        task_id = f"{slug}_{uuid.uuid4().hex[:8]}"
+        if task_id not in existing:
+            return task_id
+
+def task_template(machine_type, task_id):
+    return _TEMPLATES.get((machine_type, task_id))
+
+def expand_task(machine_type, task_id, data):
+    # Diccionario de la tarea con todos sus campos, completando con la plantilla.
+    defaults = _TEMPLATE_DICTS.get((machine_type, task_id))
+    if defaults is None:
+        return data
+    return {**defaults, **data}
+
+def compact_task(machine_type, task_id, data):
+    # Inversa de expand_task: quita los campos iguales a la plantilla.
+    defaults = _TEMPLATE_DICTS.get((machine_type, task_id))
+    if defaults is None:
+        return data
+    return {field: value for field, value in data.items() if field not in defaults or defaults[field] != value}
+
+def task_field(machine_type, task_id, data, field):
+    if field in data:
+        return data[field]
+    template = _TEMPLATES.get((machine_type, task_id))
+    return getattr(template, field) if template is not None else None
+
+def _template_field(field):
+    def get(self):
+        overrides = self._overrides
+        if overrides is not None and field in overrides:
+            return overrides[field]
+        return getattr(self.template, field)
+
+    def set(self, value):
+        self._set_field(field, value)
+    return property(get, set)
 
 class MaintenanceTask:
-    def __init__(self, task_id, name, has_usage, threshold_days, threshold_usage=None, last_date=None, usage_count=0):
+    # name, has_usage, threshold_days y threshold_usage se leen de la plantilla
+    # salvo los que se hayan cambiado, que van en _overrides. Las tareas sin
+    # plantilla (personalizadas) los llevan todos en _overrides.
+    __slots__ = ("task_id", "template", "_overrides", "last_date", "usage_count", "history_id")
+
+    name = _template_field("name")
+    threshold_days = _template_field("threshold_days")
+    threshold_usage = _template_field("threshold_usage")
+
+    def __init__(self, task_id, name, has_usage, threshold_days, threshold_usage=None, last_date=None, usage_count=0,
+                 history_id=None, template=None):
         self.task_id = task_id  # Identificador único de la tarea
-        self.name = name
-        self.has_usage = has_usage
-        self.threshold_days = threshold_days
-        self.threshold_usage = threshold_usage if has_usage else None
+        self.template = template
+        self._overrides = None
+        self._set_field("name", name)
+        self._set_field("has_usage", has_usage)
+        self._set_field("threshold_days", threshold_days)
+        self._set_field("threshold_usage", threshold_usage if has_usage else None)
         self.last_date = last_date  # Fecha del último mantenimiento (YYYY-MM-DD)
         self.usage_count = usage_count if has_usage else None
+        self.history_id = history_id  # Serie de esta tarea en el historial de uso
+
+    @classmethod
+    def from_template(cls, task_id, template):
+        task = cls.__new__(cls)
+        task.task_id = task_id
+        task.template = template
+        task._overrides = None
+        task.last_date = None
+        task.usage_count = 0 if template.has_usage else None
+        task.history_id = None
+        return task
+
+    @property
+    def has_usage(self):
+        overrides = self._overrides
+        if overrides is not None and "has_usage" in overrides:
+            return overrides["has_usage"]
+        return self.template.has_usage
+
+    @has_usage.setter
+    def has_usage(self, value):
+        self._set_field("has_usage", value)
+        if not value:
+            self._set_field("threshold_usage", None)
+            self.usage_count = None
+        elif self.usage_count is None:
+            self.usage_count = 0
+
+    def use_template(self, template):
+        # Cambia de plantilla conservando los valores actuales.
+        values = (self.name, self.has_usage, self.threshold_days, self.threshold_usage)
+        self.template = template
+        self._overrides = None
+        for field, value in zip(TaskTemplate._fields, values):
+            self._set_field(field, value)
+
+    def _set_field(self, field, value):
+        if self.template is not None and getattr(self.template, field) == value:
+            if self._overrides is not None:
+                self._overrides.pop(field, None)
+                if not self._overrides:
+                    self._overrides = None
+        else:
+            if self._overrides is None:
+                self._overrides = {}
+            self._overrides[field] = value
 
     def register_usage(self, quantity):
         if self.has_usage:
@@ -24,19 +170,42 @@ class MaintenanceTask:
         if self.has_usage:
             self.usage_count = 0
 
-    def to_dict(self):
-        d = {"name": self.name,
-             "has_usage": self.has_usage,
-             "threshold_days": self.threshold_days,
-             "threshold_usage": self.threshold_usage,
-             "last_date": self.last_date}
+    def due_point(self, start_date=None):
+        return compute_due_point(start_date, self.last_date, self.has_usage, self.threshold_days,
+                                 self.threshold_usage, self.usage_count)
+
+    def due_date(self, start_date=None):
+        deadline = self.due_point(start_date)[1]
+        return None if deadline == NO_DEADLINE else date.fromordinal(deadline)
+
+    def to_dict(self, full=False):
+        # Sin full, solo los campos de la definición que difieren de la plantilla.
+        if full or self.template is None:
+            d = {"name": self.name,
+                 "has_usage": self.has_usage,
+                 "threshold_days": self.threshold_days,
+                 "threshold_usage": self.threshold_usage}
+        else:
+            d = dict(self._overrides) if self._overrides else {}
+        d["last_date"] = self.last_date
         if self.has_usage:
             d["usage_count"] = self.usage_count
+        if self.history_id is not None:
+            d["history_id"] = self.history_id
         return d
 
     @classmethod
-    def from_dict(cls, task_id, data):
-        # Se espera que en data estén almacenados todos los parámetros necesarios.
+    def from_dict(cls, task_id, data, template=None):
+        # Los campos que faltan en data se toman de la plantilla.
+        if template is not None:
+            if not data.keys() - _STATE_FIELDS:
+                task = cls.from_template(task_id, template)
+                task.last_date = data.get("last_date")
+                if task.usage_count is not None:
+                    task.usage_count = data.get("usage_count", 0)
+                task.history_id = data.get("history_id")
+                return task
+            data = {**template._asdict(), **data}
         return cls(
             task_id=task_id,
             name=data.get("name"),
@@ -44,5 +213,7 @@ class MaintenanceTask:
             threshold_days=data.get("threshold_days"),
             threshold_usage=data.get("threshold_usage"),
             last_date=data.get("last_date"),
-            usage_count=data.get("usage_count", 0)
+            usage_count=data.get("usage_count", 0),
+            history_id=data.get("history_id"),
+            template=template
         )
@@ -0,0 +1,150 @@
+# persistence_worker.py
+import threading
+import time
+from array import array
+from config import SAVE_COALESCE_SECONDS
+from data_manager import DataManager, with_versions
+
+class PersistenceWorker:
+    # Hilo que escribe en disco los cambios que le pasa la aplicación, para que
+    # el hilo de Tk nunca espere al disco. Las peticiones que llegan seguidas se
+    # agrupan en una sola escritura y, si hay varios snapshots pendientes, solo
+    # se escribe el último (ya incluye los cambios anteriores).
+    def __init__(self, coalesce_seconds=SAVE_COALESCE_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self._cond = threading.Condition()
+        # ("events", lista), ("snapshot", (datos, synced, sin confirmar)) o
+        # ("history", (historial, filas)), en orden.
+        self._pending = []
+        self._busy = False
+        self._queued_snapshots = 0
+        self._writing_snapshot = False
+        self._stopping = False
+        self._failed = False
+        self._errors = []
+        self._error_count = 0
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def submit_events(self, events, history=None, rows=None):
+        # rows: filas para history.write (UsageHistory) de estos cambios; se
+        # escriben después de ellos.
+        with self._cond:
+            self._pending.append(("events", list(events)))
+            if rows:
+                self._pending.append(("history", (history, rows)))
+            self._failed = False
+            self._cond.notify_all()
+
+    def submit_snapshot(self, data, synced, unconfirmed=None):
+        # unconfirmed: (cambios incluidos en `data` aún sin escribir, sedes de
+        # sus máquinas); una vez escritos se ponen sus versiones en `data`.
+        with self._cond:
+            self._pending.append(("snapshot", (data, synced, unconfirmed)))
+            self._queued_snapshots += 1
+            self._failed = False
+            self._cond.notify_all()
+
+    def snapshot_pending(self):
+        with self._cond:
+            return self._writing_snapshot or self._queued_snapshots > 0
+
+    def pop_errors(self):
+        # Errores de escritura pendientes de mostrar (se consultan desde el hilo de Tk).
+        with self._cond:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def flush(self, timeout=None):
+        # Espera a que todo lo pendiente esté escrito (reintentando lo que
+        # hubiera fallado). Devuelve False si falla o se agota el tiempo.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            error_count = self._error_count
+            self._failed = False
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                if self._error_count != error_count:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=None):
+        ok = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return ok
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Tras un fallo no se reintenta hasta recibir otra petición o un flush.
+                while (not self._pending or self._failed) and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            # Se deja un margen para que una ráfaga de cambios llegue completa.
+            time.sleep(self.coalesce_seconds)
+            with self._cond:
+                batch, self._pending = self._pending, []
+                self._busy = True
+                self._writing_snapshot = self._queued_snapshots > 0
+                self._queued_snapshots = 0
+            try:
+                self._write(batch)
+            except Exception as e:
+                with self._cond:
+                    # Solo se reintenta lo que no llegó a escribirse.
+                    self._pending = batch + self._pending
+                    self._queued_snapshots = sum(1 for kind, _ in self._pending if kind == "snapshot")
+                    self._errors.append(e)
+                    self._error_count += 1
+                    self._failed = True
+                    self._busy = False
+                    self._writing_snapshot = False
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._busy = False
+                self._writing_snapshot = False
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        # Va quitando de `batch` lo que escribe. Los cambios anteriores al último
+        # snapshot también se escriben en el journal: si otra estación escribió
+        # entretanto, el snapshot se descarta y son los que quedan.
+        # El historial de uso va al final: si falla el journal no quedan en el
+        # historial filas de cambios que no se guardaron.
+        batch.sort(key=lambda entry: entry[0] == "history")
+        history = sum(1 for kind, _ in batch if kind == "history")
+        last_snapshot = None
+        for i, (kind, _) in enumerate(batch):
+            if kind == "snapshot":
+                last_snapshot = i
+        if last_snapshot is not None:
+            events = [event for kind, events in batch[:last_snapshot] if kind == "events" for event in events]
+            if events:
+                DataManager.record_events(events)
+            del batch[:last_snapshot]
+            data, synced, unconfirmed = batch[0][1]
+            if unconfirmed is not None:
+                data = with_versions(data, *unconfirmed)
+            DataManager.compact(data, synced)
+            del batch[0]
+        events = [event for kind, events in batch if kind == "events" for event in events]
+        if events:
+            DataManager.record_events(events)
+        del batch[:len(batch) - history]
+        # Las filas de cada historial se escriben juntas, en una sola vez.
+        rows = {}
+        for _, (usage_history, entry_rows) in batch:
+            rows.setdefault(usage_history, array('d')).extend(entry_rows)
+        for usage_history, entry_rows in rows.items():
+            usage_history.write(entry_rows)
+            batch[:] = [entry for entry in batch if entry[1][0] is not usage_history]
+            usage_history.reserve_ids()
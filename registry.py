@@ -0,0 +1,125 @@
+# registry.py
+from itertools import islice
+
+
+class MachineRegistry:
+    # Máquinas de la flota por id, en orden de alta. Cada entrada guarda el
+    # registro tal como vino del backend o, una vez construido, el objeto
+    # Machine. Buscar, añadir y borrar por id son O(1), y los índices por
+    # nombre, por tipo y por sede evitan recorrer la flota para resolver un nombre.
+    def __init__(self, records=()):
+        self._records = {}  # id -> registro (None si ya hay objeto Machine)
+        self._machines = {}  # id -> Machine, solo las construidas
+        self._by_name = {}  # nombre -> {id: None}, en orden de alta
+        self._by_type = {}  # machine_type -> {id: None}
+        self._by_site = {}  # sede -> {id: None}
+        self._indexed = {}  # id -> (nombre, tipo, sede) con que está en los índices
+        for record in records:
+            self.add(record["id"], record=record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def add(self, key, record=None, machine=None):
+        if key in self._records:
+            raise ValueError(f"Ya existe una máquina con id {key}.")
+        self._records[key] = record
+        if machine is not None:
+            self._machines[key] = machine
+        self._index(key)
+
+    def remove(self, key):
+        del self._records[key]
+        self._machines.pop(key, None)
+        self._unindex(key)
+
+    def record(self, key):
+        # Registro sin hidratar, o None si la máquina ya está construida.
+        return self._records[key]
+
+    def machine(self, key):
+        return self._machines.get(key)
+
+    def set_machine(self, key, machine):
+        # A partir de aquí el objeto es la fuente de verdad.
+        self._machines[key] = machine
+        self._records[key] = None
+
+    def set_record(self, key, record):
+        self._records[key] = record
+        self._machines.pop(key, None)
+        self.reindex(key)
+
+    def summary(self, key):
+        # (nombre, tipo, inicio) sin hidratar la máquina.
+        machine = self._machines.get(key)
+        if machine is not None:
+            return machine.name, machine.machine_type, machine.start_date
+        record = self._records[key]
+        return record.get("name"), record.get("machine_type"), record.get("start_date")
+
+    def site(self, key):
+        machine = self._machines.get(key)
+        if machine is not None:
+            return machine.site
+        return self._records[key].get("site")
+
+    def keys(self, start=0, stop=None):
+        # Ids en orden de alta; con start/stop, solo ese tramo (p. ej. una página).
+        if start == 0 and stop is None:
+            return list(self._records)
+        return list(islice(self._records, start, stop))
+
+    def position(self, key):
+        # Posición en el orden de alta. Es O(n): solo para paginar la vista.
+        for position, other in enumerate(self._records):
+            if other == key:
+                return position
+        raise KeyError(key)
+
+    def by_name(self, name):
+        return list(self._by_name.get(name, ()))
+
+    def by_type(self, machine_type):
+        return list(self._by_type.get(machine_type, ()))
+
+    def by_site(self, site):
+        return list(self._by_site.get(site, ()))
+
+    def types(self):
+        return list(self._by_type)
+
+    def names(self):
+        # (id, nombre) de todas las máquinas, sin hidratarlas.
+        return [(key, name) for key, (name, _, _) in self._indexed.items()]
+
+    def reindex(self, key):
+        # Tras cambiar el nombre o el tipo de una máquina.
+        self._unindex(key)
+        self._index(key)
+
+    def _index(self, key):
+        machine = self._machines.get(key)
+        if machine is not None:
+            name, machine_type, site = machine.name, machine.machine_type, machine.site
+        else:
+            record = self._records[key]
+            name, machine_type, site = record.get("name"), record.get("machine_type"), record.get("site")
+        self._indexed[key] = (name, machine_type, site)
+        self._by_name.setdefault(name, {})[key] = None
+        self._by_type.setdefault(machine_type, {})[key] = None
+        self._by_site.setdefault(site, {})[key] = None
+
+    def _unindex(self, key):
+        name, machine_type, site = self._indexed.pop(key)
+        for index, value in ((self._by_name, name), (self._by_type, machine_type), (self._by_site, site)):
+            keys = index[value]
+            del keys[key]
+            if not keys:
+                del index[value]
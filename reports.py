@@ -0,0 +1,255 @@
+# reports.py
+import csv
+import json
+import time
+from datetime import date
+
+from due_index import is_due
+from usage_history import HEADER, RECORD, KIND_USAGE, KIND_MAINTENANCE
+
+# Columnas de cada tabla del informe (ver FleetReport.table).
+TABLES = {
+    "monthly": ["machine_type", "task_id", "month", "liters", "maintenances"],
+    "liters": ["machine_type", "month", "liters"],
+    "overdue": ["machine_type", "task_id", "tasks", "overdue", "overdue_rate"]
+}
+
+
+class FleetReport:
+    # Informes de la flota: litros y mantenimientos por (tipo de máquina,
+    # tarea, mes) y proporción de tareas vencidas por (tipo, tarea). Los
+    # totales se mantienen al día con cada registro en lugar de recorrer las
+    # tareas al consultarlos, así que una consulta cuesta lo que el número de
+    # grupos. Al crearlo se recorre el historial de uso una vez, por tramos.
+    #
+    # Los totales se llevan por serie del historial (history_id) y cada serie
+    # suma en el grupo de la tarea que la tiene ahora: al borrar una máquina o
+    # una tarea sus litros dejan de contar, igual que si se reconstruyera.
+    # Lo que escriben otras estaciones se lee del final del historial en la
+    # siguiente consulta.
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self._offset = HEADER.size  # bytes del historial ya sumados
+        self._by_history = {}  # history_id -> {mes: [litros, usos, mantenimientos]}
+        self._groups = {}  # (tipo, task_id, mes) -> [litros, usos, mantenimientos]
+        self._month_range = (0.0, 0.0, None)  # [inicio, fin) en timestamp del último mes calculado
+        self._build()
+        self._read_history()
+        fleet.add_listener(self.on_fleet_change)
+        fleet.history.add_listener(self.on_history_append)
+
+    def table(self, name):
+        # Filas de una de las TABLES, como diccionarios.
+        return {"monthly": self.monthly, "liters": self.liters_by_type, "overdue": self.overdue}[name]()
+
+    def monthly(self):
+        self.refresh()
+        return [
+            {"machine_type": machine_type, "task_id": task_id, "month": month,
+             "liters": round(totals[0], 3), "maintenances": totals[2]}
+            for (machine_type, task_id, month), totals in sorted(self._groups.items(), key=_group_order)
+        ]
+
+    def liters_by_type(self):
+        self.refresh()
+        liters = {}
+        for (machine_type, _, month), totals in self._groups.items():
+            if totals[1]:
+                liters[(machine_type, month)] = liters.get((machine_type, month), 0.0) + totals[0]
+        return [
+            {"machine_type": machine_type, "month": month, "liters": round(total, 3)}
+            for (machine_type, month), total in sorted(liters.items(), key=_group_order)
+        ]
+
+    def overdue(self):
+        self.refresh()
+        return [
+            {"machine_type": machine_type, "task_id": task_id, "tasks": tasks, "overdue": overdue,
+             "overdue_rate": round(overdue / tasks, 4)}
+            for (machine_type, task_id), (tasks, overdue) in sorted(self._counts.items(), key=_group_order)
+            if tasks
+        ]
+
+    def refresh(self):
+        # Lo que otras estaciones hayan añadido al historial y las tareas cuyo
+        # plazo ha vencido desde la última consulta.
+        self.fleet.history.poll()
+        self._read_history()
+        today = date.today()
+        if today > self._day:
+            for entry in self.fleet.due_index.reached_between(self._day, today):
+                self._set_due(entry[2], entry[3], True)
+            self._day = today
+
+    def rebuild(self):
+        # Desde cero: tareas de la flota y todo el historial.
+        self._offset = HEADER.size
+        self._by_history = {}
+        self._groups = {}
+        self._build()
+        self._read_history()
+
+    # --- Cambios ---
+
+    def on_fleet_change(self, op, key, machine=None, task_id=None):
+        if op == "reset":
+            self._build()
+        elif op == "remove":
+            self._remove_machine(key)
+        elif op == "machine" or key not in self._tasks:
+            self._remove_machine(key)
+            self._add_machine(key, machine.machine_type, {
+                t_id: task.history_id for t_id, task in machine.maintenance_tasks.items()
+            })
+        else:
+            # Al registrar el primer uso la tarea recibe su serie del historial.
+            history_id = machine.maintenance_tasks[task_id].history_id
+            tasks = self._tasks[key][1]
+            if tasks.get(task_id) != history_id:
+                self._attach(tasks.get(task_id), None)
+                tasks[task_id] = history_id
+                self._attach(history_id, (machine.machine_type, task_id))
+            self._update_due(key, task_id)
+
+    def on_history_append(self, start, rows):
+        # Escritura propia en el historial. Si antes escribió otra estación,
+        # se leerá todo del fichero en la próxima consulta.
+        if start != self._offset:
+            return
+        self._add_rows(rows)
+        self._offset = start + len(rows) * RECORD.size
+
+    # --- Totales por mes ---
+
+    def _read_history(self):
+        for rows in self.fleet.history.read_records(self._offset):
+            self._add_rows(rows)
+            self._offset += len(rows) * RECORD.size
+
+    def _add_rows(self, rows):
+        by_history, owner, groups = self._by_history, self._owner, self._groups
+        lo, hi, month = self._month_range
+        for history_id, timestamp, kind, quantity in rows:
+            history_id = int(history_id)
+            if not lo <= timestamp < hi:
+                lo, hi, month = self._month_range = _month_range(timestamp)
+            usage = int(kind) == KIND_USAGE
+            maintenance = int(kind) == KIND_MAINTENANCE
+            totals = by_history.setdefault(history_id, {}).setdefault(month, [0.0, 0, 0])
+            if usage:
+                totals[0] += quantity
+            totals[1] += usage
+            totals[2] += maintenance
+            group = owner.get(history_id)
+            if group is not None:
+                totals = groups.setdefault((*group, month), [0.0, 0, 0])
+                if usage:
+                    totals[0] += quantity
+                totals[1] += usage
+                totals[2] += maintenance
+
+    def _attach(self, history_id, group):
+        # Pasa los totales de la serie al grupo `group` (None: a ninguno).
+        if history_id is None:
+            return
+        previous = self._owner.pop(history_id, None)
+        if group is not None:
+            self._owner[history_id] = group
+        for month, (liters, usages, maintenances) in self._by_history.get(history_id, {}).items():
+            if previous is not None:
+                key = (*previous, month)
+                totals = self._groups[key]
+                totals[0] -= liters
+                totals[1] -= usages
+                totals[2] -= maintenances
+                if not totals[1] and not totals[2]:
+                    del self._groups[key]
+            if group is not None:
+                totals = self._groups.setdefault((*group, month), [0.0, 0, 0])
+                totals[0] += liters
+                totals[1] += usages
+                totals[2] += maintenances
+
+    # --- Tareas y vencidas ---
+
+    def _build(self):
+        # Tareas de la flota (con su serie del historial) y cuáles están
+        # vencidas. Los totales por mes ya leídos se reparten de nuevo.
+        self._tasks = {}  # clave -> (tipo, {task_id: history_id})
+        self._owner = {}  # history_id -> (tipo, task_id)
+        self._counts = {}  # (tipo, task_id) -> [tareas, vencidas]
+        self._due = set()  # (clave, task_id) vencidas
+        self._day = date.today()
+        for key, _, task_id, task in self.fleet.iter_task_records():
+            if key not in self._tasks:
+                self._tasks[key] = (self.fleet.summary(key)[1], {})
+            machine_type, tasks = self._tasks[key]
+            tasks[task_id] = task.get("history_id")
+            self._counts.setdefault((machine_type, task_id), [0, 0])[0] += 1
+            if task.get("history_id") is not None:
+                self._owner[task["history_id"]] = (machine_type, task_id)
+        for entry in self.fleet.due_index.due_within(0, self._day):
+            self._set_due(entry[2], entry[3], True)
+        self._groups = {}
+        for history_id, group in self._owner.items():
+            for month, totals in self._by_history.get(history_id, {}).items():
+                merged = self._groups.setdefault((*group, month), [0.0, 0, 0])
+                for i, value in enumerate(totals):
+                    merged[i] += value
+
+    def _add_machine(self, key, machine_type, tasks):
+        self._tasks[key] = (machine_type, dict(tasks))
+        for task_id, history_id in tasks.items():
+            self._counts.setdefault((machine_type, task_id), [0, 0])[0] += 1
+            self._attach(history_id, (machine_type, task_id))
+            self._update_due(key, task_id)
+
+    def _remove_machine(self, key):
+        machine_type, tasks = self._tasks.pop(key, (None, {}))
+        for task_id, history_id in tasks.items():
+            self._set_due(key, task_id, False, machine_type)
+            counts = self._counts[(machine_type, task_id)]
+            counts[0] -= 1
+            if not counts[0]:
+                del self._counts[(machine_type, task_id)]
+            self._attach(history_id, None)
+
+    def _update_due(self, key, task_id):
+        entry = self.fleet.due_index.entry(key, task_id)
+        self._set_due(key, task_id, entry is not None and is_due(entry, self._day))
+
+    def _set_due(self, key, task_id, due, machine_type=None):
+        if due == ((key, task_id) in self._due):
+            return
+        if machine_type is None:
+            machine_type = self._tasks[key][0]
+        if due:
+            self._due.add((key, task_id))
+            self._counts[(machine_type, task_id)][1] += 1
+        else:
+            self._due.discard((key, task_id))
+            self._counts[(machine_type, task_id)][1] -= 1
+
+
+def write_csv(rows, columns, f):
+    writer = csv.DictWriter(f, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def write_json(rows, f):
+    json.dump(rows, f, ensure_ascii=False, indent=4)
+    f.write("\n")
+
+
+def _month_range(timestamp):
+    # (inicio, fin, "AAAA-MM") del mes, en hora local, que contiene `timestamp`.
+    t = time.localtime(timestamp)
+    start = time.mktime((t.tm_year, t.tm_mon, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((t.tm_year, t.tm_mon + 1, 1, 0, 0, 0, 0, 0, -1))
+    return start, end, f"{t.tm_year:04d}-{t.tm_mon:02d}"
+
+
+def _group_order(item):
+    # Los tipos o tareas None (datos antiguos) van al final en lugar de fallar al ordenar.
+    return tuple((value is None, value or "") for value in item[0])
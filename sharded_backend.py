@@ -0,0 +1,319 @@
+# sharded_backend.py
+# Backend "sharded": las máquinas se reparten por sede, cada una en su propio
+# par de ficheros snapshot + journal (un JsonBackend por sede), y un pequeño
+# manifiesto (SHARD_MANIFEST) dice qué ficheros son de cada sede:
+#   {"version": 1, "shards": [{"site": "Madrid", "data_file": "machines_data.madrid.json",
+#                              "journal_file": "machines_data.madrid.journal"}]}
+# Las rutas son relativas al manifiesto. Las máquinas sin sede siguen en
+# DATA_FILE y JOURNAL_FILE, que no figuran en el manifiesto: los datos de antes
+# de las sedes se cargan sin migrar nada.
+#
+# Una estación puede abrir todas las sedes o solo algunas (STATION_SITES). Con
+# varias, se leen en paralelo en otros procesos; al compactar solo se
+# reescriben las sedes con cambios desde su último snapshot.
+import json
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from config import (DATA_FILE, JOURNAL_FILE, JOURNAL_ENABLED, SNAPSHOT_FORMAT, SHARD_MANIFEST, STATION_SITES,
+                    SHARD_PARALLEL_MIN_BYTES, SHARD_LOAD_WORKERS)
+from data_manager import StorageBackend, JsonBackend
+from file_lock import FileLock, file_stamp
+from instrumentation import add_bytes
+
+MANIFEST_VERSION = 1
+
+# Sede de una máquina que ya no está en ningún fichero abierto.
+_UNKNOWN = object()
+
+
+def _load_shard(args):
+    # Se ejecuta en otro proceso: carga una sede y devuelve sus datos y hasta
+    # dónde se leyeron los ficheros, para seguir desde ahí en la estación.
+    data_file, journal_file, journal_enabled, snapshot_format = args
+    backend = JsonBackend(data_file, journal_file, journal_enabled, snapshot_format)
+    data = backend.load_data()
+    return data, backend.read_state()
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _strip_site(site, records):
+    # En el fichero de una sede no se repite la sede en cada máquina (ni en
+    # cada marca de borrado).
+    if site is None:
+        return records
+    return [{field: value for field, value in record.items() if field != "site"} for record in records]
+
+
+def _shard_data(site, part):
+    return {"machines": _strip_site(site, part["machines"]), "removed": _strip_site(site, part["removed"])}
+
+
+def _with_site(site, records):
+    if site is not None:
+        for record in records:
+            record.setdefault("site", site)
+    return records
+
+
+def _slug(site):
+    text = unicodedata.normalize("NFKD", str(site)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "sede"
+
+
+class ShardedBackend(StorageBackend):
+    def __init__(self, manifest_file=SHARD_MANIFEST, data_file=DATA_FILE, journal_file=JOURNAL_FILE,
+                 sites=STATION_SITES, journal_enabled=JOURNAL_ENABLED, snapshot_format=SNAPSHOT_FORMAT,
+                 parallel_min_bytes=SHARD_PARALLEL_MIN_BYTES):
+        self.manifest_file = manifest_file
+        self.data_file = data_file
+        self.journal_file = journal_file
+        # Sedes que abre esta estación (None: todas las del manifiesto).
+        self.sites = list(sites) if sites is not None else None
+        self.journal_enabled = journal_enabled
+        self.snapshot_format = snapshot_format
+        self.parallel_min_bytes = parallel_min_bytes
+        self._shards = {}  # sede -> JsonBackend, en el orden del manifiesto
+        self._location = {}  # id de máquina -> sede en cuyo fichero está
+        self._dirty = set()  # sedes que hay que reescribir aunque no tengan journal
+        self._appended = 0  # cambios propios escritos desde load_data, en todas las sedes
+        self._incoming = []
+        self._manifest_stamp = None
+        self._manifest_lock = FileLock(manifest_file + '.lock')
+        # Lo usan el hilo de Tk (poll_changes) y el de escritura.
+        self._lock = threading.Lock()
+
+    def default_site(self):
+        return self.sites[0] if self.sites else None
+
+    def load_data(self):
+        with self._lock:
+            wanted = [(site, files) for site, files in self._shard_files().items() if self._wanted(site)]
+            self._shards = {}
+            self._location = {}
+            self._dirty = set()
+            self._appended = 0
+            self._incoming = []
+            machines = []
+            removed = []
+            for (site, _), data in zip(wanted, self._load_shards(wanted)):
+                removed.extend(_with_site(site, data.get("removed", [])))
+                for machine in _with_site(site, data.get("machines", [])):
+                    other = self._location.get(machine["id"])
+                    if other is not None:
+                        # La misma máquina en dos sedes (p. ej. ficheros copiados a
+                        # mano): se conserva la primera y se rehacen ambas al compactar.
+                        self._dirty.update((site, other))
+                        continue
+                    self._location[machine["id"]] = site
+                    machines.append(machine)
+        return {"machines": machines, "removed": removed}
+
+    def save_data(self, data):
+        with self._lock:
+            parts = self._partition(data)
+            for site, part in parts.items():
+                self._shards[site].save_data(_shard_data(site, part))
+            self._dirty.clear()
+
+    def compact(self, data, synced):
+        with self._lock:
+            if synced != sum(shard.remote_count() for shard in self._shards.values()):
+                # Alguna sede tiene cambios ajenos que `data` aún no incluye.
+                return False
+            written = True
+            for site, part in self._partition(data).items():
+                shard = self._shards[site]
+                if site not in self._dirty and not _file_size(shard.journal_file):
+                    continue  # Sin cambios desde su snapshot.
+                if shard.compact(_shard_data(site, part), shard.remote_count()):
+                    self._dirty.discard(site)
+                else:
+                    written = False
+            return written
+
+    def record_events(self, events):
+        with self._lock:
+            # Se agrupan los cambios seguidos de una misma sede para escribirlos
+            # de una vez. Las sedes se resuelven antes de escribir nada.
+            runs = []
+            added = {}  # máquinas añadidas en este mismo lote -> sede
+            for event in events:
+                site = self._route(event, added)
+                if runs and runs[-1][0] == site:
+                    runs[-1][1].append(event)
+                else:
+                    runs.append((site, [event]))
+            for site, run in runs:
+                if site is not _UNKNOWN:
+                    shard = self._open_shard(site)
+                    shard.record_events(run)
+                    if not self.journal_enabled:
+                        self._dirty.add(site)
+                    # Lo que otras estaciones escribieron en esta sede va por
+                    # delante de este grupo.
+                    self._take(site, shard.take_incoming())
+                    self._track(site, run)
+                # Una máquina que ya no está en ningún fichero no se escribe,
+                # pero cuenta como escrito para no quedar pendiente.
+                self._appended += len(run)
+
+    def needs_full_save(self):
+        with self._lock:
+            if not self.journal_enabled:
+                return bool(self._dirty)
+            return any(shard.needs_full_save() for shard in self._shards.values())
+
+    def poll_changes(self):
+        with self._lock:
+            if file_stamp(self.manifest_file) != self._manifest_stamp:
+                # Otra estación creó una sede: se abre vacía y sus datos llegan
+                # como cualquier otro cambio ajeno.
+                for site, files in self._shard_files().items():
+                    if self._wanted(site) and site not in self._shards:
+                        self._open_shard(site, files)
+            for site, shard in self._shards.items():
+                self._take(site, shard.poll_changes()[0])
+            incoming, self._incoming = self._incoming, []
+            return incoming, self._appended
+
+    # --- Sedes ---
+
+    def _wanted(self, site):
+        return self.sites is None or site in self.sites
+
+    def _route(self, event, added):
+        if event["op"] == "add_machine":
+            site = event["machine"].get("site")
+            if not self._wanted(site):
+                raise ValueError(f"La sede {site} no está abierta en esta estación.")
+            added[event["machine"]["id"]] = site
+            return site
+        key = event["machine_id"]
+        return added[key] if key in added else self._location.get(key, _UNKNOWN)
+
+    def _track(self, site, events):
+        for event in events:
+            if event["op"] == "add_machine":
+                self._location[event["machine"]["id"]] = site
+            elif event["op"] == "remove_machine":
+                self._location.pop(event["machine_id"], None)
+
+    def _take(self, site, incoming):
+        # Cambios ajenos de una sede, con el número de cambios propios escritos
+        # en todas las sedes antes que ellos. Una recarga es solo de esa sede
+        # (clave "site"): el resto de la flota no cambia.
+        for _, kind, payload in incoming:
+            if kind == "reload":
+                payload["site"] = site
+                self._location = {key: other for key, other in self._location.items() if other != site}
+                _with_site(site, payload.get("removed", []))
+                for machine in _with_site(site, payload.get("machines", [])):
+                    self._location[machine["id"]] = site
+            else:
+                self._track(site, payload)
+            self._incoming.append((self._appended, kind, payload))
+
+    def _partition(self, data):
+        # Máquinas y marcas de borrado de cada sede abierta.
+        parts = {site: {"machines": [], "removed": []} for site in self._shards}
+        for record in data.get("machines", []):
+            site = record.get("site")
+            if site not in parts:
+                self._open_shard(site)
+                self._dirty.add(site)
+                parts[site] = {"machines": [], "removed": []}
+            if self._location.get(record["id"], site) != site:
+                self._dirty.update((site, self._location[record["id"]]))
+            parts[site]["machines"].append(record)
+        for entry in data.get("removed", []):
+            # Las de sedes que esta estación no tiene abiertas no le llegan.
+            if entry.get("site") in parts:
+                parts[entry.get("site")]["removed"].append(entry)
+        return parts
+
+    def _open_shard(self, site, files=None):
+        # Backend de la sede; si aún no tiene ficheros, se añade al manifiesto.
+        shard = self._shards.get(site)
+        if shard is None:
+            if not self._wanted(site):
+                raise ValueError(f"La sede {site} no está abierta en esta estación.")
+            data_file, journal_file = files or self._register_site(site)
+            shard = self._shards[site] = JsonBackend(data_file, journal_file, self.journal_enabled,
+                                                     self.snapshot_format)
+        return shard
+
+    def _load_shards(self, wanted):
+        # Datos de cada sede. Se leen en paralelo si compensa arrancar los procesos.
+        jobs = [(data_file, journal_file, self.journal_enabled, self.snapshot_format)
+                for _, (data_file, journal_file) in wanted]
+        total = sum(_file_size(data_file) + _file_size(journal_file) for data_file, journal_file, _, _ in jobs)
+        workers = min(len(jobs), SHARD_LOAD_WORKERS or os.cpu_count() or 1)
+        if workers > 1 and total >= self.parallel_min_bytes:
+            with ProcessPoolExecutor(workers) as pool:
+                loaded = list(pool.map(_load_shard, jobs))
+            add_bytes(read=total)
+            results = []
+            for (site, files), (data, state) in zip(wanted, loaded):
+                self._open_shard(site, files).restore_read_state(state)
+                results.append(data)
+            return results
+        return [self._open_shard(site, files).load_data() for site, files in wanted]
+
+    # --- Manifiesto ---
+
+    def _shard_files(self):
+        # sede -> (fichero de datos, journal); primero las máquinas sin sede.
+        files = {None: (self.data_file, self.journal_file)}
+        files.update(self._read_manifest())
+        return files
+
+    def _register_site(self, site):
+        if site is None:
+            return self.data_file, self.journal_file
+        with self._manifest_lock:
+            # Con el manifiesto bloqueado: otra estación pudo crear la sede entretanto.
+            shards = self._read_manifest()
+            if site in shards:
+                return shards[site]
+            entries = self._manifest_entries()
+            used = {entry[field] for entry in entries for field in ("data_file", "journal_file")}
+            stem = os.path.splitext(os.path.basename(self.data_file))[0]
+            name = f"{stem}.{_slug(site)}"
+            n = 2
+            while name + ".json" in used or name + ".journal" in used:
+                name = f"{stem}.{_slug(site)}-{n}"
+                n += 1
+            entries.append({"site": site, "data_file": name + ".json", "journal_file": name + ".journal"})
+            raw = json.dumps({"version": MANIFEST_VERSION, "shards": entries}, ensure_ascii=False, indent=4)
+            tmp_file = self.manifest_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.manifest_file)
+            return self._read_manifest()[site]
+
+    def _read_manifest(self):
+        # sede -> (fichero de datos, journal) de las sedes del manifiesto.
+        self._manifest_stamp = file_stamp(self.manifest_file)
+        folder = os.path.dirname(self.manifest_file)
+        return {
+            entry["site"]: (os.path.join(folder, entry["data_file"]), os.path.join(folder, entry["journal_file"]))
+            for entry in self._manifest_entries()
+        }
+
+    def _manifest_entries(self):
+        if not os.path.exists(self.manifest_file):
+            return []
+        with open(self.manifest_file, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version", 1) > MANIFEST_VERSION:
+            raise ValueError(f"El manifiesto es de una versión más reciente de la aplicación "
+                             f"(versión {manifest['version']}).")
+        return manifest.get("shards", [])
@@ -0,0 +1,319 @@
+# snapshot_format.py
+# Formatos del snapshot de datos: JSON (legible, para exportar y depurar) o
+# binario compacto. Al leer se reconoce el formato por la cabecera y los datos
+# de versiones anteriores del esquema se migran a la actual.
+#
+# Formato binario (little-endian), por secciones con su longitud delante:
+#   cabecera     MAGIC, versión (u16), longitud (u32) + JSON con las claves de
+#                nivel superior salvo "machines" (journal_seq, removed...)
+#   cadenas      longitud (u32) + lista JSON de las cadenas distintas (nombres,
+#                tipos, ids de tarea, fechas...). La referencia 0 es None.
+#   definiciones longitud (u32) + JSON con las distintas definiciones de tarea
+#                (campos que no vienen de la plantilla: tareas personalizadas o
+#                modificadas). Se repiten mucho, así que se guardan una vez.
+#   máquinas     número (u32); id, nombre, tipo, fecha de inicio (referencias a
+#                cadenas), número de tareas y versión (0: sin versión), en
+#                columnas de u32. La versión 2 del esquema no tiene la columna
+#                de versión.
+#   tareas       número (u32); task_id, definición (0: ninguna) y last_date
+#                (u32), presencia de campos (u8), usage_count (f64) e
+#                history_id (i64), en columnas
+#   extras       longitud (u32) + JSON [máquina, tarea o -1, campo, valor] con
+#                los valores que no caben en su columna
+# Las columnas se leen de una vez con array y los diccionarios se construyen
+# por comprensión, sin recorrer los bytes en Python.
+import gc
+import json
+import struct
+import sys
+from array import array
+from itertools import islice
+from maintenance_task import compact_task
+
+MAGIC = b'CMSN'
+# Versión del esquema de datos, común a ambos formatos (en JSON, la clave
+# "schema_version"; los snapshots sin ella son de la versión 1).
+SCHEMA_VERSION = 3
+
+_HEADER = struct.Struct('<4sHI')
+_COUNT = struct.Struct('<I')
+_U32 = 'I' if array('I').itemsize == 4 else 'L'
+_I64 = 'q'
+_F64 = 'd'
+
+# Campos de máquina y de tarea que van en columnas.
+_MACHINE_FIELDS = ("id", "name", "machine_type", "start_date")
+_TASK_FIELDS = frozenset(("last_date", "usage_count", "history_id"))
+
+# Bits de presencia de cada tarea.
+_HAS_LAST_DATE = 1
+_HAS_USAGE = 2
+_USAGE_INT = 4
+_HAS_HISTORY = 8
+_DATE_USAGE = _HAS_LAST_DATE | _HAS_USAGE
+_DATE_USAGE_HISTORY = _HAS_LAST_DATE | _HAS_USAGE | _HAS_HISTORY
+
+
+def dumps(data, snapshot_format="json"):
+    if snapshot_format == "binary":
+        return _encode(data)
+    return json.dumps(dict(data, schema_version=SCHEMA_VERSION), indent=4).encode('utf-8')
+
+
+def loads(raw):
+    # Se crean cientos de miles de objetos sin ciclos: el recolector de
+    # basura solo añadiría pasadas inútiles (hasta la mitad del tiempo).
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if raw[:len(MAGIC)] == MAGIC:
+            data, version = _decode(raw)
+        else:
+            data = json.loads(raw)
+            version = data.pop("schema_version", 1)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return migrate(data, version)
+
+
+def migrate(data, version):
+    _check_version(version)
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version += 1
+    return data
+
+
+def _migrate_v1(data):
+    # v1 -> v2: las tareas guardaban la definición completa; ahora se omite lo
+    # que coincide con la plantilla de MACHINE_TYPES.
+    for machine in data.get("machines", []):
+        machine_type = machine.get("machine_type")
+        tasks = machine.get("maintenance_tasks") or {}
+        for task_id, task in tasks.items():
+            tasks[task_id] = compact_task(machine_type, task_id, task)
+    return data
+
+
+def _migrate_v2(data):
+    # v2 -> v3: aparecen las versiones de las máquinas y las marcas de
+    # borrado (ver data_manager.changes_since). Los datos anteriores no tienen
+    # ninguna, así que no hay nada que convertir.
+    return data
+
+
+# Versión -> función que pasa los datos de esa versión a la siguiente.
+MIGRATIONS = {1: _migrate_v1, 2: _migrate_v2}
+
+
+def _check_version(version):
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Los datos son de una versión más reciente de la aplicación (esquema {version}).")
+
+
+# --- Binario ---
+
+def _encode(data):
+    strings = {None: 0}
+    definitions = {}
+
+    def ref(value):
+        r = strings.get(value)
+        if r is None:
+            r = strings[value] = len(strings)
+        return r
+
+    columns = [array(_U32) for _ in _MACHINE_FIELDS]
+    task_counts = array(_U32)
+    versions = array(_U32)
+    task_ids = array(_U32)
+    task_definitions = array(_U32)
+    last_dates = array(_U32)
+    flags = array('B')
+    usages = array(_F64)
+    histories = array(_I64)
+    extras = []
+    for m, machine in enumerate(data.get("machines", [])):
+        for column, field in zip(columns, _MACHINE_FIELDS):
+            value = machine.get(field)
+            if value is None or isinstance(value, str):
+                column.append(ref(value))
+            else:
+                column.append(0)
+                extras.append([m, -1, field, value])
+        version = machine.get("version", 0)
+        if type(version) is int and 0 <= version < 2 ** 32:
+            versions.append(version)
+        else:
+            versions.append(0)
+            extras.append([m, -1, "version", version])
+        for field, value in machine.items():
+            if field not in _MACHINE_FIELDS and field != "maintenance_tasks" and field != "version":
+                extras.append([m, -1, field, value])
+        tasks = machine.get("maintenance_tasks") or {}
+        task_counts.append(len(tasks))
+        for task_id, task in tasks.items():
+            t = len(task_ids)
+            task_ids.append(ref(task_id))
+            definition = {field: value for field, value in task.items() if field not in _TASK_FIELDS}
+            if definition:
+                key = json.dumps(definition)
+                if key not in definitions:
+                    definitions[key] = len(definitions) + 1
+                task_definitions.append(definitions[key])
+            else:
+                task_definitions.append(0)
+            flag = 0
+            last_date = task.get("last_date")
+            if "last_date" in task:
+                if last_date is None or isinstance(last_date, str):
+                    flag |= _HAS_LAST_DATE
+                else:
+                    extras.append([m, t, "last_date", last_date])
+            last_dates.append(ref(last_date) if flag & _HAS_LAST_DATE else 0)
+            usage = task.get("usage_count")
+            if "usage_count" in task:
+                if isinstance(usage, float) or (type(usage) is int and abs(usage) <= 2 ** 53):
+                    flag |= _HAS_USAGE | (_USAGE_INT if isinstance(usage, int) else 0)
+                else:
+                    extras.append([m, t, "usage_count", usage])
+            usages.append(usage if flag & _HAS_USAGE else 0.0)
+            history_id = task.get("history_id")
+            if "history_id" in task:
+                if type(history_id) is int and -2 ** 63 <= history_id < 2 ** 63:
+                    flag |= _HAS_HISTORY
+                else:
+                    extras.append([m, t, "history_id", history_id])
+            histories.append(history_id if flag & _HAS_HISTORY else 0)
+            flags.append(flag)
+
+    meta = json.dumps({key: value for key, value in data.items() if key != "machines"}).encode('utf-8')
+    parts = [_HEADER.pack(MAGIC, SCHEMA_VERSION, len(meta)), meta]
+    parts.extend(_json_section(json.dumps(list(strings)[1:])))
+    parts.extend(_json_section('[' + ','.join(definitions) + ']'))
+    parts.append(_COUNT.pack(len(task_counts)))
+    parts.extend(_bytes(column) for column in columns)
+    parts.append(_bytes(task_counts))
+    parts.append(_bytes(versions))
+    parts.append(_COUNT.pack(len(task_ids)))
+    parts.extend(_bytes(column) for column in (task_ids, task_definitions, last_dates, flags, usages, histories))
+    parts.extend(_json_section(json.dumps(extras)))
+    return b''.join(parts)
+
+
+def _decode(raw):
+    view = memoryview(raw)
+    _, version, meta_len = _HEADER.unpack_from(view, 0)
+    _check_version(version)
+    decoder = _DECODERS.get(version)
+    if decoder is None:
+        raise ValueError(f"Versión de snapshot binario desconocida: {version}")
+    pos = _HEADER.size + meta_len
+    meta = json.loads(bytes(view[_HEADER.size:pos]))
+    return decoder(view, pos, meta), version
+
+
+def _decode_v2(view, pos, data):
+    return _decode_machines(view, pos, data, with_versions=False)
+
+
+def _decode_v3(view, pos, data):
+    return _decode_machines(view, pos, data, with_versions=True)
+
+
+def _decode_machines(view, pos, data, with_versions):
+    strings, pos = _read_json_section(view, pos)
+    table = [None, *strings]
+    definitions, pos = _read_json_section(view, pos)
+
+    n = _COUNT.unpack_from(view, pos)[0]
+    pos += _COUNT.size
+    columns = []
+    for _ in range(len(_MACHINE_FIELDS) + 1):
+        column, pos = _column(view, pos, _U32, n)
+        columns.append(column)
+    versions = None
+    if with_versions:
+        versions, pos = _column(view, pos, _U32, n)
+    t = _COUNT.unpack_from(view, pos)[0]
+    pos += _COUNT.size
+    task_ids, pos = _column(view, pos, _U32, t)
+    task_definitions, pos = _column(view, pos, _U32, t)
+    last_dates, pos = _column(view, pos, _U32, t)
+    flags, pos = _column(view, pos, 'B', t)
+    usages, pos = _column(view, pos, _F64, t)
+    histories, pos = _column(view, pos, _I64, t)
+    extras, pos = _read_json_section(view, pos)
+
+    # Los casos habituales (fecha, contador e historial presentes o no) se
+    # construyen directamente; el resto, campo a campo.
+    tasks = [
+        {"last_date": table[d], "usage_count": u} if f == _DATE_USAGE else
+        {"last_date": table[d], "usage_count": u, "history_id": h} if f == _DATE_USAGE_HISTORY else
+        {"last_date": table[d]} if f == _HAS_LAST_DATE else
+        _task(f, table[d], u, h)
+        for f, d, u, h in zip(flags, last_dates, usages, histories)
+    ]
+    for j in [j for j, definition in enumerate(task_definitions) if definition]:
+        tasks[j].update(definitions[task_definitions[j] - 1])
+    named_tasks = zip([table[r] for r in task_ids], tasks)
+    machines = [
+        {
+            "id": table[machine_id],
+            "name": table[name],
+            "machine_type": table[machine_type],
+            "start_date": table[start_date],
+            "maintenance_tasks": dict(islice(named_tasks, task_count))
+        }
+        for machine_id, name, machine_type, start_date, task_count in zip(*columns)
+    ]
+    if versions is not None:
+        for m in [m for m, version in enumerate(versions) if version]:
+            machines[m]["version"] = versions[m]
+    for m, j, field, value in extras:
+        (machines[m] if j < 0 else tasks[j])[field] = value
+    data["machines"] = machines
+    return data
+
+
+def _task(flag, last_date, usage, history_id):
+    task = {}
+    if flag & _HAS_LAST_DATE:
+        task["last_date"] = last_date
+    if flag & _HAS_USAGE:
+        task["usage_count"] = int(usage) if flag & _USAGE_INT else usage
+    if flag & _HAS_HISTORY:
+        task["history_id"] = history_id
+    return task
+
+
+# Versión -> decodificador del formato binario de esa versión.
+_DECODERS = {2: _decode_v2, 3: _decode_v3}
+
+
+def _column(view, pos, typecode, count):
+    column = array(typecode)
+    end = pos + column.itemsize * count
+    column.frombytes(view[pos:end])
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tolist(), end
+
+
+def _bytes(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _json_section(text):
+    raw = text.encode('utf-8')
+    return [_COUNT.pack(len(raw)), raw]
+
+
+def _read_json_section(view, pos):
+    length = _COUNT.unpack_from(view, pos)[0]
+    pos += _COUNT.size
+    return json.loads(bytes(view[pos:pos + length])), pos + length
@@ -0,0 +1,381 @@
+# sqlite_backend.py
+import json
+import sqlite3
+import sys
+import threading
+from config import DATA_FILE, JOURNAL_FILE, SQLITE_FILE
+from data_manager import StorageBackend, JsonBackend, tombstone
+from machine import new_machine_id
+from maintenance_task import TaskTemplate, expand_task, compact_task
+
+# Cambios que se conservan en change_log para las demás estaciones; una
+# estación que se quede más atrás recarga los datos completos.
+CHANGE_LOG_KEEP = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS machines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position INTEGER NOT NULL,
+    uid TEXT,
+    name TEXT NOT NULL,
+    machine_type TEXT,
+    start_date TEXT,
+    site TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_machines_position ON machines(position);
+CREATE INDEX IF NOT EXISTS idx_machines_type ON machines(machine_type);
+
+CREATE TABLE IF NOT EXISTS maintenance_tasks (
+    machine_id INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+    task_id TEXT NOT NULL,
+    name TEXT,
+    has_usage INTEGER NOT NULL DEFAULT 0,
+    threshold_days INTEGER,
+    threshold_usage REAL,
+    last_date TEXT,
+    usage_count REAL,
+    history_id INTEGER,
+    PRIMARY KEY (machine_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_last_date ON maintenance_tasks(last_date);
+
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS removed_machines (
+    uid TEXT PRIMARY KEY,
+    site TEXT,
+    version INTEGER NOT NULL
+);
+"""
+
+# Al editar la definición de una tarea se conservan su uso y su último
+# mantenimiento salvo que cambie has_usage (ver apply_event).
+UPDATE_TASK_DEFINITION = """
+INSERT INTO maintenance_tasks
+    (machine_id, task_id, name, has_usage, threshold_days, threshold_usage, last_date, usage_count, history_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (machine_id, task_id) DO UPDATE SET
+    name = excluded.name,
+    threshold_days = excluded.threshold_days,
+    threshold_usage = excluded.threshold_usage,
+    last_date = CASE WHEN has_usage = excluded.has_usage THEN last_date ELSE excluded.last_date END,
+    usage_count = CASE WHEN has_usage = excluded.has_usage THEN usage_count ELSE excluded.usage_count END,
+    history_id = CASE WHEN has_usage = excluded.has_usage THEN history_id ELSE excluded.history_id END,
+    has_usage = excluded.has_usage
+"""
+
+UPSERT_TASK = """
+INSERT INTO maintenance_tasks
+    (machine_id, task_id, name, has_usage, threshold_days, threshold_usage, last_date, usage_count, history_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (machine_id, task_id) DO UPDATE SET
+    name = excluded.name,
+    has_usage = excluded.has_usage,
+    threshold_days = excluded.threshold_days,
+    threshold_usage = excluded.threshold_usage,
+    last_date = excluded.last_date,
+    usage_count = excluded.usage_count,
+    history_id = excluded.history_id
+"""
+
+class SQLiteBackend(StorageBackend):
+    # Máquinas y tareas como filas indexadas; cada cambio toca solo sus filas.
+    # Cada lote de cambios se copia además a change_log, de donde las demás
+    # estaciones que comparten la base de datos leen lo que se les ha escapado.
+    def __init__(self, db_file=SQLITE_FILE):
+        self.db_file = db_file
+        # La conexión puede usarla el hilo de escritura en segundo plano.
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate_schema()
+        self._lock = threading.Lock()
+        self._log_seq = 0  # último registro de change_log leído o escrito
+        self._data_version = None
+        self._appended = 0
+        self._remote_count = 0
+        self._incoming = []
+
+    def load_data(self):
+        with self._lock:
+            # Una transacción de lectura: los datos y la posición en change_log
+            # corresponden al mismo momento.
+            self.conn.execute("BEGIN")
+            try:
+                data = self._read_all()
+                self._log_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+            finally:
+                self.conn.commit()
+            self._data_version = self._current_data_version()
+            self._appended = 0
+            self._remote_count = 0
+            self._incoming = []
+        return data
+
+    def _read_all(self):
+        machines = []
+        rows_by_id = {}
+        for row in self.conn.execute(
+                "SELECT id, name, machine_type, start_date, uid, site, version FROM machines ORDER BY position"):
+            machine = {
+                "id": row[4],
+                "name": row[1],
+                "machine_type": row[2],
+                "start_date": row[3],
+                "maintenance_tasks": {}
+            }
+            if row[5] is not None:
+                machine["site"] = row[5]
+            if row[6]:
+                machine["version"] = row[6]
+            rows_by_id[row[0]] = machine
+            machines.append(machine)
+        # El rowid conserva el orden en que se añadieron las tareas. Las columnas
+        # guardan la definición completa; en memoria se omite lo que coincide
+        # con la plantilla del tipo de máquina.
+        for row in self.conn.execute(
+                "SELECT machine_id, task_id, name, has_usage, threshold_days, threshold_usage,"
+                " last_date, usage_count, history_id FROM maintenance_tasks ORDER BY rowid"):
+            task = {
+                "name": row[2],
+                "has_usage": bool(row[3]),
+                "threshold_days": row[4],
+                "threshold_usage": row[5],
+                "last_date": row[6]
+            }
+            if task["has_usage"]:
+                task["usage_count"] = row[7]
+            if row[8] is not None:
+                task["history_id"] = row[8]
+            machine = rows_by_id[row[0]]
+            machine["maintenance_tasks"][row[1]] = compact_task(machine["machine_type"], row[1], task)
+        removed = [tombstone(*row) for row in self.conn.execute(
+            "SELECT uid, version, site FROM removed_machines ORDER BY version")]
+        return {"machines": machines, "removed": removed}
+
+    def save_data(self, data):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM machines")
+            for position, machine in enumerate(data.get("machines", [])):
+                self._insert_machine(position, machine)
+            self.conn.execute("DELETE FROM removed_machines")
+            self.conn.executemany(
+                "INSERT INTO removed_machines (uid, site, version) VALUES (?, ?, ?)",
+                [(entry["id"], entry.get("site"), entry["version"]) for entry in data.get("removed", [])]
+            )
+            # Las demás estaciones recargarán todo al leer la marca.
+            self.conn.execute("DELETE FROM change_log")
+            self._log_seq = self.conn.execute(
+                "INSERT INTO change_log (event) VALUES (?)", (json.dumps({"op": "snapshot"}),)
+            ).lastrowid
+
+    def record_event(self, event):
+        self.record_events([event])
+
+    def record_events(self, events):
+        # Todos los cambios del lote en una sola transacción, que bloquea la
+        # escritura a las demás estaciones mientras dura.
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            with self.conn:
+                self._catch_up()
+                for event in events:
+                    # El número del cambio en change_log es la nueva versión de la máquina.
+                    event.pop("seq", None)
+                    event["seq"] = self.conn.execute(
+                        "INSERT INTO change_log (event) VALUES (?)", (json.dumps(event, separators=(',', ':')),)
+                    ).lastrowid
+                    self._apply_event(event)
+                self._log_seq = self.conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0]
+                self.conn.execute("DELETE FROM change_log WHERE seq <= ?", (self._log_seq - CHANGE_LOG_KEEP,))
+            self._appended += len(events)
+            self._data_version = self._current_data_version()
+
+    def compact(self, data, synced):
+        # Cada cambio ya está escrito en sus filas: no hay journal que pasar a
+        # un snapshot. Reescribir todo con save_data borraría lo que otras
+        # estaciones escribieron y `data` aún no incluye.
+        return True
+
+    def poll_changes(self):
+        with self._lock:
+            # data_version solo cambia cuando escribe otra conexión.
+            if self._current_data_version() != self._data_version:
+                self.conn.execute("BEGIN")
+                try:
+                    self._catch_up()
+                finally:
+                    self.conn.commit()
+                self._data_version = self._current_data_version()
+            incoming, self._incoming = self._incoming, []
+            return incoming, self._appended
+
+    def _catch_up(self):
+        rows = self.conn.execute("SELECT seq, event FROM change_log WHERE seq > ? ORDER BY seq", (self._log_seq,)).fetchall()
+        if not rows:
+            return
+        events = [dict(json.loads(row[1]), seq=row[0]) for row in rows]
+        if rows[0][0] != self._log_seq + 1 or any(event["op"] == "snapshot" for event in events):
+            # Los cambios intermedios ya no están en change_log: se recarga todo.
+            self._incoming.append((self._appended, "reload", self._read_all()))
+            self._remote_count += 1
+        else:
+            self._incoming.append((self._appended, "events", events))
+            self._remote_count += len(events)
+        self._log_seq = rows[-1][0]
+
+    def _current_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _apply_event(self, event):
+        op = event["op"]
+        version = event.get("seq", 0)
+        if op == "add_machine":
+            position = self.conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM machines").fetchone()[0]
+            self._insert_machine(position, dict(event["machine"], version=version))
+            return
+        machine_id = self._machine_id(event)
+        if machine_id is None:
+            # La máquina ya no existe (la eliminó otra estación).
+            return
+        if op == "remove_machine":
+            uid, site = self.conn.execute("SELECT uid, site FROM machines WHERE id = ?", (machine_id,)).fetchone()
+            # Las posiciones solo ordenan: el hueco se queda, sin renumerar las siguientes.
+            self.conn.execute("DELETE FROM machines WHERE id = ?", (machine_id,))
+            self.conn.execute("INSERT OR REPLACE INTO removed_machines (uid, site, version) VALUES (?, ?, ?)",
+                              (uid, site, version))
+            return
+        if op == "update_machine":
+            machine = event["machine"]
+            self.conn.execute(
+                "UPDATE machines SET name = ?, machine_type = ?, start_date = ? WHERE id = ?",
+                (machine["name"], machine["machine_type"], machine["start_date"], machine_id)
+            )
+            tasks = machine.get("maintenance_tasks", {})
+            existing = [r[0] for r in self.conn.execute(
+                "SELECT task_id FROM maintenance_tasks WHERE machine_id = ?", (machine_id,))]
+            for task_id in existing:
+                if task_id not in tasks:
+                    self.conn.execute(
+                        "DELETE FROM maintenance_tasks WHERE machine_id = ? AND task_id = ?",
+                        (machine_id, task_id)
+                    )
+            for task_id, task in tasks.items():
+                self._upsert_task(machine_id, machine["machine_type"], task_id, task, UPDATE_TASK_DEFINITION)
+        elif op == "usage":
+            self.conn.execute(
+                "UPDATE maintenance_tasks SET usage_count = COALESCE(usage_count, 0) + ?,"
+                " history_id = COALESCE(?, history_id)"
+                " WHERE machine_id = ? AND task_id = ? AND has_usage",
+                (event["quantity"], event.get("history_id"), machine_id, event["task_id"])
+            )
+        elif op == "maintenance":
+            self.conn.execute(
+                "UPDATE maintenance_tasks SET last_date = ?,"
+                " usage_count = CASE WHEN has_usage THEN 0 ELSE NULL END,"
+                " history_id = COALESCE(?, history_id)"
+                " WHERE machine_id = ? AND task_id = ?",
+                (event["date"], event.get("history_id"), machine_id, event["task_id"])
+            )
+        elif op == "task_definition":
+            fields = {field: event["fields"][field] for field in TaskTemplate._fields if field in event["fields"]}
+            if "has_usage" in fields:
+                fields["has_usage"] = 1 if fields["has_usage"] else 0
+                if not fields["has_usage"]:
+                    fields["threshold_usage"] = None
+            assignments = [f"{field} = ?" for field in fields]
+            params = list(fields.values())
+            if "has_usage" in fields:
+                assignments.append("usage_count = CASE WHEN ? THEN COALESCE(usage_count, 0) ELSE NULL END")
+                params.append(fields["has_usage"])
+            if assignments:
+                self.conn.execute(
+                    f"UPDATE maintenance_tasks SET {', '.join(assignments)} WHERE machine_id = ? AND task_id = ?",
+                    (*params, machine_id, event["task_id"])
+                )
+        else:
+            raise ValueError(f"Operación desconocida: {op}")
+        self.conn.execute("UPDATE machines SET version = ? WHERE id = ?", (version, machine_id))
+
+    def close(self):
+        self.conn.close()
+
+    def _migrate_schema(self):
+        # Bases de datos creadas antes de existir el historial de uso.
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(maintenance_tasks)")]
+        if "history_id" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE maintenance_tasks ADD COLUMN history_id INTEGER")
+        # ... y antes de los ids persistentes de máquina. Se asignan en una
+        # transacción de escritura para que todas las estaciones vean los mismos.
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(machines)")]
+        if "uid" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE machines ADD COLUMN uid TEXT")
+        # ... y antes de las sedes.
+        if "site" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE machines ADD COLUMN site TEXT")
+        # ... y antes de las versiones de los cambios.
+        if "version" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE machines ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("BEGIN IMMEDIATE")
+        with self.conn:
+            missing = [row[0] for row in self.conn.execute("SELECT id FROM machines WHERE uid IS NULL")]
+            self.conn.executemany("UPDATE machines SET uid = ? WHERE id = ?", [(new_machine_id(), i) for i in missing])
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_machines_uid ON machines(uid)")
+
+    def _machine_id(self, event):
+        # Fila de la máquina del evento, por id o, en eventos antiguos, por su
+        # índice en la lista (las posiciones pueden tener huecos).
+        if "machine_idx" in event:
+            row = self.conn.execute(
+                "SELECT id FROM machines ORDER BY position LIMIT 1 OFFSET ?", (event["machine_idx"],)).fetchone()
+        else:
+            row = self.conn.execute("SELECT id FROM machines WHERE uid = ?", (event["machine_id"],)).fetchone()
+        return row[0] if row is not None else None
+
+    def _insert_machine(self, position, machine):
+        cursor = self.conn.execute(
+            "INSERT INTO machines (position, uid, name, machine_type, start_date, site, version)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (position, machine.get("id") or new_machine_id(), machine["name"], machine["machine_type"],
+             machine["start_date"], machine.get("site"), machine.get("version", 0))
+        )
+        for task_id, task in machine.get("maintenance_tasks", {}).items():
+            self._upsert_task(cursor.lastrowid, machine["machine_type"], task_id, task)
+
+    def _upsert_task(self, machine_id, machine_type, task_id, task, statement=UPSERT_TASK):
+        task = expand_task(machine_type, task_id, task)
+        self.conn.execute(statement, (
+            machine_id,
+            task_id,
+            task.get("name"),
+            1 if task.get("has_usage") else 0,
+            task.get("threshold_days"),
+            task.get("threshold_usage"),
+            task.get("last_date"),
+            task.get("usage_count"),
+            task.get("history_id")
+        ))
+
+
+def migrate_json_to_sqlite(json_file=DATA_FILE, db_file=SQLITE_FILE, journal_file=JOURNAL_FILE):
+    # Migración única: carga el JSON (incluido su journal) y lo vuelca a SQLite.
+    data = JsonBackend(json_file, journal_file).load_data()
+    backend = SQLiteBackend(db_file)
+    backend.save_data(data)
+    backend.close()
+    return len(data.get("machines", []))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    count = migrate_json_to_sqlite(*args)
+    print(f"Migradas {count} máquinas a SQLite.")
@@ -0,0 +1,139 @@
+# tests/test_api_server.py
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from api_server import ApiError, ApiServer
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from usage_history import UsageHistory
+
+
+class ApiServerTest(unittest.TestCase):
+    # Endpoints y errores de la API, y HTTP con keep-alive sobre un socket real.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(os.path.join(self.tmp, "history.bin")))
+        for name, machine_type in [("Cafe", "coffee_machine"), ("Molino", "grinder"), ("Molino", "grinder")]:
+            self.fleet.add_machine(Machine(name, machine_type, "2024-01-01"))
+        self.cafe = self.fleet.keys_by_name("Cafe")[0]
+        self.api = ApiServer(self.fleet)
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def post(self, path, payload):
+        return self.api.dispatch("POST", path, json.dumps(payload).encode("utf-8"))
+
+    def assertApiError(self, status, method, path, body=b""):
+        with self.assertRaises(ApiError) as cm:
+            self.api.dispatch(method, path, body)
+        self.assertEqual(cm.exception.status, status)
+        return str(cm.exception)
+
+    def usage(self):
+        return self.fleet.task_record(self.cafe, "filter")["usage_count"]
+
+    def test_register_usage_by_name_or_id(self):
+        self.assertEqual(self.post("/usage", {"machine": "Cafe", "task_id": "filter", "liters": 2.5}),
+                         {"machine_id": self.cafe, "task_id": "filter", "usage_count": 2.5})
+        result = self.post("/usage", [
+            {"machine_id": self.cafe, "task_id": "filter", "liters": 1},
+            {"machine_id": self.cafe, "task_id": "descale", "liters": "4"}
+        ])
+        self.assertEqual([row["usage_count"] for row in result], [3.5, 4.0])
+        self.assertEqual(len(self.fleet.task_series(self.cafe, "filter")), 2)
+
+    def test_batch_is_applied_whole_or_not_at_all(self):
+        message = self.assertApiError(400, "POST", "/usage", json.dumps([
+            {"machine": "Cafe", "task_id": "filter", "liters": 1},
+            {"machine": "Cafe", "task_id": "filter", "liters": -1}
+        ]).encode("utf-8"))
+        self.assertEqual(message, "Cantidad no válida")
+        self.assertEqual(self.usage(), 0)
+
+    def test_errors(self):
+        cases = [
+            (400, {"machine": "Cafe", "task_id": "filter", "liters": "mucho"}),
+            (400, {"machine": "Cafe", "task_id": "filter", "liters": "inf"}),
+            (400, {"machine": "Cafe", "task_id": "filter"}),
+            (409, {"machine": "Molino", "task_id": "cleaning", "liters": 1}),
+            (404, {"machine": "Nadie", "task_id": "filter", "liters": 1}),
+            (404, {"machine_id": ["x"], "task_id": "filter", "liters": 1}),
+            (404, {"machine": "Cafe", "task_id": "grifo", "liters": 1})
+        ]
+        for status, payload in cases:
+            with self.subTest(payload=payload):
+                self.assertApiError(status, "POST", "/usage", json.dumps(payload).encode("utf-8"))
+        molino = self.fleet.keys_by_name("Molino")[0]
+        self.assertEqual(self.assertApiError(400, "POST", "/usage", json.dumps(
+            {"machine_id": molino, "task_id": "cleaning", "liters": 1}).encode("utf-8")),
+            "La tarea no usa contador")
+        self.assertApiError(400, "POST", "/usage", b"{")
+        self.assertApiError(400, "POST", "/usage", b"[1]")
+        self.assertApiError(405, "GET", "/usage")
+        self.assertApiError(404, "GET", "/nada")
+        self.assertApiError(400, "GET", "/due?days=pronto")
+        self.assertApiError(400, "GET", "/report?table=nada")
+        self.assertEqual(self.usage(), 0)
+
+    def test_due_and_maintenance(self):
+        self.post("/usage", {"machine": "Cafe", "task_id": "filter", "liters": 40})
+        due = self.api.dispatch("GET", "/due?limit=1", b"")
+        self.assertEqual([(row["machine"], row["task_id"], row["status"]) for row in due],
+                         [("Cafe", "filter", "uso_alcanzado")])
+        result = self.post("/maintenance", {"machine": "Cafe", "task_id": "filter"})
+        self.assertIsNotNone(result["last_date"])
+        self.assertEqual(self.usage(), 0)
+        self.assertNotIn(("Cafe", "filter"), [(row["machine"], row["task_id"]) for row in
+                                               self.api.dispatch("GET", "/due", b"")])
+        machines = self.api.dispatch("GET", "/machines", b"")
+        self.assertEqual(sorted(row["name"] for row in machines), ["Cafe", "Molino", "Molino"])
+
+    def test_http_keep_alive(self):
+        async def exchange():
+            server = await asyncio.start_server(self.api.handle_connection, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = json.dumps({"machine": "Cafe", "task_id": "filter", "liters": 3}).encode("utf-8")
+            writer.write(b"POST /usage HTTP/1.1\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            writer.write(b"GET /nada HTTP/1.1\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            responses = [await read_response(reader), await read_response(reader)]
+            self.assertEqual(await reader.read(), b"")
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses
+
+        (status, payload), (status2, payload2) = asyncio.run(exchange())
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["usage_count"], 3.0)
+        self.assertEqual(status2, 404)
+        self.assertEqual(payload2, {"error": "Ruta no encontrada."})
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# tests/test_cli.py
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+import cli
+from config import DATA_FILE, JOURNAL_FILE
+from data_manager import DataManager, JsonBackend
+from machine import Machine
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli.py")
+
+
+class FailingBackend(JsonBackend):
+    def record_events(self, events):
+        raise OSError("Disco lleno")
+
+
+class CliTest(unittest.TestCase):
+    # Códigos de salida de cada subcomando, ejecutado como en una tarea
+    # programada: otro proceso sobre los ficheros de la carpeta actual.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        old = (date.today() - timedelta(days=40)).isoformat()
+        machines = [Machine("Cafe", "coffee_machine", date.today().isoformat()),
+                    Machine("Molino", "grinder", old),
+                    Machine("Doble", "grinder", old),
+                    Machine("Doble", "grinder", old)]
+        self.new_backend().save_data({"machines": [machine.to_dict() for machine in machines]})
+
+    def tearDown(self):
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def new_backend(self, backend=JsonBackend):
+        return backend(os.path.join(self.tmp, DATA_FILE), os.path.join(self.tmp, JOURNAL_FILE))
+
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, CLI, *args], cwd=self.tmp, capture_output=True, text=True,
+                              encoding="utf-8", timeout=60)
+
+    def assertExit(self, code, *args):
+        result = self.run_cli(*args)
+        self.assertEqual(result.returncode, code, result.stderr)
+        return result
+
+    def write(self, name, text):
+        with open(os.path.join(self.tmp, name), "w", encoding="utf-8") as f:
+            f.write(text)
+        return name
+
+    def test_due(self):
+        self.assertExit(0, "due")
+        self.assertExit(1, "due", "--fail-if-due")
+        rows = json.loads(self.assertExit(0, "due", "--json").stdout)
+        self.assertEqual(sorted(row["machine"] for row in rows), ["Doble", "Doble", "Molino"])
+        self.assertExit(2, "due", "--days", "pronto")
+
+    def test_register(self):
+        self.assertExit(0, "register-usage", "Cafe", "filter", "40")
+        # Se guardó: el siguiente proceso lo ve.
+        rows = json.loads(self.assertExit(0, "due", "--json").stdout)
+        self.assertIn(("Cafe", "uso_alcanzado"), [(row["machine"], row["status"]) for row in rows])
+        self.assertExit(0, "register-maintenance", "Cafe", "filter")
+        self.assertExit(0, "register-maintenance", "Molino", "cleaning")
+
+        for args, message in [
+            (("register-usage", "Nadie", "filter", "1"), "Error: máquina no encontrada: Nadie"),
+            (("register-usage", "Doble", "cleaning", "1"), "Error: hay 2 máquinas con el nombre Doble"),
+            (("register-usage", "Cafe", "grifo", "1"), "Error: Tarea de mantenimiento no encontrada."),
+            (("register-usage", "Cafe", "filter", "mucho"), "Error: La cantidad debe ser un número."),
+            (("register-usage", "Cafe", "filter", "nan"), "Error: Cantidad no válida"),
+            (("register-usage", "Molino", "cleaning", "1"), "Error: La tarea no usa contador"),
+            (("register-maintenance", "Cafe", "grifo"), "Error: Tarea de mantenimiento no encontrada.")
+        ]:
+            with self.subTest(args=args):
+                self.assertEqual(self.assertExit(1, *args).stderr.strip(), message)
+        rows = json.loads(self.assertExit(0, "due", "--json").stdout)
+        self.assertEqual(sorted(row["machine"] for row in rows), ["Doble", "Doble"])
+
+    def test_import(self):
+        header = "machine,task_id,liters,timestamp\n"
+        self.assertExit(0, "import", self.write("ok.csv", header + "Cafe,filter,2,2024-05-01T10:00:00\n"))
+        result = self.assertExit(3, "import", self.write("mal.csv", header + "Cafe,filter,2,2024-05-01\n"
+                                                                              "Nadie,filter,1,2024-05-01\n"))
+        self.assertIn("Rechazadas: 1", result.stdout)
+        self.assertEqual(self.assertExit(0, "export").stdout.count('"usage_count": 4'), 1)
+
+    def test_import_that_cannot_be_saved(self):
+        path = self.write("ok.csv", "machine,task_id,liters,timestamp\nCafe,filter,2,2024-05-01T10:00:00\n")
+        DataManager.backend = self.new_backend(FailingBackend)
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                status = cli.main(["import", path])
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(status, 1)
+        self.assertIn("Error al guardar: Disco lleno", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# tests/test_due_alerts.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+import due_alerts
+from data_manager import DataManager, JsonBackend
+from due_alerts import DueAlertScheduler, MAX_WAIT_SECONDS, STATUS_OVERDUE, STATUS_USAGE
+from fleet import Fleet
+from machine import Machine
+from usage_history import UsageHistory
+
+
+class Clock:
+    # Día que ven los avisos; a mediodía para que la espera no sea cero.
+    def __init__(self):
+        self.today = date.today()
+
+    def date(self):
+        clock = self
+
+        class FakeDate(date):
+            @classmethod
+            def today(cls):
+                return clock.today
+        return FakeDate
+
+    def datetime(self):
+        clock = self
+
+        class FakeDateTime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.combine(clock.today, time(12))
+        return FakeDateTime
+
+
+class DueAlertTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(os.path.join(self.tmp, "history.bin")))
+        self.clock = Clock()
+        for target, value in [("date", self.clock.date()), ("datetime", self.clock.datetime())]:
+            patcher = mock.patch.object(due_alerts, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.timers = []
+        self.changes = []
+        self.old = self.add("Vieja", "grinder", 40)  # ya vencida al empezar
+        self.manana = self.add("Mañana", "grinder", 29)
+        self.lejos = self.add("Lejos", "grinder", 20)
+        self.cafe = self.add("Cafe", "coffee_machine", 0)
+        self.alerts = DueAlertScheduler(self.fleet, self.call_later, self.timers.remove, on_change=self.changes.append)
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def add(self, name, machine_type, days_ago):
+        machine = Machine(name, machine_type, (self.clock.today - timedelta(days=days_ago)).isoformat())
+        self.fleet.add_machine(machine)
+        return machine.machine_id
+
+    def call_later(self, seconds, callback):
+        timer = (seconds, callback)
+        self.timers.append(timer)
+        return timer
+
+    def fire(self, days):
+        # Pasan `days` días y salta el único temporizador armado.
+        self.clock.today += timedelta(days=days)
+        self.assertEqual(len(self.timers), 1)
+        _, callback = self.timers.pop()
+        callback()
+
+    def pending(self):
+        return [(alert["machine"], alert["task_id"], alert["status"]) for alert in self.alerts.alerts()]
+
+    def test_one_timer_for_the_next_deadline(self):
+        self.assertEqual(self.pending(), [])
+        self.assertEqual(self.timers[0][0], MAX_WAIT_SECONDS)
+        self.assertEqual(self.alerts._timer_deadline, self.clock.today.toordinal() + 1)
+
+        self.fire(1)
+        self.assertEqual(self.pending(), [("Mañana", "cleaning", STATUS_OVERDUE)])
+        self.assertEqual([[alert["machine"] for alert in new] for new in self.changes], [["Mañana"]])
+        self.assertEqual(self.alerts._timer_deadline, self.clock.today.toordinal() + 9)
+
+        # Si el equipo estuvo parado, al despertar se avisa de todo lo vencido entretanto.
+        self.fire(30)
+        self.assertEqual([alert["machine"] for alert in self.changes[-1]], ["Lejos"])
+        self.assertEqual(len(self.timers), 1)
+
+    def test_usage_and_maintenance(self):
+        self.fleet.register_usage(self.cafe, "filter", 39)
+        self.assertEqual(self.pending(), [])
+        self.fleet.register_usage(self.cafe, "filter", 1)
+        self.assertEqual(self.pending(), [("Cafe", "filter", STATUS_USAGE)])
+
+        self.fleet.register_maintenance(self.cafe, "filter")
+        self.assertEqual(self.pending(), [])
+        self.assertEqual(self.changes[-1], [])
+
+        # Atender una tarea que ya estaba vencida al empezar aplaza su plazo.
+        self.fleet.register_maintenance(self.old, "cleaning")
+        self.assertEqual(self.alerts._timer_deadline, self.clock.today.toordinal() + 1)
+        # Si el plazo más próximo se aplaza, el temporizador salta sin avisar
+        # de nada y se arma para el siguiente.
+        self.fleet.register_maintenance(self.manana, "cleaning")
+        changes = len(self.changes)
+        self.fire(1)
+        self.assertEqual(len(self.changes), changes)
+        self.assertEqual(self.alerts._timer_deadline, self.clock.today.toordinal() + 9)
+
+    def test_dismiss_and_remove(self):
+        self.fire(1)
+        self.alerts.dismiss(self.manana, "cleaning")
+        self.assertEqual(self.pending(), [])
+        self.fleet.register_usage(self.cafe, "descale", 1)
+        self.assertEqual(self.pending(), [])
+
+        self.fleet.register_usage(self.cafe, "filter", 50)
+        self.assertEqual(len(self.pending()), 1)
+        self.fleet.remove_machine(self.cafe)
+        self.assertEqual(self.pending(), [])
+
+        # Una máquina nueva que vence antes adelanta el temporizador.
+        self.add("Pronto", "grinder", 29)
+        self.assertEqual(self.alerts._timer_deadline, self.clock.today.toordinal() + 1)
+        self.alerts.stop()
+        self.assertEqual(self.timers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# tests/test_due_index.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from data_manager import DataManager, JsonBackend
+from due_index import DueIndex, is_due
+from fleet import Fleet
+from machine import Machine
+from maintenance_task import NO_DEADLINE
+from usage_history import UsageHistory
+
+TODAY = date(2024, 6, 1)
+
+
+def day(offset):
+    return TODAY.toordinal() + offset
+
+
+class DueIndexTest(unittest.TestCase):
+    # Orden del índice, actualizaciones y consultas por fecha.
+    def setUp(self):
+        self.index = DueIndex()
+        self.index.bulk_load([
+            ("a", "filter", (1, day(10))),
+            ("a", "descale", (1, NO_DEADLINE)),
+            ("b", "filter", (0, day(40))),
+            ("b", "cleaning", (1, day(-3))),
+            ("c", "cleaning", (1, day(2)))
+        ])
+
+    def keys(self, entries):
+        return [(entry[2], entry[3]) for entry in entries]
+
+    def test_usage_reached_first_then_by_deadline(self):
+        self.assertEqual(self.keys(self.index.due_within(10_000, TODAY)), [
+            ("b", "filter"), ("b", "cleaning"), ("c", "cleaning"), ("a", "filter")
+        ])
+        self.assertEqual(self.keys(self.index.most_overdue(5, TODAY)), [("b", "filter"), ("b", "cleaning")])
+        self.assertEqual(self.keys(self.index.most_overdue(1, TODAY)), [("b", "filter")])
+        self.assertTrue(is_due(self.index.entry("b", "filter"), TODAY))
+        self.assertTrue(is_due(self.index.entry("b", "cleaning"), TODAY))
+        self.assertFalse(is_due(self.index.entry("c", "cleaning"), TODAY))
+
+    def test_due_within_days(self):
+        self.assertEqual(self.keys(self.index.due_within(0, TODAY)), [("b", "filter"), ("b", "cleaning")])
+        self.assertEqual(self.keys(self.index.due_within(2, TODAY)),
+                         [("b", "filter"), ("b", "cleaning"), ("c", "cleaning")])
+
+    def test_next_deadline(self):
+        self.assertEqual(self.index.next_deadline(TODAY), day(2))
+        self.assertEqual(self.index.next_deadline(TODAY + timedelta(days=2)), day(10))
+        # Solo queda la tarea sin plazo.
+        self.assertIsNone(self.index.next_deadline(TODAY + timedelta(days=10)))
+        self.assertIsNone(DueIndex().next_deadline(TODAY))
+
+    def test_reached_between(self):
+        self.assertEqual(self.keys(self.index.reached_between(TODAY, TODAY + timedelta(days=10))),
+                         [("c", "cleaning"), ("a", "filter")])
+        self.assertEqual(self.index.reached_between(TODAY, TODAY + timedelta(days=1)), [])
+
+    def test_update_and_remove_keep_order(self):
+        self.index.update("a", "filter", (1, day(-10)))
+        self.index.update("c", "cleaning", (0, day(2)))
+        self.assertEqual(self.keys(self.index.due_within(0, TODAY)),
+                         [("c", "cleaning"), ("b", "filter"), ("a", "filter"), ("b", "cleaning")])
+        self.assertEqual(len(self.index), 5)
+
+        self.index.remove("a", "filter")
+        self.assertIsNone(self.index.entry("a", "filter"))
+        self.index.remove_machine("b")
+        self.assertEqual(self.keys(self.index.due_within(10_000, TODAY)), [("c", "cleaning")])
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index._entries, sorted(self.index._entries))
+
+
+class FleetDueIndexTest(unittest.TestCase):
+    # La flota mantiene el índice al cambiar las tareas.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(os.path.join(self.tmp, "history.bin")))
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def test_due_tasks_follow_changes(self):
+        old = (date.today() - timedelta(days=100)).isoformat()
+        recent = date.today().isoformat()
+        self.fleet.add_machine(Machine("Vieja", "grinder", old))
+        self.fleet.add_machine(Machine("Nueva", "coffee_machine", recent))
+        old_key, new_key = self.fleet.keys_by_name("Vieja")[0], self.fleet.keys_by_name("Nueva")[0]
+        self.assertEqual([(row["machine"], row["status"]) for row in self.fleet.due_tasks()], [("Vieja", "vencida")])
+
+        self.fleet.register_usage(new_key, "filter", 40)
+        self.assertEqual([(row["machine"], row["task_id"], row["status"]) for row in self.fleet.due_tasks()],
+                         [("Nueva", "filter", "uso_alcanzado"), ("Vieja", "cleaning", "vencida")])
+
+        self.fleet.register_maintenance(old_key, "cleaning")
+        self.fleet.register_maintenance(new_key, "filter")
+        self.assertEqual(self.fleet.due_tasks(), [])
+        self.assertEqual(self.fleet.due_index.next_deadline(), date.today().toordinal() + 30)
+
+        self.fleet.remove_machine(old_key)
+        self.assertEqual(self.fleet.due_index.next_deadline(), date.today().toordinal() + 90)
+
+
+if __name__ == "__main__":
+    unittest.main()
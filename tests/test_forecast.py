@@ -0,0 +1,72 @@
+# tests/test_forecast.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from forecast import Forecaster
+from machine import Machine
+from usage_history import UsageHistory
+
+
+class ForecastTest(unittest.TestCase):
+    # Previsión por fecha límite y por ritmo de uso reciente, y su caché al
+    # cambiar la flota.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(os.path.join(self.tmp, "history.bin")))
+        self.today = date.today()
+        self.fleet.add_machine(Machine("Cafe", "coffee_machine", self.today.isoformat()))
+        self.fleet.add_machine(Machine("Molino", "grinder", self.today.isoformat()))
+        self.cafe = self.fleet.keys_by_name("Cafe")[0]
+        self.molino = self.fleet.keys_by_name("Molino")[0]
+        self.forecaster = Forecaster(self.fleet, window_days=10)
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def predicted(self, days=None):
+        return [((when - self.today).days, key, task_id) for when, key, task_id in self.forecaster.forecast(days)]
+
+    def test_by_deadline_without_usage(self):
+        self.assertEqual(self.predicted(), [
+            (30, self.molino, "cleaning"), (90, self.cafe, "filter"), (90, self.cafe, "descale")
+        ])
+        self.assertEqual(self.predicted(30), [(30, self.molino, "cleaning")])
+        self.assertEqual(self.predicted(29), [])
+
+    def test_recent_usage_rate(self):
+        # 20 litros en la ventana de 10 días: 2 l/día, faltan 20 para el filtro
+        # y 280 para la descalcificación (esta vence antes por fecha).
+        self.fleet.register_usage(self.cafe, "filter", 20)
+        self.fleet.register_usage(self.cafe, "descale", 20)
+        self.assertEqual(self.predicted(), [
+            (10, self.cafe, "filter"), (30, self.molino, "cleaning"), (90, self.cafe, "descale")
+        ])
+        self.fleet.register_usage(self.cafe, "filter", 20)
+        self.assertEqual(self.predicted(0), [(0, self.cafe, "filter")])
+
+    def test_cached_order_follows_changes(self):
+        first = self.forecaster.forecast()
+        first.clear()
+        self.assertEqual(len(self.forecaster.forecast()), 3)
+
+        self.fleet.remove_machine(self.molino)
+        self.assertEqual(self.predicted(), [(90, self.cafe, "filter"), (90, self.cafe, "descale")])
+        self.fleet.add_machine(Machine("Nuevo", "grinder", (self.today - timedelta(days=25)).isoformat()))
+        nuevo = self.fleet.keys_by_name("Nuevo")[0]
+        self.assertEqual(self.predicted(30), [(5, nuevo, "cleaning")])
+        self.fleet.register_maintenance(nuevo, "cleaning")
+        self.assertEqual(self.predicted(30), [(30, nuevo, "cleaning")])
+
+
+if __name__ == "__main__":
+    unittest.main()
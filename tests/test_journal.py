@@ -0,0 +1,123 @@
+# tests/test_journal.py
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from usage_history import UsageHistory
+
+
+class JournalTest(unittest.TestCase):
+    # Los cambios se añaden al journal y se reproducen sobre el snapshot al
+    # cargar; al compactar pasan al snapshot y el journal se borra.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp, "machines_data.json")
+        self.journal_file = os.path.join(self.tmp, "machines_data.journal")
+        DataManager.backend = self.new_backend()
+        DataManager.save_data({"machines": []})
+        self.fleet = self.load()
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def new_backend(self):
+        return JsonBackend(self.data_file, self.journal_file, journal_enabled=True)
+
+    def load(self):
+        # Como al arrancar otra vez: backend nuevo sobre los mismos ficheros.
+        DataManager.backend = self.new_backend()
+        data = DataManager.load_data()
+        return Fleet(data["machines"], history=UsageHistory(os.path.join(self.tmp, "history.bin")),
+                     removed=data.get("removed"))
+
+    def add_machines(self, count):
+        for i in range(count):
+            self.fleet.add_machine(Machine(f"M{i}", "coffee_machine", "2024-01-01"))
+        return self.fleet.keys()
+
+    def assertSameFleet(self, fleet, other):
+        def records(f):
+            return json.loads(json.dumps(sorted(f.to_records(), key=lambda r: r["id"])))
+        self.assertEqual(records(fleet), records(other))
+
+    def journal_events(self):
+        with open(self.journal_file, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_replay_restores_changes(self):
+        keys = self.add_machines(3)
+        self.fleet.register_usage(keys[0], "filter", 12.5)
+        self.fleet.register_maintenance(keys[1], "descale")
+        self.fleet.remove_machine(keys[2])
+
+        # El snapshot sigue vacío: todo está en el journal.
+        with open(self.data_file, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["machines"], [])
+        self.assertEqual([event["seq"] for event in self.journal_events()], list(range(1, 7)))
+
+        loaded = self.load()
+        self.assertSameFleet(loaded, self.fleet)
+        self.assertEqual(loaded.task_record(keys[0], "filter")["usage_count"], 12.5)
+        self.assertNotIn(keys[2], loaded)
+
+    def test_compaction_moves_journal_into_snapshot(self):
+        keys = self.add_machines(2)
+        self.fleet.register_usage(keys[0], "filter", 3)
+        self.fleet.save()
+        self.assertFalse(os.path.exists(self.journal_file))
+
+        # Los cambios siguientes vuelven al journal, numerados a continuación.
+        self.fleet.register_usage(keys[0], "filter", 4)
+        self.assertEqual([event["seq"] for event in self.journal_events()], [4])
+
+        loaded = self.load()
+        self.assertSameFleet(loaded, self.fleet)
+        self.assertEqual(loaded.task_record(keys[0], "filter")["usage_count"], 7)
+
+    def test_replay_skips_events_already_in_snapshot(self):
+        # Corte entre escribir el snapshot y borrar el journal: el journal
+        # antiguo sigue ahí, pero sus cambios no se aplican dos veces.
+        keys = self.add_machines(1)
+        self.fleet.register_usage(keys[0], "filter", 5)
+        shutil.copy(self.journal_file, self.journal_file + ".old")
+        self.fleet.save()
+        os.replace(self.journal_file + ".old", self.journal_file)
+
+        loaded = self.load()
+        self.assertEqual(loaded.task_record(keys[0], "filter")["usage_count"], 5)
+
+    def test_torn_last_line_is_ignored(self):
+        keys = self.add_machines(1)
+        self.fleet.register_usage(keys[0], "filter", 5)
+        with open(self.journal_file, "ab") as f:
+            f.write(b'{"op":"usage","machine_id":"')
+
+        loaded = self.load()
+        self.assertEqual(loaded.task_record(keys[0], "filter")["usage_count"], 5)
+        # Al escribir de nuevo se quita el final a medias.
+        loaded.register_usage(keys[0], "filter", 1)
+        self.assertEqual(len(self.journal_events()), 3)
+        self.assertEqual(self.load().task_record(keys[0], "filter")["usage_count"], 6)
+
+    def test_compact_waits_for_unsynced_remote_changes(self):
+        keys = self.add_machines(1)
+        other = self.new_backend()
+        other.load_data()
+        other.record_events([{"op": "usage", "machine_id": keys[0], "task_id": "filter", "quantity": 2.0}])
+
+        # El snapshot no incluye el cambio de la otra estación: no se escribe.
+        self.assertFalse(DataManager.compact(self.fleet.to_data(), 0))
+        self.assertTrue(os.path.exists(self.journal_file))
+
+        # Una vez incorporado, sí.
+        self.assertEqual(self.fleet.sync(), {keys[0]})
+        self.fleet.save()
+        self.assertFalse(os.path.exists(self.journal_file))
+        self.assertEqual(self.load().task_record(keys[0], "filter")["usage_count"], 2)
@@ -0,0 +1,106 @@
+# tests/test_machine_search.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from machine_search import MachineSearch, normalize, STATUS_OK, STATUS_OVERDUE, STATUS_SOON
+from usage_history import UsageHistory
+
+
+def days_ago(days):
+    return (date.today() - timedelta(days=days)).isoformat()
+
+
+class MachineSearchTest(unittest.TestCase):
+    # Los resultados deben ser los de comprobar nombre a nombre, también
+    # después de cambiar la flota.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(os.path.join(self.tmp, "history.bin")))
+        self.add("Cafetera Bar", "coffee_machine", days_ago(0))
+        self.add("Máquina Sala", "coffee_machine", days_ago(0))
+        self.add("MAQUINA cocina", "grinder", days_ago(40))  # vencida
+        self.add("Molino Terraza", "grinder", days_ago(25))  # próxima
+        self.add("Molino Ático", "grinder", days_ago(0))
+        # Relleno para que las búsquedas poco frecuentes localicen las
+        # coincidencias una a una y las frecuentes recorran todos los nombres.
+        for i in range(40):
+            self.add(f"Equipo {i:02d}", "coffee_machine", days_ago(0))
+        self.search = MachineSearch(self.fleet)
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def add(self, name, machine_type, start_date):
+        machine = Machine(name, machine_type, start_date)
+        self.fleet.add_machine(machine)
+        return machine.machine_id
+
+    def expected(self, text="", machine_type=None, status=None):
+        rows = []
+        for key, name in self.fleet.names():
+            if normalize(text) not in normalize(name):
+                continue
+            if machine_type is not None and self.fleet.summary(key)[1] != machine_type:
+                continue
+            if status is not None and self.search.status_of(key) != status:
+                continue
+            rows.append((normalize(name), key))
+        return [key for _, key in sorted(rows)]
+
+    def assertSearches(self):
+        for text in ["", "maquina", "MÁQUINA", "molino", "atico", "equipo", "equipo 1", "o", "nada", "\x00"]:
+            for machine_type in [None, "grinder", "coffee_machine"]:
+                for status in [None, STATUS_OK, STATUS_SOON, STATUS_OVERDUE]:
+                    with self.subTest(text=text, machine_type=machine_type, status=status):
+                        self.assertEqual(self.search.search(text, machine_type, status),
+                                         self.expected(text, machine_type, status))
+
+    def names(self, keys):
+        return [self.fleet.summary(key)[0] for key in keys]
+
+    def test_text_ignores_case_and_accents(self):
+        self.assertEqual(self.names(self.search.search(" maquina ")), ["MAQUINA cocina", "Máquina Sala"])
+        self.assertEqual(self.names(self.search.search("ÁTICO")), ["Molino Ático"])
+        self.assertEqual(len(self.search.search("")), 45)
+        self.assertSearches()
+
+    def test_due_status(self):
+        self.assertEqual(self.names(self.search.search(status=STATUS_OVERDUE)), ["MAQUINA cocina"])
+        self.assertEqual(self.names(self.search.search(status=STATUS_SOON)), ["Molino Terraza"])
+        self.assertEqual(self.names(self.search.search("molino", status=STATUS_OK)), ["Molino Ático"])
+
+        terraza = self.fleet.keys_by_name("Molino Terraza")[0]
+        self.fleet.register_maintenance(terraza, "cleaning")
+        self.assertEqual(self.search.search(status=STATUS_SOON), [])
+        cafe = self.fleet.keys_by_name("Cafetera Bar")[0]
+        self.fleet.register_usage(cafe, "filter", 40)
+        self.assertEqual(self.names(self.search.search(status=STATUS_OVERDUE)), ["Cafetera Bar", "MAQUINA cocina"])
+
+    def test_follows_fleet_changes(self):
+        self.search.search("maquina")
+        sala = self.fleet.keys_by_name("Máquina Sala")[0]
+        self.fleet[sala].name = "Barra"
+        self.fleet.update_machine(sala)
+        self.fleet.remove_machine(self.fleet.keys_by_name("Molino Ático")[0])
+        self.add("Otra máquina", "grinder", days_ago(35))
+        self.add("Equipo 07", "grinder", days_ago(0))
+
+        self.assertEqual(self.names(self.search.search("maquina")), ["MAQUINA cocina", "Otra máquina"])
+        self.assertEqual(self.names(self.search.search("barra")), ["Barra"])
+        self.assertEqual(len(self.search.search("equipo 07")), 2)
+        self.assertSearches()
+
+
+if __name__ == "__main__":
+    unittest.main()
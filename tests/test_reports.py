@@ -0,0 +1,129 @@
+# tests/test_reports.py
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from reports import FleetReport, TABLES, write_csv, write_json
+from usage_history import UsageHistory, history_rows, KIND_USAGE
+
+
+def timestamp(year, month, day=15):
+    return time.mktime((year, month, day, 12, 0, 0, 0, 0, -1))
+
+
+class FleetReportTest(unittest.TestCase):
+    # Los totales mantenidos con cada cambio deben coincidir con los de un
+    # informe creado desde cero.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.tmp, "history.bin")
+        DataManager.backend = JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                                          os.path.join(self.tmp, "machines_data.journal"))
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(self.history_file))
+        self.cafe_a = self.add("Cafe A", "coffee_machine", 0)
+        self.cafe_b = self.add("Cafe B", "coffee_machine", 0)
+        self.molino = self.add("Molino", "grinder", 40)  # limpieza vencida
+        self.import_usage([(self.cafe_a, "filter", 10, timestamp(2024, 1)),
+                           (self.cafe_a, "filter", 5, timestamp(2024, 2)),
+                           (self.cafe_b, "filter", 2.5, timestamp(2024, 1)),
+                           (self.cafe_b, "descale", 7, timestamp(2024, 2))])
+        self.report = FleetReport(self.fleet)
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def add(self, name, machine_type, days_ago):
+        machine = Machine(name, machine_type, (date.today() - timedelta(days=days_ago)).isoformat())
+        self.fleet.add_machine(machine)
+        return machine.machine_id
+
+    def import_usage(self, events):
+        # Como una importación: cada uso con su propia fecha.
+        for key, task_id, liters, when in events:
+            history = history_rows([(self.fleet.history_id_for(key, task_id), KIND_USAGE, liters, when)])
+            self.fleet.bulk_register_usage([(key, task_id, liters)], history=history)
+
+    def assertMatchesFresh(self):
+        fresh = FleetReport(self.fleet)
+        for table in TABLES:
+            with self.subTest(table=table):
+                self.assertEqual(self.report.table(table), fresh.table(table))
+
+    def test_totals(self):
+        self.assertEqual(self.report.monthly(), [
+            {"machine_type": "coffee_machine", "task_id": "descale", "month": "2024-02", "liters": 7.0,
+             "maintenances": 0},
+            {"machine_type": "coffee_machine", "task_id": "filter", "month": "2024-01", "liters": 12.5,
+             "maintenances": 0},
+            {"machine_type": "coffee_machine", "task_id": "filter", "month": "2024-02", "liters": 5.0,
+             "maintenances": 0}
+        ])
+        self.assertEqual(self.report.liters_by_type(), [
+            {"machine_type": "coffee_machine", "month": "2024-01", "liters": 12.5},
+            {"machine_type": "coffee_machine", "month": "2024-02", "liters": 12.0}
+        ])
+        self.assertEqual([(row["task_id"], row["tasks"], row["overdue"]) for row in self.report.overdue()],
+                         [("descale", 2, 0), ("filter", 2, 0), ("cleaning", 1, 1)])
+
+    def test_incremental_matches_rebuild(self):
+        month = time.strftime("%Y-%m")
+        self.fleet.register_usage(self.cafe_a, "filter", 30)
+        self.assertEqual([(row["tasks"], row["overdue"], row["overdue_rate"]) for row in self.report.overdue()
+                          if row["task_id"] == "filter"], [(2, 1, 0.5)])
+        self.assertIn({"machine_type": "coffee_machine", "month": month, "liters": 30.0},
+                      self.report.liters_by_type())
+        self.assertMatchesFresh()
+
+        self.fleet.register_maintenance(self.cafe_a, "filter")
+        self.fleet.register_maintenance(self.molino, "cleaning")
+        self.assertMatchesFresh()
+
+        # Al borrar una máquina sus litros dejan de contar.
+        self.fleet.remove_machine(self.cafe_b)
+        self.assertNotIn("descale", [row["task_id"] for row in self.report.monthly()])
+        self.assertMatchesFresh()
+
+        cafe_c = self.add("Cafe C", "coffee_machine", 100)
+        self.import_usage([(cafe_c, "descale", 4, timestamp(2024, 2))])
+        self.assertMatchesFresh()
+
+    def test_rows_written_by_another_station(self):
+        history_id = self.fleet.history_id_for(self.cafe_a, "filter")
+        other = UsageHistory(self.history_file)
+        try:
+            other.append_many([(history_id, KIND_USAGE, 8, timestamp(2024, 1))])
+        finally:
+            other.close()
+        self.fleet.register_usage(self.cafe_b, "filter", 1)
+        january = [row for row in self.report.monthly() if row["month"] == "2024-01"]
+        self.assertEqual(january[0]["liters"], 20.5)
+        self.assertMatchesFresh()
+
+    def test_export(self):
+        rows = self.report.table("monthly")
+        out = io.StringIO()
+        write_csv(rows, TABLES["monthly"], out)
+        out.seek(0)
+        read = list(csv.DictReader(out))
+        self.assertEqual([row["month"] for row in read], [row["month"] for row in rows])
+        self.assertEqual(float(read[1]["liters"]), 12.5)
+
+        out = io.StringIO()
+        write_json(rows, out)
+        self.assertEqual(json.loads(out.getvalue()), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# tests/test_sharded_backend.py
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import sharded_backend
+from data_manager import DataManager
+from fleet import Fleet
+from machine import Machine
+from sharded_backend import ShardedBackend
+from usage_history import UsageHistory
+
+SITES = [None, "Madrid", "Cádiz"]
+
+
+class ShardedBackendTest(unittest.TestCase):
+    # Cada sede en sus ficheros: guardar, cargar (también en paralelo) y
+    # compactar solo lo que cambió.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fleet = self.load()
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def new_backend(self, **options):
+        return ShardedBackend(self.path("shards.json"), self.path("machines_data.json"),
+                              self.path("machines_data.journal"), journal_enabled=True, **options)
+
+    def load(self, **options):
+        # Como al arrancar otra vez: backend nuevo sobre los mismos ficheros.
+        DataManager.backend = self.new_backend(**options)
+        data = DataManager.load_data()
+        return Fleet(data["machines"], history=UsageHistory(self.path("history.bin")), removed=data.get("removed"))
+
+    def reload(self, **options):
+        self.fleet.history.close()
+        self.fleet = self.load(**options)
+        return self.fleet
+
+    def add_machines(self):
+        keys = {}
+        for site in SITES:
+            for i in range(2):
+                machine = Machine(f"{site or 'Central'} {i}", "coffee_machine", "2024-01-01", site=site)
+                self.fleet.add_machine(machine)
+                keys[(site, i)] = machine.machine_id
+        return keys
+
+    def records(self, fleet):
+        return json.loads(json.dumps(sorted(fleet.to_records(), key=lambda r: r["id"])))
+
+    def manifest(self):
+        with open(self.path("shards.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_each_site_in_its_own_files(self):
+        keys = self.add_machines()
+        self.fleet.register_usage(keys[("Madrid", 0)], "filter", 5)
+        self.fleet.save()
+
+        self.assertEqual([(entry["site"], entry["data_file"]) for entry in self.manifest()["shards"]],
+                         [("Madrid", "machines_data.madrid.json"), ("Cádiz", "machines_data.cadiz.json")])
+        with open(self.path("machines_data.cadiz.json"), encoding="utf-8") as f:
+            cadiz = json.load(f)["machines"]
+        # La sede no se repite en cada máquina de su fichero.
+        self.assertEqual(sorted(machine["name"] for machine in cadiz), ["Cádiz 0", "Cádiz 1"])
+        self.assertNotIn("site", cadiz[0])
+        for name in ["machines_data.journal", "machines_data.madrid.journal", "machines_data.cadiz.journal"]:
+            self.assertFalse(os.path.exists(self.path(name)))
+
+        expected = self.records(self.fleet)
+        self.assertEqual(self.records(self.reload()), expected)
+        self.assertEqual(self.fleet.site(keys[("Cádiz", 1)]), "Cádiz")
+
+    def test_journal_replay_and_compaction_of_changed_sites(self):
+        keys = self.add_machines()
+        self.fleet.save()
+        stamps = {name: os.stat(self.path(name)).st_mtime_ns
+                  for name in ["machines_data.json", "machines_data.madrid.json", "machines_data.cadiz.json"]}
+
+        self.fleet.register_usage(keys[("Madrid", 1)], "descale", 7)
+        self.fleet.remove_machine(keys[("Cádiz", 0)])
+        self.assertTrue(os.path.exists(self.path("machines_data.madrid.journal")))
+        self.assertFalse(os.path.exists(self.path("machines_data.journal")))
+        expected = self.records(self.fleet)
+        self.assertEqual(self.records(self.reload()), expected)
+
+        self.fleet.save()
+        self.assertEqual(self.records(self.reload()), expected)
+        # La sede sin cambios no se reescribe.
+        self.assertEqual(os.stat(self.path("machines_data.json")).st_mtime_ns, stamps["machines_data.json"])
+        self.assertNotEqual(os.stat(self.path("machines_data.madrid.json")).st_mtime_ns,
+                            stamps["machines_data.madrid.json"])
+
+    def test_parallel_load(self):
+        keys = self.add_machines()
+        self.fleet.save()
+        self.fleet.register_usage(keys[(None, 1)], "filter", 3)
+        expected = self.records(self.fleet)
+
+        with mock.patch.object(sharded_backend, "SHARD_LOAD_WORKERS", 3):
+            self.assertEqual(self.records(self.reload(parallel_min_bytes=0)), expected)
+        # Tras leer en otros procesos, el journal sigue desde donde se quedaron.
+        self.fleet.register_usage(keys[("Cádiz", 1)], "filter", 4)
+        self.fleet.sync()
+        self.assertEqual(self.fleet.task_record(keys[(None, 1)], "filter")["usage_count"], 3)
+        expected = self.records(self.fleet)
+        self.assertEqual(self.records(self.reload()), expected)
+
+    def test_station_with_some_sites(self):
+        keys = self.add_machines()
+        self.fleet.save()
+        fleet = self.reload(sites=["Madrid"])
+        self.assertEqual(sorted(fleet.keys()), sorted([keys[("Madrid", 0)], keys[("Madrid", 1)]]))
+        self.assertEqual(fleet.default_site(), "Madrid")
+        with self.assertRaises(ValueError):
+            fleet.add_machine(Machine("Fuera", "grinder", "2024-01-01", site="Cádiz"))
+
+        fleet.add_machine(Machine("Madrid 2", "grinder", "2024-01-01"))
+        self.assertEqual(len(self.reload()), 7)
+
+    def test_newer_manifest_is_rejected(self):
+        with open(self.path("shards.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": sharded_backend.MANIFEST_VERSION + 1, "shards": []}, f)
+        with self.assertRaises(ValueError):
+            self.new_backend().load_data()
+
+
+if __name__ == "__main__":
+    unittest.main()
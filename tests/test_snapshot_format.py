@@ -0,0 +1,147 @@
+# tests/test_snapshot_format.py
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import snapshot_format
+from data_manager import JsonBackend
+
+
+def sample_data():
+    # Un poco de todo: lo habitual en columnas y lo raro en la sección de extras.
+    return {
+        "journal_seq": 42,
+        "removed": [{"id": "gone", "version": 7, "site": "Madrid"}],
+        "machines": [
+            {
+                "id": "a1", "name": "Barra", "machine_type": "coffee_machine", "start_date": "2024-01-01",
+                "version": 3, "site": "Madrid",
+                "maintenance_tasks": {
+                    "filter": {"last_date": "2024-03-01", "usage_count": 12.5, "history_id": 9},
+                    "descale": {"last_date": None, "usage_count": 7},
+                }
+            },
+            {
+                "id": "a2", "name": "Molino", "machine_type": "grinder", "start_date": None,
+                "maintenance_tasks": {
+                    "cleaning": {"last_date": "2024-02-02"},
+                    "custom": {"name": "Juntas", "has_usage": False, "threshold_days": 30, "last_date": None},
+                }
+            },
+            {
+                "id": "a3", "name": 123, "machine_type": "coffee_machine", "start_date": "2023-05-05",
+                "version": 2 ** 40,
+                "maintenance_tasks": {
+                    "filter": {"last_date": 20240101, "usage_count": 2 ** 60, "history_id": "x"},
+                    "descale": {"name": "Descal. especial", "usage_count": 0.0},
+                }
+            },
+            {"id": "a4", "name": "Vacía", "machine_type": "coffee_machine", "start_date": "2024-06-01",
+             "maintenance_tasks": {}},
+        ]
+    }
+
+
+class SnapshotFormatTest(unittest.TestCase):
+    def test_binary_round_trip(self):
+        data = sample_data()
+        raw = snapshot_format.dumps(data, "binary")
+        self.assertEqual(raw[:4], snapshot_format.MAGIC)
+        self.assertEqual(snapshot_format.loads(raw), data)
+
+    def test_json_round_trip(self):
+        data = sample_data()
+        raw = snapshot_format.dumps(data, "json")
+        self.assertEqual(json.loads(raw)["schema_version"], snapshot_format.SCHEMA_VERSION)
+        self.assertEqual(snapshot_format.loads(raw), data)
+
+    def test_binary_keeps_int_and_float_usage(self):
+        loaded = snapshot_format.loads(snapshot_format.dumps(sample_data(), "binary"))
+        tasks = loaded["machines"][0]["maintenance_tasks"]
+        self.assertIs(type(tasks["filter"]["usage_count"]), float)
+        self.assertIs(type(tasks["descale"]["usage_count"]), int)
+
+    def test_empty_fleet(self):
+        for snapshot_format_name in ("json", "binary"):
+            raw = snapshot_format.dumps({"machines": []}, snapshot_format_name)
+            self.assertEqual(snapshot_format.loads(raw), {"machines": []})
+
+    def test_reads_binary_v2_without_versions(self):
+        # La versión 2 del esquema no tenía la columna de versión de las máquinas.
+        data = sample_data()
+        for machine in data["machines"]:
+            machine.pop("version", None)
+        raw = bytearray(snapshot_format.dumps(data, "binary"))
+        count = struct.Struct('<I')
+        meta_len = struct.unpack_from('<4sHI', raw)[2]
+        pos = 10 + meta_len
+        for _ in range(2):  # cadenas y definiciones
+            pos += count.size + count.unpack_from(raw, pos)[0]
+        machines = count.unpack_from(raw, pos)[0]
+        pos += count.size + 5 * 4 * machines
+        del raw[pos:pos + 4 * machines]
+        struct.pack_into('<H', raw, 4, 2)
+
+        self.assertEqual(snapshot_format.loads(bytes(raw)), data)
+
+    def test_migrates_json_v1_task_definitions(self):
+        # En la versión 1 cada tarea llevaba su definición completa.
+        v1 = {
+            "machines": [{
+                "id": "a1", "name": "Barra", "machine_type": "coffee_machine", "start_date": "2024-01-01",
+                "maintenance_tasks": {
+                    "filter": {"name": "Cambio de Filtro", "has_usage": True, "threshold_days": 90,
+                               "threshold_usage": 40, "last_date": None, "usage_count": 3},
+                    "descale": {"name": "Descalcificación", "has_usage": True, "threshold_days": 60,
+                                "threshold_usage": 300, "last_date": None, "usage_count": 0},
+                }
+            }]
+        }
+        data = snapshot_format.loads(json.dumps(v1).encode('utf-8'))
+        self.assertEqual(data["machines"][0]["maintenance_tasks"], {
+            "filter": {"last_date": None, "usage_count": 3},
+            "descale": {"threshold_days": 60, "last_date": None, "usage_count": 0},
+        })
+
+    def test_rejects_newer_schema(self):
+        raw = json.dumps({"machines": [], "schema_version": snapshot_format.SCHEMA_VERSION + 1}).encode('utf-8')
+        with self.assertRaises(ValueError):
+            snapshot_format.loads(raw)
+        raw = bytearray(snapshot_format.dumps({"machines": []}, "binary"))
+        struct.pack_into('<H', raw, 4, snapshot_format.SCHEMA_VERSION + 1)
+        with self.assertRaises(ValueError):
+            snapshot_format.loads(bytes(raw))
+
+
+class BinarySnapshotBackendTest(unittest.TestCase):
+    # El backend JSON con snapshot binario: el journal se reproduce encima y
+    # al compactar el snapshot sigue siendo binario.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp, "machines_data.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def new_backend(self):
+        return JsonBackend(self.data_file, os.path.join(self.tmp, "machines_data.journal"),
+                           journal_enabled=True, snapshot_format="binary")
+
+    def test_journal_replayed_over_binary_snapshot(self):
+        data = sample_data()
+        backend = self.new_backend()
+        backend.save_data(data)
+        backend.record_events([{"op": "usage", "machine_id": "a1", "task_id": "filter", "quantity": 2.5}])
+
+        loaded = self.new_backend().load_data()
+        self.assertEqual(loaded["machines"][0]["maintenance_tasks"]["filter"]["usage_count"], 15.0)
+
+        backend = self.new_backend()
+        loaded = backend.load_data()
+        self.assertTrue(backend.compact(loaded, 0))
+        with open(self.data_file, 'rb') as f:
+            self.assertEqual(f.read(4), snapshot_format.MAGIC)
+        self.assertEqual(self.new_backend().load_data(), loaded)
@@ -0,0 +1,136 @@
+# tests/test_sqlite_backend.py
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from sqlite_backend import SQLiteBackend, migrate_json_to_sqlite
+from usage_history import UsageHistory
+
+
+class SQLiteBackendTest(unittest.TestCase):
+    # Migración desde JSON y desde esquemas antiguos, y varias estaciones
+    # escribiendo a la vez en la misma base de datos.
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp, "machines_data.db")
+        self.backends = []
+        self.histories = []
+
+    def tearDown(self):
+        for history in self.histories:
+            history.close()
+        for backend in self.backends:
+            backend.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def sqlite(self):
+        backend = SQLiteBackend(self.db_file)
+        self.backends.append(backend)
+        return backend
+
+    def fleet(self, data):
+        history = UsageHistory(self.path("history.bin"))
+        self.histories.append(history)
+        return Fleet(data["machines"], history=history, removed=data.get("removed"))
+
+    def records(self, data):
+        fleet = self.fleet(data)
+        return json.loads(json.dumps(sorted(fleet.to_records(), key=lambda r: r["id"])))
+
+    def test_migrate_json_with_journal(self):
+        json_file, journal_file = self.path("machines_data.json"), self.path("machines_data.journal")
+        DataManager.backend = JsonBackend(json_file, journal_file, journal_enabled=True)
+        DataManager.save_data({"machines": []})
+        fleet = self.fleet(DataManager.load_data())
+        for i in range(3):
+            fleet.add_machine(Machine(f"M{i}", "coffee_machine", "2024-01-01"))
+        keys = fleet.keys()
+        fleet.register_usage(keys[0], "filter", 12.5)
+        fleet.register_maintenance(keys[1], "descale")
+        fleet.remove_machine(keys[2])
+        # Los cambios aún están solo en el journal.
+        self.assertTrue(os.path.getsize(journal_file))
+
+        self.assertEqual(migrate_json_to_sqlite(json_file, self.db_file, journal_file), 2)
+        data = self.sqlite().load_data()
+        self.assertEqual(self.records(data), json.loads(json.dumps(sorted(fleet.to_records(), key=lambda r: r["id"]))))
+        self.assertEqual([entry["id"] for entry in data["removed"]], [keys[2]])
+
+    def test_schema_of_older_versions(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.executescript("""
+            CREATE TABLE machines (id INTEGER PRIMARY KEY AUTOINCREMENT, position INTEGER NOT NULL,
+                                   name TEXT NOT NULL, machine_type TEXT, start_date TEXT);
+            CREATE TABLE maintenance_tasks (machine_id INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+                                            task_id TEXT NOT NULL, name TEXT, has_usage INTEGER NOT NULL DEFAULT 0,
+                                            threshold_days INTEGER, threshold_usage REAL, last_date TEXT,
+                                            usage_count REAL, PRIMARY KEY (machine_id, task_id));
+            INSERT INTO machines (position, name, machine_type, start_date) VALUES (0, 'Vieja', 'grinder', '2020-01-01');
+            INSERT INTO maintenance_tasks VALUES (1, 'cleaning', 'Limpieza', 0, 30, NULL, '2020-02-01', NULL);
+        """)
+        conn.close()
+
+        machines = self.sqlite().load_data()["machines"]
+        self.assertEqual(len(machines), 1)
+        self.assertEqual(machines[0]["name"], "Vieja")
+        self.assertEqual(machines[0]["maintenance_tasks"]["cleaning"]["last_date"], "2020-02-01")
+        # El id asignado al migrar se conserva al volver a abrir.
+        self.assertTrue(machines[0]["id"])
+        self.assertEqual(self.sqlite().load_data()["machines"][0]["id"], machines[0]["id"])
+
+    def test_old_events_by_position_skip_gaps(self):
+        backend = self.sqlite()
+        machines = [Machine(f"M{i}", "coffee_machine", "2024-01-01") for i in range(3)]
+        backend.record_events([{"op": "add_machine", "machine": machine.to_dict()} for machine in machines])
+        backend.record_events([{"op": "remove_machine", "machine_id": machines[1].machine_id}])
+        # Eventos anteriores a los ids: el índice es la posición en la lista actual.
+        backend.record_events([{"op": "usage", "machine_idx": 1, "task_id": "filter", "quantity": 2}])
+        usage = {machine["name"]: machine["maintenance_tasks"]["filter"]["usage_count"]
+                 for machine in backend.load_data()["machines"]}
+        self.assertEqual(usage, {"M0": 0, "M2": 2})
+
+    def test_concurrent_stations(self):
+        machine = Machine("Compartida", "coffee_machine", "2024-01-01")
+        self.sqlite().record_events([{"op": "add_machine", "machine": machine.to_dict()}])
+        stations = [self.sqlite(), self.sqlite()]
+        for station in stations:
+            station.load_data()
+        errors = []
+
+        def register(station):
+            try:
+                for _ in range(50):
+                    station.record_events([{"op": "usage", "machine_id": machine.machine_id,
+                                            "task_id": "filter", "quantity": 1}])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=register, args=(station,)) for station in stations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        data = self.sqlite().load_data()
+        self.assertEqual(data["machines"][0]["maintenance_tasks"]["filter"]["usage_count"], 100)
+        # Cada estación recibe exactamente los cambios de la otra.
+        for station in stations:
+            incoming, appended = station.poll_changes()
+            self.assertEqual(appended, 50)
+            self.assertEqual(sum(len(payload) for _, kind, payload in incoming if kind == "events"), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+# tests/test_sync.py
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from sqlite_backend import SQLiteBackend
+from usage_history import UsageHistory
+
+
+class HeldWriter:
+    # Como PersistenceWorker, pero los cambios se quedan sin escribir hasta
+    # que la prueba llama a write: son los cambios propios sin confirmar.
+    def __init__(self):
+        self.events = []
+
+    def submit_events(self, events, history=None, rows=None):
+        self.events.extend(events)
+
+    def snapshot_pending(self):
+        return False
+
+    def write(self):
+        events, self.events = self.events, []
+        DataManager.record_events(events)
+
+
+class SyncTest(unittest.TestCase):
+    # Dos estaciones sobre los mismos ficheros. Cada una tiene su backend y
+    # DataManager usa el de la estación que actúa (ver at).
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.backends = {}
+        self.fleets = {}
+        self.open_station("a")
+        DataManager.save_data({"machines": []})
+        fleet = self.open_station("a")
+        for name in ("M1", "M2"):
+            fleet.add_machine(Machine(name, "coffee_machine", "2024-01-01"))
+        self.keys = fleet.keys()
+        self.open_station("b")
+
+    def tearDown(self):
+        for fleet in self.fleets.values():
+            fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def new_backend(self):
+        return JsonBackend(os.path.join(self.tmp, "machines_data.json"),
+                           os.path.join(self.tmp, "machines_data.journal"), journal_enabled=True)
+
+    def open_station(self, name):
+        DataManager.backend = self.backends[name] = self.new_backend()
+        data = DataManager.load_data()
+        self.fleets[name] = Fleet(data["machines"], history=UsageHistory(os.path.join(self.tmp, "history.bin")),
+                                  removed=data.get("removed"))
+        return self.fleets[name]
+
+    def at(self, name):
+        DataManager.backend = self.backends[name]
+        return self.fleets[name]
+
+    def hold_writes(self, name):
+        writer = self.fleets[name].writer = HeldWriter()
+        return writer
+
+    def usage(self, name, index=0):
+        return self.at(name).task_record(self.keys[index], "filter")["usage_count"]
+
+    def assertCompacted(self, name):
+        self.assertFalse(os.path.exists(self.backends[name].journal_file))
+
+    def assertConverged(self):
+        # Ambas estaciones y una carga desde cero ven lo mismo.
+        self.at("a").sync()
+        self.at("b").sync()
+        self.open_station("fresh")
+
+        def records(name):
+            return json.loads(json.dumps(sorted(self.fleets[name].to_records(), key=lambda r: r["id"])))
+        self.assertEqual(records("a"), records("fresh"))
+        self.assertEqual(records("b"), records("fresh"))
+
+    def test_usage_from_both_stations_adds_up(self):
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("b").register_usage(self.keys[0], "filter", 3)
+        # Al escribir, b incorporó el cambio de a.
+        self.assertEqual(self.usage("b"), 8)
+        self.assertEqual(self.usage("a"), 5)
+        self.assertEqual(self.at("a").sync(), {self.keys[0]})
+        self.assertEqual(self.usage("a"), 8)
+        self.assertConverged()
+
+    def test_pending_usage_is_reapplied_over_remote_usage(self):
+        writer = self.hold_writes("a")
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("b").register_usage(self.keys[0], "filter", 3)
+
+        self.at("a").sync()
+        self.assertEqual(self.usage("a"), 8)
+        writer.write()
+        self.assertConverged()
+        self.assertEqual(self.usage("fresh"), 8)
+
+    def test_pending_usage_after_remote_maintenance(self):
+        # El mantenimiento ajeno llegó antes al journal: pone el contador a
+        # cero y el uso propio, que se escribe después, queda encima.
+        writer = self.hold_writes("a")
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("b").register_usage(self.keys[0], "filter", 3)
+        self.at("b").register_maintenance(self.keys[0], "filter")
+
+        self.at("a").sync()
+        self.assertEqual(self.usage("a"), 5)
+        self.assertEqual(self.at("a").task_record(self.keys[0], "filter")["last_date"], date.today().isoformat())
+        writer.write()
+        self.assertConverged()
+        self.assertEqual(self.usage("fresh"), 5)
+
+    def test_pending_changes_on_machine_removed_remotely(self):
+        writer = self.hold_writes("a")
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("a").register_usage(self.keys[1], "filter", 2)
+        self.at("b").remove_machine(self.keys[0])
+
+        self.at("a").sync()
+        self.assertNotIn(self.keys[0], self.at("a"))
+        writer.write()
+        self.assertConverged()
+        self.assertEqual(self.fleets["fresh"].keys(), [self.keys[1]])
+        self.assertEqual(self.usage("fresh", 1), 2)
+
+    def test_pending_usage_survives_remote_compaction(self):
+        writer = self.hold_writes("a")
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("b").register_usage(self.keys[0], "filter", 3)
+        self.at("b").save()
+        self.assertCompacted("b")
+
+        # a recarga el snapshot nuevo y vuelve a aplicar su cambio encima.
+        self.at("a").sync()
+        self.assertEqual(self.usage("a"), 8)
+        writer.write()
+        self.assertConverged()
+        self.assertEqual(self.usage("fresh"), 8)
+
+    def test_save_keeps_remote_changes_not_yet_synced(self):
+        # a guarda el estado completo sin haber visto el cambio de b: no debe
+        # borrarlo.
+        self.at("a").register_usage(self.keys[0], "filter", 5)
+        self.at("b").register_usage(self.keys[0], "filter", 3)
+        self.at("a").save()
+        self.assertConverged()
+        self.assertEqual(self.usage("fresh"), 8)
+
+
+class SQLiteSyncTest(SyncTest):
+    # Las mismas situaciones con SQLite, que escribe cada cambio en sus filas
+    # y no tiene nada que compactar.
+    def tearDown(self):
+        for backend in self.backends.values():
+            backend.close()
+        super().tearDown()
+
+    def new_backend(self):
+        return SQLiteBackend(os.path.join(self.tmp, "machines_data.db"))
+
+    def assertCompacted(self, name):
+        pass
@@ -0,0 +1,157 @@
+# tests/test_usage_import.py
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import usage_import
+from data_manager import DataManager, JsonBackend
+from fleet import Fleet
+from machine import Machine
+from usage_history import UsageHistory
+from usage_import import import_usage
+
+
+class FailingBackend(JsonBackend):
+    # Deja escribir `fail_after` lotes y falla en el siguiente (None: nunca).
+    fail_after = None
+
+    def record_events(self, events):
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise OSError("Disco lleno")
+            self.fail_after -= 1
+        super().record_events(events)
+
+
+class UsageImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp, "machines_data.json")
+        self.journal_file = os.path.join(self.tmp, "machines_data.journal")
+        self.history_file = os.path.join(self.tmp, "history.bin")
+        DataManager.backend = self.new_backend()
+        DataManager.save_data({"machines": []})
+        self.fleet = Fleet([], history=UsageHistory(self.history_file))
+        for name, machine_type in [("Cafe1", "coffee_machine"), ("Cafe2", "coffee_machine"),
+                                   ("Molino", "grinder"), ("Doble", "grinder"), ("Doble", "grinder")]:
+            self.fleet.add_machine(Machine(name, machine_type, "2024-01-01"))
+        self.cafe1 = self.fleet.keys_by_name("Cafe1")[0]
+        self.cafe2 = self.fleet.keys_by_name("Cafe2")[0]
+
+    def tearDown(self):
+        self.fleet.history.close()
+        DataManager.backend = None
+        shutil.rmtree(self.tmp)
+
+    def new_backend(self):
+        return FailingBackend(self.data_file, self.journal_file, journal_enabled=True)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def csv_file(self, rows):
+        lines = ["machine,task_id,liters,timestamp"]
+        lines += [",".join(str(value) for value in row) for row in rows]
+        return self.write("usage.csv", "\n".join(lines) + "\n")
+
+    def usage(self, fleet, key):
+        return fleet.task_record(key, "filter")["usage_count"]
+
+    def test_invalid_rows_are_rejected_with_their_line(self):
+        self.fleet.register_maintenance(self.cafe2, "filter")
+        today = date.today().isoformat()
+        path = self.csv_file([
+            ("Cafe1", "filter", 2.5, "2024-05-01T10:00:00"),
+            ("Nadie", "filter", 1, "2024-05-01T10:00:00"),
+            ("Doble", "cleaning", 1, "2024-05-01T10:00:00"),
+            ("Cafe1", "grifo", 1, "2024-05-01T10:00:00"),
+            ("Molino", "cleaning", 1, "2024-05-01T10:00:00"),
+            ("Cafe1", "filter", "mucho", "2024-05-01T10:00:00"),
+            ("Cafe1", "filter", -1, "2024-05-01T10:00:00"),
+            ("Cafe1", "filter", "nan", "2024-05-01T10:00:00"),
+            ("Cafe1", "filter", 1, "ayer"),
+            ("Cafe2", "filter", 4, "2000-01-01T00:00:00"),
+            ("Cafe2", "filter", 3, f"{today}T23:59:00"),
+            ("Cafe1", "filter", 1.5, "2024-05-02T10:00:00")
+        ])
+        report = import_usage(self.fleet, path)
+
+        self.assertEqual((report.rows, report.accepted, report.rejected), (12, 3, 9))
+        self.assertEqual(report.rejected_samples, [
+            (3, "Máquina desconocida"),
+            (4, "Nombre de máquina ambiguo"),
+            (5, "Tarea desconocida"),
+            (6, "La tarea no usa contador"),
+            (7, "La cantidad debe ser un número."),
+            (8, "Cantidad no válida"),
+            (9, "Cantidad no válida"),
+            (10, "Fecha no válida"),
+            (11, "Anterior al último mantenimiento")
+        ])
+        self.assertIsNone(report.error)
+        self.assertEqual(sorted(report.applied), sorted([(self.cafe1, "filter", 4.0), (self.cafe2, "filter", 3.0)]))
+        self.assertEqual(self.usage(self.fleet, self.cafe1), 4.0)
+        self.assertEqual(self.usage(self.fleet, self.cafe2), 3.0)
+        # Cada evento queda en el historial con su propia fecha.
+        series = self.fleet.task_series(self.cafe1, "filter")
+        self.assertEqual(len(series), 2)
+        self.assertEqual(series.usage_since(0), 4.0)
+        self.assertEqual(series.usage_since(series.timestamps[1]), 1.5)
+
+    def test_jsonl_with_broken_lines(self):
+        path = self.write("usage.jsonl", "\n".join([
+            '{"machine": "Cafe1", "task_id": "filter", "liters": 2, "timestamp": "2024-05-01T10:00:00"}',
+            '{"machine": "Cafe1", "task_id": ',
+            "",
+            '["Cafe1", "filter", 2]',
+            '{"machine": "Cafe1", "task_id": "descale", "liters": 7, "timestamp": "2024-05-01"}'
+        ]) + "\n")
+        report = import_usage(self.fleet, path)
+
+        self.assertEqual((report.rows, report.accepted), (4, 2))
+        self.assertEqual(report.rejected_samples, [(2, "Línea no válida"), (4, "Línea no válida")])
+        self.assertEqual(self.fleet.task_record(self.cafe1, "descale")["usage_count"], 7.0)
+
+    def test_changes_are_saved_and_reloaded(self):
+        path = self.csv_file([("Cafe1", "filter", 1, f"2024-05-0{day}T10:00:00") for day in range(1, 6)])
+        with mock.patch.object(usage_import, "CHUNK_ROWS", 2):
+            report = import_usage(self.fleet, path)
+        self.assertIsNone(report.error)
+        self.assertEqual(report.applied, [(self.cafe1, "filter", 5.0)])
+
+        self.fleet.history.close()
+        DataManager.backend = self.new_backend()
+        self.fleet = Fleet(DataManager.load_data()["machines"], history=UsageHistory(self.history_file))
+        self.assertEqual(self.usage(self.fleet, self.cafe1), 5.0)
+        self.assertEqual(len(self.fleet.task_series(self.cafe1, "filter")), 5)
+
+    def test_failed_chunk_reports_what_was_applied(self):
+        path = self.csv_file([("Cafe1", "filter", 1, f"2024-05-0{day}T10:00:00") for day in range(1, 8)])
+        DataManager.backend.fail_after = 1
+        with mock.patch.object(usage_import, "CHUNK_ROWS", 2):
+            report = import_usage(self.fleet, path)
+
+        # El primer tramo (líneas 2 y 3) se guardó; el segundo falló y no se
+        # siguió leyendo.
+        self.assertEqual(report.error, "Disco lleno")
+        self.assertEqual(report.applied_line, 3)
+        self.assertEqual(report.rows, 4)
+        self.assertEqual(report.applied, [(self.cafe1, "filter", 2.0)])
+        self.assertIn("Se aplicó hasta la línea 3", report.summary())
+
+        # En disco queda exactamente el primer tramo, con su historial.
+        self.fleet.history.close()
+        DataManager.backend = self.new_backend()
+        self.fleet = Fleet(DataManager.load_data()["machines"], history=UsageHistory(self.history_file))
+        self.assertEqual(self.usage(self.fleet, self.cafe1), 2.0)
+        self.assertEqual(self.fleet.task_series(self.cafe1, "filter").usage_since(0), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,270 @@
+# usage_history.py
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import accumulate
+from config import HISTORY_FILE
+from file_lock import FileLock
+
+# Fichero auxiliar binario: cabecera fija y después registros de 4 doubles
+# little-endian (history_id, timestamp, tipo, cantidad). Añadir un evento es
+# escribir 32 bytes al final; nunca se reescribe lo anterior. Si varias
+# estaciones comparten el fichero, escriben con el fichero .lock bloqueado.
+MAGIC = b'CMHS'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')  # magic, versión, siguiente history_id
+RECORD = struct.Struct('<dddd')
+
+KIND_USAGE = 0
+KIND_MAINTENANCE = 1
+# history_id que se reservan de una vez en la cabecera (ver reserve_ids).
+ID_BLOCK = 256
+
+
+class TaskSeries:
+    # Serie temporal de una tarea en columnas compactas.
+    def __init__(self):
+        self.timestamps = array('d')
+        self.kinds = array('b')
+        self.quantities = array('d')
+        # Para usage_since: timestamps de los usos en orden y litros acumulados
+        # hasta cada uno. Se mantienen al añadir mientras llegan en orden; si
+        # llega uno anterior (p. ej. importado) se rehacen en la siguiente consulta.
+        self._usage_times = array('d')
+        self._usage_totals = array('d')
+        self._usage_sorted = True
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, kind, quantity):
+        self.timestamps.append(timestamp)
+        self.kinds.append(kind)
+        self.quantities.append(quantity)
+        if kind != KIND_USAGE or not self._usage_sorted:
+            return
+        if self._usage_times and timestamp < self._usage_times[-1]:
+            self._usage_sorted = False
+            return
+        self._usage_times.append(timestamp)
+        self._usage_totals.append((self._usage_totals[-1] if self._usage_totals else 0.0) + quantity)
+
+    def usage_since(self, cutoff):
+        # Litros de uso con timestamp >= cutoff: una búsqueda binaria y una resta.
+        if not self._usage_sorted:
+            self._sort_usage()
+        i = bisect_left(self._usage_times, cutoff)
+        if i == len(self._usage_times):
+            return 0.0
+        return self._usage_totals[-1] - (self._usage_totals[i - 1] if i else 0.0)
+
+    def usage_since_maintenance(self):
+        # Valor del que usage_count es la caché: litros desde el último mantenimiento.
+        total = 0.0
+        for i in range(len(self) - 1, -1, -1):
+            if self.kinds[i] == KIND_MAINTENANCE:
+                break
+            total += self.quantities[i]
+        return total
+
+    def _sort_usage(self):
+        usages = sorted(
+            (timestamp, quantity)
+            for timestamp, kind, quantity in zip(self.timestamps, self.kinds, self.quantities)
+            if kind == KIND_USAGE
+        )
+        self._usage_times = array('d', (timestamp for timestamp, _ in usages))
+        self._usage_totals = array('d', accumulate(quantity for _, quantity in usages))
+        self._usage_sorted = True
+
+
+class UsageHistory:
+    # Las series solo se leen (con mmap) la primera vez que se piden; cargar
+    # la flota no toca este fichero.
+    #
+    # Las escrituras (write) pueden hacerse desde el hilo de escritura: lo que
+    # depende de ellas (avisos y series ya leídas) se pone al día en poll,
+    # desde el hilo que usa la flota.
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._file = None
+        self._series = None
+        self._size = 0  # bytes que refleja _series
+        self._lock = FileLock(path + '.lock')
+        # listener(inicio, filas) tras cada escritura propia: filas
+        # (history_id, timestamp, tipo, cantidad) y el byte del fichero en que empiezan.
+        self._listeners = []
+        self._state_lock = threading.Lock()  # protege _ids y _written
+        self._ids = deque()  # history_id reservados sin usar
+        self._written = []  # (inicio, filas) escritas aún sin avisar
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def new_history_id(self):
+        # Sale de los ids ya reservados; solo se espera al fichero si no queda ninguno.
+        with self._state_lock:
+            if self._ids:
+                return self._ids.popleft()
+        ids = self._take_ids(ID_BLOCK)
+        with self._state_lock:
+            self._ids.extend(ids)
+            return self._ids.popleft()
+
+    def reserve_ids(self, count=ID_BLOCK):
+        # Reserva ids por adelantado si quedan pocos. Se llama fuera del hilo
+        # de Tk (al cargar y tras cada escritura del historial) para que
+        # new_history_id no tenga que bloquear el fichero.
+        with self._state_lock:
+            if len(self._ids) >= count // 2:
+                return
+        ids = self._take_ids(count)
+        with self._state_lock:
+            self._ids.extend(ids)
+
+    def append(self, history_id, kind, quantity, timestamp=None):
+        self.append_many([(history_id, kind, quantity, timestamp)])
+
+    def append_many(self, records):
+        # records: (history_id, tipo, cantidad, timestamp o None para ahora).
+        self.write(history_rows(records))
+        self.poll()
+
+    def write(self, rows):
+        # Añade al final del fichero las filas de history_rows. Los avisos se
+        # dan en el siguiente poll.
+        if not rows:
+            return
+        data = rows
+        if sys.byteorder == 'big':
+            data = array('d', rows)
+            data.byteswap()
+        with self._lock:
+            f = self._open()
+            end = f.seek(0, os.SEEK_END)
+            torn = (end - HEADER.size) % RECORD.size
+            if torn:
+                # Registro a medias de una escritura cortada.
+                end -= torn
+                f.truncate(end)
+                f.seek(end)
+            f.write(data.tobytes())
+            f.flush()
+        with self._state_lock:
+            self._written.append((end, rows))
+
+    def poll(self):
+        # Avisa de lo escrito desde el último poll y lo añade a las series ya leídas.
+        with self._state_lock:
+            written, self._written = self._written, []
+        for start, rows in written:
+            records = list(zip(rows[0::4], rows[1::4], rows[2::4], rows[3::4]))
+            end = start + len(records) * RECORD.size
+            for listener in self._listeners:
+                listener(start, records)
+            if self._series is None or end <= self._size:
+                continue
+            if start != self._size:
+                # Otra estación añadió eventos: las series se releen cuando se pidan.
+                self._series = None
+                continue
+            for history_id, timestamp, kind, quantity in records:
+                self._series.setdefault(int(history_id), TaskSeries()).append(timestamp, int(kind), quantity)
+            self._size = end
+
+    def series(self, history_id):
+        self.poll()
+        if self._series is None:
+            self._load()
+        return self._series.get(history_id) or TaskSeries()
+
+    def read_records(self, start=HEADER.size, chunk=65536):
+        # Recorre el historial desde el byte `start` sin cargar las series:
+        # listas de hasta `chunk` filas (history_id, timestamp, tipo, cantidad).
+        # Un registro a medias al final se ignora.
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            while True:
+                data = f.read(chunk * RECORD.size)
+                count = len(data) // RECORD.size
+                if not count:
+                    return
+                values = array('d')
+                values.frombytes(data[:count * RECORD.size])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                yield list(zip(values[0::4], values[1::4], values[2::4], values[3::4]))
+                if count < chunk:
+                    return
+
+    def usage_since_maintenance(self, history_id):
+        return self.series(history_id).usage_since_maintenance()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _take_ids(self, count):
+        with self._lock:
+            f = self._open()
+            # La cabecera se relee: otra estación puede haber asignado ids.
+            f.seek(0)
+            next_id = HEADER.unpack(f.read(HEADER.size))[2]
+            # Solo se reescribe la cabecera, en su sitio.
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, next_id + count))
+            f.flush()
+        return range(next_id, next_id + count)
+
+    def _open(self):
+        # Se llama con el fichero .lock bloqueado.
+        if self._file is None:
+            if not os.path.exists(self.path):
+                with open(self.path, 'wb') as f:
+                    f.write(HEADER.pack(MAGIC, VERSION, 1))
+            self._file = open(self.path, 'r+b')
+            magic = HEADER.unpack(self._file.read(HEADER.size))[0]
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} no es un fichero de historial válido.")
+        return self._file
+
+    def _load(self):
+        self._series = {}
+        self._size = HEADER.size
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= HEADER.size:
+            return
+        values = array('d')
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Un registro a medias (corte durante la escritura) se ignora.
+                count = (len(mm) - HEADER.size) // RECORD.size
+                values.frombytes(mm[HEADER.size:HEADER.size + count * RECORD.size])
+        self._size = HEADER.size + count * RECORD.size
+        if sys.byteorder == 'big':
+            values.byteswap()
+        ids, timestamps, kinds, quantities = values[0::4], values[1::4], values[2::4], values[3::4]
+        for history_id, timestamp, kind, quantity in zip(ids, timestamps, kinds, quantities):
+            history_id = int(history_id)
+            series = self._series.get(history_id)
+            if series is None:
+                series = self._series[history_id] = TaskSeries()
+            series.append(timestamp, int(kind), quantity)
+
+
+def history_rows(records):
+    # Filas para UsageHistory.write a partir de (history_id, tipo, cantidad,
+    # timestamp o None para ahora), seguidas en un array('d') como en el fichero.
+    now = time.time()
+    rows = array('d')
+    for history_id, kind, quantity, timestamp in records:
+        rows.extend((history_id, now if timestamp is None else timestamp, kind, quantity))
+    return rows
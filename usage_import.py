@@ -0,0 +1,219 @@
+# usage_import.py
+import csv
+import json
+import math
+import os
+from array import array
+from datetime import datetime
+from usage_history import KIND_USAGE
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se suma en Python puro.
+    np = None
+
+# Filas aceptadas que se aplican de una vez (totales, journal e historial);
+# acota la memoria con ficheros enormes.
+CHUNK_ROWS = 100000
+# Rechazos que se guardan con detalle (el resto solo se cuentan).
+MAX_REJECTED_SAMPLES = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.rejected_samples = []  # (línea, motivo)
+        self.applied = []  # (clave de la máquina, task_id, litros)
+        # Si falla al guardar un tramo, el motivo y la última línea del
+        # fichero que quedó aplicada (lo anterior a ella está guardado).
+        self.error = None
+        self.applied_line = 0
+
+    def reject(self, line_no, reason):
+        self.rejected += 1
+        if len(self.rejected_samples) < MAX_REJECTED_SAMPLES:
+            self.rejected_samples.append((line_no, reason))
+
+    def summary(self):
+        text = (f"Filas leídas: {self.rows}\n"
+                f"Aceptadas: {self.accepted}\n"
+                f"Rechazadas: {self.rejected}\n"
+                f"Tareas actualizadas: {len(self.applied)}")
+        for line_no, reason in self.rejected_samples[:10]:
+            text += f"\n  Línea {line_no}: {reason}"
+        if self.rejected > 10:
+            text += f"\n  ... y {self.rejected - 10} más"
+        if self.error is not None:
+            text += (f"\nError al guardar: {self.error}\n"
+                     f"Se aplicó hasta la línea {self.applied_line}; el resto del fichero no.")
+        return text
+
+
+def read_events(path):
+    # Genera (número de línea, fila) leyendo el fichero en streaming.
+    # Formatos: CSV con cabecera o JSONL, ambos con las claves
+    # machine, task_id, liters y timestamp.
+    is_jsonl = os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson')
+    with open(path, newline='', encoding='utf-8') as f:
+        if is_jsonl:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError:
+                    yield line_no, None
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+class _GroupResolver:
+    # Asigna un código entero a cada (máquina, tarea) válida, resolviendo
+    # cada par una sola vez.
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.codes = {}  # (nombre, task_id) -> código o motivo de rechazo
+        self.groups = []  # código -> (clave de la máquina, task_id)
+        self.cutoffs = []  # código -> last_date de la tarea
+        self.history_ids = []  # código -> serie de la tarea en el historial
+
+    def resolve(self, name, task_id):
+        code = self.codes.get((name, task_id))
+        if code is None:
+            code = self._resolve_new(name, task_id)
+            self.codes[(name, task_id)] = code
+        return code
+
+    def _resolve_new(self, name, task_id):
+        keys = self.fleet.keys_by_name(name)
+        if not keys:
+            return "Máquina desconocida"
+        if len(keys) > 1:
+            return "Nombre de máquina ambiguo"
+        task = self.fleet.task_record(keys[0], task_id)
+        if task is None:
+            return "Tarea desconocida"
+        if not task.get("has_usage"):
+            return "La tarea no usa contador"
+        self.groups.append((keys[0], task_id))
+        self.cutoffs.append(task.get("last_date"))
+        self.history_ids.append(self.fleet.history_id_for(keys[0], task_id))
+        return len(self.groups) - 1
+
+
+def _accumulate(totals, codes, liters, n_groups):
+    # Suma por grupo de un bloque de filas.
+    if np is not None:
+        chunk = np.bincount(
+            np.asarray(codes, dtype=np.intp),
+            weights=np.asarray(liters, dtype=np.float64),
+            minlength=n_groups
+        )
+        if len(totals) < n_groups:
+            totals = np.concatenate([totals, np.zeros(n_groups - len(totals))])
+        return totals + chunk
+    totals.extend([0.0] * (n_groups - len(totals)))
+    for code, qty in zip(codes, liters):
+        totals[code] += qty
+    return totals
+
+
+def import_usage(fleet, path):
+    # Importa eventos de uso, los suma por máquina/tarea y aplica los totales
+    # con la semántica de MaintenanceTask.register_usage. Se aplica por tramos
+    # de CHUNK_ROWS filas aceptadas, cada uno en un único guardado y con su
+    # historial de uso escrito después: si un tramo falla, los anteriores
+    # quedan completos (report.applied_line) y no se sigue leyendo.
+    # Las filas erróneas se rechazan sin abortar la importación.
+    report = ImportReport()
+    resolver = _GroupResolver(fleet)
+    totals = np.zeros(0) if np is not None else []
+    codes, liters = [], []
+    history = array('d')  # filas del historial del tramo (history_rows)
+
+    line_no = 0
+    for line_no, row in read_events(path):
+        report.rows += 1
+        if not isinstance(row, dict):
+            report.reject(line_no, "Línea no válida")
+            continue
+        try:
+            qty = float(row.get("liters"))
+        except (TypeError, ValueError):
+            report.reject(line_no, "La cantidad debe ser un número.")
+            continue
+        if not math.isfinite(qty) or qty < 0:
+            report.reject(line_no, "Cantidad no válida")
+            continue
+        try:
+            timestamp = datetime.fromisoformat(str(row.get("timestamp")))
+        except ValueError:
+            report.reject(line_no, "Fecha no válida")
+            continue
+        code = resolver.resolve(row.get("machine"), row.get("task_id"))
+        if isinstance(code, str):
+            report.reject(line_no, code)
+            continue
+        cutoff = resolver.cutoffs[code]
+        if cutoff and timestamp.date().isoformat() < cutoff:
+            # El uso anterior al último mantenimiento ya se puso a cero.
+            report.reject(line_no, "Anterior al último mantenimiento")
+            continue
+
+        codes.append(code)
+        liters.append(qty)
+        history.extend((resolver.history_ids[code], timestamp.timestamp(), KIND_USAGE, qty))
+        report.accepted += 1
+        if len(codes) >= CHUNK_ROWS:
+            totals = _apply_chunk(fleet, resolver, totals, codes, liters, history, report, line_no)
+            if report.error is not None:
+                break
+            codes, liters, history = [], [], array('d')
+
+    if report.error is None:
+        totals = _apply_chunk(fleet, resolver, totals, codes, liters, history, report, line_no)
+
+    if np is not None:
+        totals = totals.tolist()
+    report.applied = [
+        (key, task_id, total)
+        for (key, task_id), total in zip(resolver.groups, totals)
+        if total > 0
+    ]
+    return report
+
+
+def _apply_chunk(fleet, resolver, totals, codes, liters, history, report, line_no):
+    # Aplica la suma de un tramo, que llega hasta la línea `line_no`, y
+    # devuelve los totales aplicados hasta ahora.
+    n_groups = len(resolver.groups)
+    chunk = _accumulate(np.zeros(0) if np is not None else [], codes, liters, n_groups)
+    if np is not None:
+        chunk = chunk.tolist()
+    items = [(*resolver.groups[code], total) for code, total in enumerate(chunk) if total > 0]
+    unapplied = {resolver.history_ids[code] for code, total in enumerate(chunk) if not total > 0}
+    if unapplied:
+        # Tareas con solo filas de 0 litros: no se actualizan, así que su
+        # serie del historial no llegaría a guardarse con ellas.
+        history = array('d', (
+            value
+            for i in range(0, len(history), 4) if history[i] not in unapplied
+            for value in history[i:i + 4]
+        ))
+    try:
+        fleet.bulk_register_usage(items, history=history)
+    except (OSError, ValueError, KeyError) as e:
+        report.error = str(e)
+        return totals
+    report.applied_line = line_no
+    # Con el hilo de escritura se espera a que el tramo esté en disco antes de
+    # leer el siguiente: así la memoria no crece con el tamaño del fichero. Si
+    # falla, el tramo ya está en la flota y se reintentará como cualquier cambio.
+    if fleet.writer is not None and not fleet.writer.flush():
+        report.error = "No se pudieron escribir los cambios en disco; se reintentará con el próximo cambio."
+    fleet.history.poll()
+    return _accumulate(totals, codes, liters, n_groups)